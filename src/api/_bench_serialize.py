@@ -0,0 +1,67 @@
+# Serialization cost of a /query result: rows via Pydantic vs columnar JSON vs Arrow IPC.
+# Run: python -m src.api._bench_serialize [--rows 10000 100000] [--repeat 5]
+
+import argparse
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from src.api import formats
+from src.api.app import QueryResponse
+
+COLS = ["day", "product", "customer_id", "quantity", "revenue", "avg_price"]
+
+
+def _fake_rows(n: int, seed: int = 0) -> list[list]:
+    rnd = random.Random(seed)
+    return [
+        [f"2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}", f"Item {rnd.randint(1, 500)}",
+         rnd.randint(1, 10_000), rnd.randint(1, 20), round(rnd.random() * 1000, 2), round(rnd.random() * 50, 2)]
+        for _ in range(n)
+    ]
+
+
+def _rows_pydantic(sql, cols, rows):
+    # what FastAPI does for response_model=QueryResponse: validate, jsonable_encoder, json.dumps
+    model = QueryResponse(sql=sql, rows=rows, columns=cols, cache="miss")
+    return json.dumps(jsonable_encoder(model)).encode()
+
+
+def _best_of(fn, repeat: int) -> tuple[float, int]:
+    best, size = float("inf"), 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+        size = len(out)
+    return best * 1000, size
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    sql = "SELECT ... FROM order_items ..."
+    print(f"orjson={'yes' if formats.orjson else 'no'} pyarrow={'yes' if formats.arrow_available() else 'no'}")
+    for n in args.rows:
+        rows = _fake_rows(n)
+        cases = {
+            "rows (pydantic)": lambda: _rows_pydantic(sql, COLS, rows),
+            "columnar json": lambda: formats.encode_columnar(sql, COLS, rows, "miss"),
+        }
+        if formats.arrow_available():
+            cases["arrow ipc"] = lambda: formats.encode_arrow(COLS, rows, sql=sql)
+        print(f"\n{n:,} rows")
+        base = None
+        for name, fn in cases.items():
+            ms, size = _best_of(fn, args.repeat)
+            base = base or ms
+            print(f"  {name:<16} {ms:9.1f} ms  {size / 1e6:7.2f} MB  ({base / ms:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
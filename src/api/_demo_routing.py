@@ -0,0 +1,116 @@
+# Hybrid routing (src/api/routing.py) through POST /query, against src/bench/stub_llm.py with a model-like
+# delay, on a temp copy of the database (no result or LLM cache):
+#   1) LLM_ROUTING=llm vs hybrid over a mix of template-shaped and free-form questions: route and latency
+#   2) a deadline shorter than the stub's delay: the template answer, flagged "fallback" / "deadline"
+#   3) a stub that answers with a table that doesn't exist: "fallback" / "invalid_sql"; one that answers
+#      with a three-way cross join: "fallback" / "too_costly" (src/sql/cost.py)
+#   4) USE_LLM=false: low-confidence questions are flagged "fallback" / "llm_off"
+# then the router counters from /metrics.
+# Run: python -m src.api._demo_routing [--latency-ms 300]
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from src.api.app import app
+from src.bench.stub_llm import StubLLM
+from src.core.config import get_settings
+from src.db.engine import dispose_engines
+
+QUESTIONS = [
+    "top 5 customers by total spend in 2024",
+    "total revenue by product in 2024",
+    "average order value in 2025",
+    "top customers in texas last month",
+    "how many orders did each customer place",
+    "revenue by product and category",
+]
+
+
+def _ask(client: TestClient, questions: list[str]) -> list[tuple[str, dict, float]]:
+    out = []
+    for q in questions:
+        t0 = time.perf_counter()
+        r = client.post("/query", json={"question": q, "limit": 5})
+        ms = (time.perf_counter() - t0) * 1000
+        r.raise_for_status()
+        out.append((q, r.json(), ms))
+    return out
+
+
+def _show(results) -> None:
+    for q, body, ms in results:
+        print(f"  {q:<42} {body['route']:<8} {body['route_reason']:<11} conf {body['confidence']:.2f}  {ms:6.1f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency-ms", type=float, default=300.0, help="stub delay per completion")
+    args = ap.parse_args()
+    settings = get_settings()
+    saved = settings.model_copy()
+    saved_key = os.environ.get("OPENAI_API_KEY")
+    settings.openai_api_key = settings.openai_api_key or "stub"
+    os.environ.setdefault("OPENAI_API_KEY", settings.openai_api_key)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp, TestClient(app) as client:
+            db = str(Path(tmp) / "routing.db")
+            shutil.copyfile(saved.sqlite_path, db)
+            dispose_engines()
+            settings.sqlite_path = db
+            settings.result_cache_max_bytes = 0
+            settings.llm_cache_path = ""
+            settings.slow_query_ms = 0
+            settings.use_llm = True
+
+            with StubLLM(latency_ms=args.latency_ms) as stub:
+                settings.llm_base_url = stub.url
+                for mode in ["llm", "hybrid"]:
+                    settings.llm_routing = mode
+                    before = stub.requests
+                    results = _ask(client, QUESTIONS)
+                    print(f"LLM_ROUTING={mode}: {stub.requests - before} LLM calls, "
+                          f"median {statistics.median(ms for *_, ms in results):.1f} ms")
+                    _show(results)
+
+                settings.llm_deadline_ms = args.latency_ms / 3
+                print(f"LLM_DEADLINE_MS={settings.llm_deadline_ms:g} (stub takes {args.latency_ms:g}):")
+                _show(_ask(client, QUESTIONS[3:4]))
+                settings.llm_deadline_ms = saved.llm_deadline_ms
+                # the cut-off call runs on (holding its LLM slot); let it land before the same question is asked
+                # of the next stub, or that ask joins it instead of making its own call
+                time.sleep(args.latency_ms / 1000)
+
+            with StubLLM(answer=lambda messages: "SELECT * FROM shipments LIMIT 5") as stub:
+                settings.llm_base_url = stub.url
+                print("LLM answers with a table that doesn't exist:")
+                _show(_ask(client, QUESTIONS[3:4]))
+            with StubLLM(answer=lambda messages: "SELECT COUNT(*) FROM customers, products, order_items") as stub:
+                settings.llm_base_url = stub.url
+                print("LLM answers with a cross join:")
+                _show(_ask(client, QUESTIONS[3:4]))
+
+            settings.use_llm = False
+            print("USE_LLM=false:")
+            _show(_ask(client, QUESTIONS))
+
+            print("\n".join(line for line in client.get("/metrics").text.splitlines()
+                            if line.startswith("router_decisions_total")
+                            or line.startswith("route_duration_seconds_count")))
+    finally:
+        dispose_engines()
+        for name, value in saved.model_dump().items():
+            setattr(settings, name, value)
+        if saved_key is None:
+            os.environ.pop("OPENAI_API_KEY", None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Load test for POST /query: N concurrent clients hammering the API, reporting tail latency.
+# By default the app is driven in-process through httpx's ASGI transport; pass --url to hit a running server.
+# Run: python -m src.api._loadtest --clients 200 --requests 20
+#      python -m src.api._loadtest --url http://localhost:8000 --clients 200
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+QUESTIONS = [
+    "top 5 customers by total spend",
+    "total revenue by product in 2024",
+    "average order value",
+    "daily sales in 2024",
+    "orders by customer",
+]
+
+
+def _pct(sorted_vals: list[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    i = min(len(sorted_vals) - 1, int(round(p / 100 * (len(sorted_vals) - 1))))
+    return sorted_vals[i]
+
+
+async def _client(http: httpx.AsyncClient, cid: int, n: int, latencies: list, statuses: Counter):
+    for i in range(n):
+        q = QUESTIONS[(cid + i) % len(QUESTIONS)]
+        t0 = time.perf_counter()
+        try:
+            r = await http.post("/query", json={"question": q, "limit": 10})
+            statuses[r.status_code] += 1
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+
+async def run(url: str | None, clients: int, requests: int) -> dict:
+    if url:
+        transport, base = None, url
+    else:
+        from src.api.app import app
+        transport, base = httpx.ASGITransport(app=app), "http://loadtest"
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    async with httpx.AsyncClient(base_url=base, transport=transport, limits=limits, timeout=60) as http:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_client(http, c, requests, latencies, statuses) for c in range(clients)))
+        wall = time.perf_counter() - t0
+
+    lat = sorted(latencies)
+    return {
+        "clients": clients,
+        "requests": len(lat),
+        "wall_s": round(wall, 3),
+        "rps": round(len(lat) / wall, 1),
+        "p50_ms": round(_pct(lat, 50), 2),
+        "p95_ms": round(_pct(lat, 95), 2),
+        "p99_ms": round(_pct(lat, 99), 2),
+        "max_ms": round(lat[-1], 2) if lat else 0.0,
+        "mean_ms": round(statistics.fmean(lat), 2) if lat else 0.0,
+        "status": dict(statuses),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default=None, help="base URL of a running server (default: in-process app)")
+    ap.add_argument("--clients", type=int, default=200)
+    ap.add_argument("--requests", type=int, default=20, help="requests per client")
+    args = ap.parse_args()
+    print(asyncio.run(run(args.url, args.clients, args.requests)))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,46 +5,366 @@
 # BaseModel and Field → define and validate request/response data shapes.
 # generate_sql() and run_sql_safe() → your core logic.
 
-from fastapi import FastAPI, HTTPException
+import asyncio
+import csv
+import io
+import json
+from contextlib import asynccontextmanager
+from typing import Literal
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
-from src.nlp.pipeline import generate_sql, generate_sql_with_llm
+from src.api import formats, routing, warmup
+from src.api.limits import Saturated, get_limits
+from src.core import telemetry
 from src.core.config import get_settings
-from src.sql.runner import run_sql_safe
+from src.core.telemetry import ROWS_RETURNED, current_trace, span
+from src.db.engine import dispose_engines
+from src.sql import slowlog
+from src.sql.cache import get_result_cache, run_sql_cached
+from src.sql.runner import BudgetExceeded, _validate_sql, default_budget, iter_sql_safe, validation_cache_info
+
+# Prewarm (src/api/warmup.py) runs in the background: /health is up at once, /ready once everything is warm.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.readiness = warmup.Readiness()
+    task = asyncio.create_task(warmup.run(app.state.readiness))
+    yield
+    task.cancel()
+    dispose_engines()
 
 # Creates a FastAPI instance. The title appears in the Swagger UI.
-app = FastAPI(title="Text-to-SQL Analytics Copilot")
+app = FastAPI(title="Text-to-SQL Analytics Copilot", lifespan=lifespan)
+
+
+# Per-request trace (src/core/telemetry.py): stage spans recorded while the request runs are sent back
+# as a Server-Timing header (e.g. "generate;dur=0.4, validate;dur=0.1, execute;dur=3.2, total;dur=4.1")
+# and the request latency goes into the http_request_duration_seconds histogram.
+# Plain ASGI rather than @app.middleware("http"): no extra task or body buffering per request.
+class ServerTiming:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        trace = telemetry.start_trace()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers") or [])
+                headers.append((b"server-timing", trace.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = scope.get("route")
+            telemetry.HTTP_LATENCY.observe(trace.total_ms() / 1000, status=status,
+                                           route=getattr(route, "path", "unmatched"))
+
+
+app.add_middleware(ServerTiming)
+
+# gauges read at scrape time
+telemetry.Gauge("sql_validation_cache", "Guardrail LRU counters and size.",
+                lambda: {(k,): v for k, v in validation_cache_info().items()}, ("field",))
+telemetry.Gauge("result_cache", "Result cache counters and size.",
+                lambda: {(k,): v for k, v in get_result_cache().info().items()}, ("field",))
+telemetry.Gauge("admission", "Requests waiting for a slot, and rejected so far.",
+                lambda: {(k,): v for k, v in get_limits().info().items()}, ("field",))
 
 # defining the request
 class QueryRequest(BaseModel):
     question: str = Field(..., description="Natural language question")
     limit: int | None = Field(default=10, ge=1, le=100)
+    timeout_ms: int | None = Field(default=None, ge=1, description="Optional tighter execution time budget")
+
+# export requests stream their rows, so there is no small upper bound on the limit (None = all rows)
+class StreamRequest(QueryRequest):
+    limit: int | None = Field(default=None, ge=1)
+    format: Literal["ndjson", "csv"] = "ndjson"
 
 # defines the structure of the response
 class QueryResponse(BaseModel):
     sql: str
+    params: dict | None = Field(default=None, description="Values bound to the :name placeholders in sql (rule-based templates)")
     rows: list[list] | None = None
     columns: list[str] | None = None
+    cache: str | None = Field(default=None, description='Result cache status: "hit", "miss" or "bypass"')
+    route: str | None = Field(default=None, description='Who wrote the SQL: "template", "llm", or "fallback" (the template answer, served because the LLM was off, late or wrong)')
+    route_reason: str | None = Field(default=None, description="Why that route (see src/api/routing.py)")
+    confidence: float | None = Field(default=None, description="How well the question matched a template (0-1)")
+
+# one entry of a /query/batch answer: either a result or the error for that question
+class BatchItem(BaseModel):
+    sql: str | None = None
+    params: dict | None = None
+    rows: list[list] | None = None
+    columns: list[str] | None = None
+    cache: str | None = None
+    route: str | None = None
+    route_reason: str | None = None
+    confidence: float | None = None
+    error: str | None = None
 
 # Simple GET endpoint to confirm the API is up. Useful for deployment health checks.
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+# Readiness (vs /health = liveness): 503 until the startup prewarm has finished, or if it failed.
+@app.get("/ready")
+def ready(request: Request):
+    readiness = getattr(request.app.state, "readiness", None)
+    if readiness is None:
+        return JSONResponse({"status": "not started"}, status_code=503, headers={"Retry-After": "1"})
+    info = readiness.info()
+    if not readiness.ready:
+        return JSONResponse(info, status_code=503, headers={"Retry-After": "1"})
+    return info
+
+# Prometheus scrape endpoint: latency histograms per route and per stage, cache / LLM / row counters.
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(telemetry.render(), media_type="text/plain; version=0.0.4")
+
+# Hand slow requests to the sampled slow-query log (src/sql/slowlog.py); EXPLAIN + write run on the
+# SQLite executor after the fact, never on the request path.
+def _log_if_slow(question: str | None, sql: str | None, params: dict | None) -> None:
+    trace = current_trace()
+    if trace is None:
+        return
+    total = trace.total_ms()
+    if slowlog.should_log(total):
+        get_limits().db_executor.submit(slowlog.record, question, sql, params, dict(trace.stages), total)
+
 # Generate SQL, Run it safely, Return a structured JSON with SQL, rows, and columns.
 # If anything goes wrong (e.g., unsafe SQL, parsing error), it raises an HTTP 400 error with the reason.
+# The handler is async: the LLM call is awaited and SQLite runs on a dedicated thread pool (src/api/limits.py),
+# so a slow request never pins a worker thread. When the server is saturated it answers 503 right away.
+# The response shape is negotiated (src/api/formats.py): rows JSON by default, or columnar JSON / Arrow IPC
+# via the Accept header or ?format=columnar|arrow. Those two bypass Pydantic and are encoded directly.
 @app.post("/query", response_model=QueryResponse)
-def query(req: QueryRequest):
+async def query(req: QueryRequest, request: Request, format: str | None = None):
+    try:
+        fmt = formats.negotiate(request.headers.get("accept"), format)
+    except ValueError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    if fmt == formats.ARROW and not formats.arrow_available():
+        raise HTTPException(status_code=406, detail="Arrow output needs the 'pyarrow' package.")
+
+    limits = get_limits()
+    sql = params = None
+    try:
+        async with limits.admit():
+            try:
+                decision = await _generate(req.question, req.limit)   # ← template or LLM, per question
+                sql, params = decision.sql, decision.params
+
+                budget = default_budget().tightened(timeout_ms=req.timeout_ms)
+                if fmt == formats.ROWS:
+                    cols, rows, cache = await limits.run_db(run_sql_cached, sql, budget, params)   # ← guardrails still apply
+                    # rendered here rather than by FastAPI so the time shows up as the serialize stage
+                    with span("serialize"):
+                        body = QueryResponse(sql=sql, params=params, rows=rows, columns=cols, cache=cache,
+                                             **_route_fields(decision)).model_dump_json()
+                    return Response(content=body, media_type="application/json")
+
+                # execute + encode on the executor so big payloads never block the event loop
+                body, cache = await limits.run_db(_run_and_encode, sql, fmt, budget, params)
+                return Response(content=body, media_type=formats.MEDIA_TYPES[fmt],
+                                headers={"X-Cache": cache, **_route_headers(decision)})
+            except BudgetExceeded as e:
+                raise _budget_error(e)
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=str(e))
+    except Saturated as e:
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={"Retry-After": str(int(e.retry_after))})
+    finally:
+        _log_if_slow(req.question, sql, params)
+
+# Budget violations are not "bad SQL": they get their own status and a machine-readable kind.
+def _budget_error(e: BudgetExceeded) -> HTTPException:
+    return HTTPException(status_code=422, detail={"error": "budget_exceeded", "kind": e.kind, "message": str(e)})
+
+def _run_and_encode(sql: str, fmt: str, budget=None, params=None):
+    cols, rows, cache = run_sql_cached(sql, budget, params)
+    with span("serialize"):
+        if fmt == formats.ARROW:
+            return formats.encode_arrow(cols, rows, sql=sql, params=params), cache
+        return formats.encode_columnar(sql, cols, rows, cache, params), cache
+
+# -> routing.Decision: sql + params, and the route that produced them (src/api/routing.py). LLM output is
+# literal SQL (params None); templates are prepared statements plus their bound values.
+async def _generate(question: str, limit: int | None) -> routing.Decision:
+    with span("generate"):
+        return await routing.route(question, limit)
+
+def _route_fields(decision: routing.Decision) -> dict:
+    return {"route": decision.route, "route_reason": decision.reason, "confidence": decision.confidence}
+
+# columnar, Arrow and streamed responses carry the route in headers instead of the body
+def _route_headers(decision: routing.Decision) -> dict:
+    return {"X-Route": decision.route, "X-Route-Reason": decision.reason}
+
+async def _settle(coro):
+    # gather() helper: keep going when one item fails, remember the error for that item only
+    try:
+        return await coro, None
+    except BudgetExceeded as e:
+        return None, f"budget_exceeded ({e.kind}): {e}"
+    except Exception as e:
+        return None, str(e)
+
+# Many questions in one round trip (e.g. a report page). Work is shared as much as possible:
+# identical questions are generated once, statements that normalize to the same SQL run once,
+# LLM generation runs concurrently under the LLM semaphore, and the distinct statements execute
+# in parallel on the SQLite executor. Results (or per-item errors) come back in request order.
+# Each item's timeout_ms tightens the budget as on /query. The effective timeout is part of the dedupe key,
+# so an item only ever shares a run with items under the same budget and never fails on someone else's.
+@app.post("/query/batch", response_model=list[BatchItem])
+async def query_batch(reqs: list[QueryRequest]):
     settings = get_settings()
-    print(f"[DEBUG] use_llm={settings.use_llm}, model={settings.llm_model}, provider={settings.llm_provider}")
+    if len(reqs) > settings.batch_max_items:
+        raise HTTPException(status_code=413, detail=f"at most {settings.batch_max_items} questions per batch")
+    limits = get_limits()
+    try:
+        async with limits.admit():
+            # 1) dedupe questions, generate each distinct one once
+            qkeys = list(dict.fromkeys((r.question.strip(), r.limit) for r in reqs))
+            generated = await asyncio.gather(*(_settle(_generate(q, lim)) for q, lim in qkeys))
+            sql_for = dict(zip(qkeys, generated))
+
+            # 2) dedupe generated statements by canonical form + bound values (the guardrail LRU makes this cheap)
+            canon_for: dict[tuple, tuple] = {}
+            errors: dict[str, str] = {}
+            for decision, err in generated:
+                if decision is None:
+                    continue
+                sql, params = decision.sql, decision.params
+                key = (sql, _params_key(params))
+                if key in canon_for or sql in errors:
+                    continue
+                try:
+                    canon_for[key] = (_validate_sql(sql).canonical, key[1])
+                except ValueError as e:
+                    errors[sql] = str(e)
+            # ... and by effective budget: (canonical, bound values, timeout) -> (sql, params key, budget)
+            budget = default_budget()
+            run_for: dict[int, tuple] = {}
+            first_stmt: dict[tuple, tuple] = {}
+            for i, r in enumerate(reqs):
+                decision, err = sql_for[(r.question.strip(), r.limit)]
+                key = (decision.sql, _params_key(decision.params)) if decision else None
+                if key not in canon_for:
+                    continue
+                item_budget = budget.tightened(timeout_ms=r.timeout_ms)
+                run_for[i] = (*canon_for[key], item_budget.timeout_ms)
+                first_stmt.setdefault(run_for[i], (*key, item_budget))
+
+            # 3) run every distinct statement in parallel on pooled read-only connections
+            runs = list(first_stmt)
+            executed = await asyncio.gather(*(_settle(limits.run_db(run_sql_cached, first_stmt[k][0], first_stmt[k][2],
+                                                                    dict(k[1]) or None)) for k in runs))
+            result_for = dict(zip(runs, executed))
+    except Saturated as e:
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={"Retry-After": str(int(e.retry_after))})
+
+    # 4) fan the shared results back out in request order
+    out = []
+    for i, r in enumerate(reqs):
+        decision, err = sql_for[(r.question.strip(), r.limit)]
+        sql, params = (decision.sql, decision.params) if decision else (None, None)
+        routed = _route_fields(decision) if decision else {}
+        if err is None and sql in errors:
+            err = errors[sql]
+        if err is not None:
+            out.append(BatchItem(sql=sql, params=params, error=err, **routed))
+            continue
+        res, err = result_for[run_for[i]]
+        if err is not None:
+            out.append(BatchItem(sql=sql, params=params, error=err, **routed))
+        else:
+            cols, rows, cache = res
+            out.append(BatchItem(sql=sql, params=params, rows=rows, columns=cols, cache=cache, **routed))
+    return out
+
+def _params_key(params: dict | None) -> tuple:
+    return tuple(sorted(params.items())) if params else ()
+
+# NDJSON: first line {"sql": ..., "params": {...} | null, "columns": [...]}, then one JSON array per row.
+def _ndjson_chunk(rows) -> bytes:
+    return "".join(json.dumps(r, default=str) + "\n" for r in rows).encode()
+
+def _csv_chunk(rows) -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    return buf.getvalue().encode()
+
+async def _stream_rows(sql: str, fmt: str, params: dict | None = None, question: str | None = None,
+                       budget=None, release=None):
+    # each fetchmany() step runs on the SQLite executor, under the statement budget; only one chunk is
+    # ever held in memory. `release` frees the stream slot the handler claimed once the body is done.
+    limits = get_limits()
+    it = iter_sql_safe(sql, chunk_size=get_settings().stream_chunk_rows, params=params, budget=budget)
+    sent = 0
     try:
-        if settings.use_llm:                                             # ← feature flag
-            sql = generate_sql_with_llm(req.question, limit=req.limit)
+        with span("execute"):
+            cols = await limits.run_db(next, it)
+        if fmt == "csv":
+            yield _csv_chunk([cols])
         else:
-            sql = generate_sql(req.question, limit=req.limit)
+            yield (json.dumps({"sql": sql, "params": params, "columns": cols}) + "\n").encode()
+        encode = _csv_chunk if fmt == "csv" else _ndjson_chunk
+        while True:
+            with span("execute"):   # fetch steps add up; encoding and the client's reads are left out
+                chunk = await limits.run_db(next, it, None)
+            if chunk is None:
+                break
+            sent += len(chunk)
+            yield encode(chunk)
+    finally:
+        try:
+            await limits.run_db(it.close)   # returns the pooled connection even if the client disconnects
+        finally:
+            if release is not None:
+                release()
+        ROWS_RETURNED.observe(sent)
+        _log_if_slow(question, sql, params)
 
-        cols, rows = run_sql_safe(sql)                                  # ← guardrails still apply
-        return QueryResponse(sql=sql, rows=rows, columns=cols)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+# Same generation + guardrails as /query, but rows are streamed as NDJSON or CSV instead of one JSON document.
+# The body is sent after the admission slot is given back, so the export holds a stream slot
+# (STREAM_CONCURRENCY) until it ends; each cursor step gets the statement time budget (or timeout_ms).
+# A budget blown mid-stream cuts the response off, since the 200 has already been sent.
+@app.post("/query/stream")
+async def query_stream(req: StreamRequest):
+    limits = get_limits()
+    try:
+        async with limits.admit():
+            try:
+                decision = await _generate(req.question, req.limit)
+                sql, params = decision.sql, decision.params
+                _validate_sql(sql)   # fail with a 400 before the 200 streaming response has started
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            release = await limits.claim_stream()   # no await between here and the response owning it
+    except Saturated as e:
+        raise HTTPException(status_code=503, detail=str(e),
+                            headers={"Retry-After": str(int(e.retry_after))})
 
-from src.core.config import get_settings
\ No newline at end of file
+    media = "text/csv" if req.format == "csv" else "application/x-ndjson"
+    budget = default_budget().tightened(timeout_ms=req.timeout_ms)
+    # the background task covers a client that disconnects before the body generator ever starts
+    return StreamingResponse(_stream_rows(sql, req.format, params, req.question, budget, release), media_type=media,
+                             headers=_route_headers(decision), background=BackgroundTask(release))
+
+from src.core.config import get_settings
@@ -0,0 +1,115 @@
+# Concurrency limits for the async /query path.
+#
+# - Admission: at most `max_inflight` requests are worked on at once and at most `admission_queue`
+#   more may wait for a slot. Anything beyond that (or anything that waited too long) is rejected
+#   immediately with 503, so latency stays bounded instead of growing with the backlog.
+# - LLM calls and SQLite work each have their own semaphore, so a burst of slow LLM calls
+#   cannot starve the cheap template + SQL path (and vice versa). `llm` is held by the upstream call
+#   itself (generate_sql_with_llm_async's slot), so a request that stops waiting doesn't free it early.
+# - SQLite execution runs on a dedicated, fixed-size thread pool rather than the event loop.
+# - Streamed exports outlive their admission slot (the body is sent after the handler returns), so each
+#   holds one of `stream_concurrency` stream slots until its last chunk is out or the client goes away.
+
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+
+from src.core.config import get_settings
+
+
+class Saturated(Exception):
+    """Raised when the server is at capacity; the API turns it into a 503 with Retry-After."""
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class Limits:
+    def __init__(self, *, max_inflight: int, max_queue: int, queue_timeout_s: float,
+                 llm_concurrency: int, db_workers: int, db_concurrency: int, stream_concurrency: int):
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self._slots = asyncio.Semaphore(max_inflight)
+        self._waiting = 0
+        self.llm = asyncio.Semaphore(llm_concurrency)
+        self.db = asyncio.Semaphore(db_concurrency)
+        self.db_executor = ThreadPoolExecutor(max_workers=db_workers, thread_name_prefix="sqlite")
+        self.streams = asyncio.Semaphore(stream_concurrency)
+        self.streaming = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def admit(self):
+        # fast path: a free slot, no waiting at all
+        if self._slots.locked():
+            if self._waiting >= self.max_queue:
+                self.rejected += 1
+                raise Saturated("admission queue full")
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout_s)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Saturated("timed out waiting for a worker slot") from None
+            finally:
+                self._waiting -= 1
+        else:
+            await self._slots.acquire()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    async def run_db(self, fn, *args, **kwargs):
+        """Run blocking SQLite work on the dedicated executor, under the DB semaphore."""
+        async with self.db:
+            loop = asyncio.get_running_loop()
+            # run in a copy of the caller's context, so telemetry spans land in the request's trace
+            ctx = contextvars.copy_context()
+            return await loop.run_in_executor(self.db_executor, partial(ctx.run, fn, *args, **kwargs))
+
+    async def claim_stream(self):
+        """
+        Take a stream slot, or raise Saturated at once when every one is taken (an export can run for
+        minutes, so queueing for one is pointless). Returns the release callable; calling it again is a no-op.
+        """
+        if self.streams.locked():
+            self.rejected += 1
+            raise Saturated("too many streams in flight", retry_after=5.0)
+        await self.streams.acquire()
+        self.streaming += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.streaming -= 1
+                self.streams.release()
+
+        return release
+
+    def info(self) -> dict:
+        return {"waiting": self._waiting, "streaming": self.streaming, "rejected": self.rejected}
+
+
+_LIMITS: Limits | None = None
+
+
+def get_limits() -> Limits:
+    global _LIMITS
+    if _LIMITS is None:
+        s = get_settings()
+        _LIMITS = Limits(
+            max_inflight=s.max_inflight,
+            max_queue=s.admission_queue,
+            queue_timeout_s=s.admission_timeout_s,
+            llm_concurrency=s.llm_concurrency,
+            db_workers=s.db_workers,
+            db_concurrency=s.db_concurrency or s.db_workers,
+            stream_concurrency=s.stream_concurrency,
+        )
+    return _LIMITS
@@ -0,0 +1,107 @@
+# Per-request choice between the rule-based templates and the LLM.
+#
+# With USE_LLM=true and LLM_ROUTING=hybrid (the default) a question is scored against the templates first
+# (IntentMatcher.score in src/nlp/templates.py: how much of the question the matched template answers):
+#   confidence >= router_min_confidence   template answer at once, no LLM round trip     route "template"
+#   below it                              LLM, under the llm_deadline_ms deadline        route "llm"
+# LLM_ROUTING=llm sends every question to the LLM. The template answer is the safety net: when the LLM
+# misses the deadline (waiting for an LLM slot counts), fails, or returns SQL that fails the guardrails,
+# reads a table the catalog doesn't have, or is estimated over the cost budget (src/sql/cost.py), the
+# template answer is served instead, flagged as route "fallback" with the reason. The deadline only bounds
+# the wait: a call cut off by it keeps running (the single-flight task is shielded) and keeps its LLM slot
+# until it finishes, so its answer still lands in the LLM cache for the next asker and the number of calls
+# in flight upstream never exceeds llm_concurrency.
+# With USE_LLM=false every question gets the template answer; low-confidence ones are flagged
+# "fallback" / "llm_off" rather than silently answered with the fallback_search template.
+# Each decision is counted in router_decisions_total{route,reason} and its generation time observed in
+# route_duration_seconds{route}.
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+
+from sqlglot import expressions as exp
+
+from src.api.limits import get_limits
+from src.core.config import get_settings
+from src.core.telemetry import ROUTE_LATENCY, ROUTER_DECISIONS
+from src.db.schema import get_schema
+from src.nlp.pipeline import generate_sql_with_llm_async, generate_statement
+from src.nlp.templates import match_intent
+from src.sql import cost
+from src.sql.runner import BudgetExceeded, _validate_sql
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Decision:
+    sql: str
+    params: dict | None
+    route: str               # "template" | "llm" | "fallback"
+    reason: str              # confident, llm_off | ambiguous, forced | deadline, invalid_sql, too_costly, llm_error
+    confidence: float        # template match confidence
+
+
+def _template(question: str, limit: int | None):
+    _, confidence = match_intent.score(question)
+    sql, params = generate_statement(question, limit)
+    return sql, params, confidence
+
+
+def check_llm_sql(sql: str) -> None:
+    """
+    Raise ValueError unless the LLM's SQL passes the guardrails and reads only tables that exist, and
+    BudgetExceeded(kind="cost") if it is estimated to cost more than Settings.max_query_cost.
+    """
+    ast = _validate_sql(sql).ast
+    schema = get_schema()
+    known = {t.lower() for t in (*schema.tables, *schema.internal_tables)}
+    known |= {cte.alias_or_name.lower() for cte in ast.find_all(exp.CTE)}
+    unknown = sorted({t.name for t in ast.find_all(exp.Table)
+                      if t.name.lower() not in known and not t.name.lower().startswith(("sqlite_", "pragma_"))})
+    if unknown:
+        raise ValueError(f"unknown table(s): {', '.join(unknown)}")
+    cost.check(sql)
+
+
+async def _llm(question: str, limit: int | None, deadline_ms: float) -> str:
+    # the LLM semaphore is taken inside the shared call, not around this wait (see the header)
+    sql = await asyncio.wait_for(generate_sql_with_llm_async(question, limit=limit, slot=get_limits().llm),
+                                 deadline_ms / 1000 if deadline_ms > 0 else None)
+    await get_limits().run_db(check_llm_sql, sql)     # EXPLAIN QUERY PLAN on a pooled connection
+    return sql
+
+
+async def route(question: str, limit: int | None) -> Decision:
+    """Generate SQL for one request: (sql, params) plus which route produced it and why."""
+    settings = get_settings()
+    t0 = time.perf_counter()
+    sql, params, confidence = await asyncio.to_thread(_template, question, limit)
+    confident = confidence >= settings.router_min_confidence
+
+    if not settings.use_llm:
+        decision = Decision(sql, params, "template" if confident else "fallback",
+                            "confident" if confident else "llm_off", confidence)
+    elif confident and settings.llm_routing == "hybrid":
+        decision = Decision(sql, params, "template", "confident", confidence)
+    else:
+        reason = "ambiguous" if settings.llm_routing == "hybrid" else "forced"
+        try:
+            decision = Decision(await _llm(question, limit, settings.llm_deadline_ms), None, "llm", reason, confidence)
+        except asyncio.TimeoutError:
+            decision = Decision(sql, params, "fallback", "deadline", confidence)
+        except ValueError as e:
+            log.info("LLM SQL rejected, serving the template answer: %s", e)
+            decision = Decision(sql, params, "fallback", "invalid_sql", confidence)
+        except BudgetExceeded as e:
+            log.info("LLM SQL over the cost budget, serving the template answer: %s", e)
+            decision = Decision(sql, params, "fallback", "too_costly", confidence)
+        except Exception as e:
+            log.warning("LLM generation failed, serving the template answer: %s", e)
+            decision = Decision(sql, params, "fallback", "llm_error", confidence)
+
+    ROUTER_DECISIONS.inc(route=decision.route, reason=decision.reason)
+    ROUTE_LATENCY.observe(time.perf_counter() - t0, route=decision.route)
+    return decision
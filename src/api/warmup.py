@@ -0,0 +1,77 @@
+# Startup prewarm for the API and the readiness state behind GET /ready.
+#
+# Everything on the request path is built lazily: the pooled engine (or the in-memory replica copy),
+# the schema catalog, the compiled + validated templates, the LLM client and prompt, the cost gate's
+# table sizes, pyarrow. Without a prewarm the first requests after a deploy pay for all of it. The
+# lifespan hook in app.py starts run() as a background task: /health answers at once (the process is
+# alive), /ready answers 200 only once every step has finished, so a load balancer never routes traffic
+# to a cold worker.
+# Each step is timed; /ready reports the timings, or the step that failed.
+
+import asyncio
+import logging
+import time
+
+from src.api.formats import _pyarrow, arrow_available
+from src.core.config import get_settings
+from src.db.engine import get_engine
+from src.db.rollups import rollups_available
+from src.db.schema import get_schema
+from src.nlp.pipeline import _async_llm_client, _check_llm_prereqs, _llm_client, _llm_messages
+from src.nlp.templates import get_templates
+from src.sql import cost
+from src.sql.runner import run_sql_safe
+
+log = logging.getLogger(__name__)
+
+
+class Readiness:
+    def __init__(self):
+        self.ready = False
+        self.error: str | None = None
+        self.steps: dict[str, float] = {}     # step -> ms
+        self.started = time.perf_counter()
+        self.took_ms: float | None = None
+
+    def step(self, name: str, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        except Exception as e:
+            self.error = f"{name}: {e}"
+            raise
+        finally:
+            self.steps[name] = round((time.perf_counter() - t0) * 1000, 2)
+
+    def info(self) -> dict:
+        status = "ready" if self.ready else ("failed" if self.error else "warming")
+        return {"status": status, "error": self.error, "steps_ms": dict(self.steps), "took_ms": self.took_ms}
+
+
+def prewarm(readiness: Readiness) -> None:
+    """The blocking steps, in dependency order (run in a worker thread)."""
+    settings = get_settings()
+    readiness.step("engine", get_engine)                      # pool, or the in-memory replica copy
+    readiness.step("schema", get_schema)
+    readiness.step("rollups", rollups_available)
+    readiness.step("templates", get_templates)                 # sqlglot parse + guardrail check, into the LRU
+    readiness.step("query", run_sql_safe, "SELECT 1")          # a pooled connection with PRAGMAs and budget hooks
+    if settings.use_llm:
+        readiness.step("llm_client", lambda: (_check_llm_prereqs(), _llm_client(settings)))
+        readiness.step("llm_prompt", _llm_messages, "warmup", 10)
+        readiness.step("cost_gate", cost.estimate, "SELECT 1")    # table sizes for the LLM SQL cost gate
+    if arrow_available():
+        readiness.step("pyarrow", _pyarrow)
+
+
+async def run(readiness: Readiness) -> None:
+    try:
+        await asyncio.to_thread(prewarm, readiness)
+        if get_settings().use_llm:
+            # async clients belong to the serving event loop, so this one is made here, not in the thread
+            readiness.step("llm_client_async", _async_llm_client, get_settings())
+        readiness.took_ms = round((time.perf_counter() - readiness.started) * 1000, 2)
+        readiness.ready = True
+        log.info("prewarm done in %.0f ms: %s", readiness.took_ms, readiness.steps)
+    except Exception:
+        log.exception("prewarm failed; /ready stays 503 (%s)", readiness.error)
@@ -0,0 +1,237 @@
+# End-to-end latency benchmark of the question → rows path, stage by stage:
+#   intent         match_intent + year_from_text (src/nlp/templates.py)
+#   generate       generate_statement (rule-based)      generate_llm   generate_sql_with_llm against
+#                                                                      src/bench/stub_llm.py (no LLM cache)
+#   validate_cold  sqlglot parse + guardrail check      validate_warm  _validate_sql LRU hit
+#   execute        SQLite execute + fetch (pooled read-only engine)
+#   convert        Row objects → JSON-friendly lists
+#   serialize      QueryResponse → JSON body, as FastAPI renders it
+#   http           POST /query through the ASGI app      http_llm       same, LLM mode via the stub
+#                                                        http_hybrid    same, LLM_ROUTING=hybrid: template
+#                                                                       answers unless the match is unsure
+# The result cache is disabled so every sample does the real work.
+#
+# Each scale builds a temp database from data/real replicated `scale` times (orders/order_items grow,
+# customers/products don't; data/retail.db is never touched), or with --synth, a synthetic database
+# from src/db/synth.py where the scale is the scale factor (SF1 ≈ 1M order_items). Results are medians / p95 in ms, written
+# as JSON. With --baseline, medians are compared with a stored run and the exit code is 1 when a stage
+# got slower than tolerance (ratio) AND the floor (absolute ms), so sub-noise jitter doesn't fail it.
+# The stored baseline is machine specific: regenerate it with --save-baseline on the machine that checks.
+#
+# Run: python -m src.bench.e2e [--scales 1,10] [--synth] [--repeat 15] [--out results.json]
+#                              [--baseline src/bench/baseline.json] [--save-baseline]
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+
+from src.api.app import QueryResponse, app
+from src.bench.stub_llm import StubLLM
+from src.core.config import get_settings
+from src.db import load_csvs, synth
+from src.db._bench_load import _make_csvs
+from src.db.engine import dispose_engines, get_engine
+from src.nlp.pipeline import generate_sql_with_llm, generate_statement
+from src.nlp.templates import match_intent, year_from_text
+from src.sql.runner import _parse_and_check, _validate_sql
+
+BASELINE = Path(__file__).with_name("baseline.json")
+QUESTIONS = [
+    "top 5 customers by total spend",
+    "total revenue by product in 2024",
+    "orders by customer",
+    "average order value in 2025",
+    "daily sales in 2024",
+    "biggest orders",
+]
+STAGES = ["intent", "generate", "generate_llm", "validate_cold", "validate_warm",
+          "execute", "convert", "serialize", "http", "http_llm", "http_hybrid"]
+
+
+def _summary(samples: list[float]) -> dict:
+    s = sorted(samples)
+    return {"n": len(s), "median_ms": round(statistics.median(s), 4),
+            "p95_ms": round(s[min(len(s) - 1, int(round(0.95 * (len(s) - 1))))], 4),
+            "mean_ms": round(statistics.fmean(s), 4)}
+
+
+def _timed(samples: dict, stage: str, fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    samples.setdefault(stage, []).append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def _build(tmp: Path, scale: float, use_synth: bool) -> tuple[str, dict]:
+    db = str(tmp / f"bench_{scale:g}.db")
+    with contextlib.redirect_stdout(io.StringIO()):
+        if use_synth:
+            return db, synth.generate(db, scale)
+        csv_dir = tmp / f"csv_{scale:g}"
+        csv_dir.mkdir()
+        counts = _make_csvs(load_csvs.DATA_DIR, csv_dir, int(scale))
+        load_csvs.main(db, csv_dir)
+    return db, counts
+
+
+def _execute(conn, sql: str, params: dict):
+    result = conn.execute(text(sql), params)
+    return list(result.keys()), result.fetchall()
+
+
+def _local_stages(samples: dict, repeat: int) -> None:
+    for _ in range(repeat):
+        for q in QUESTIONS:
+            _timed(samples, "intent", lambda: (match_intent(q), year_from_text(q)))
+            sql, params = _timed(samples, "generate", generate_statement, q, 10)
+            _timed(samples, "validate_cold", _parse_and_check, sql)
+            _timed(samples, "validate_warm", _validate_sql, sql)
+            with get_engine().connect() as conn:
+                cols, raw = _timed(samples, "execute", _execute, conn, sql, params)
+            rows = _timed(samples, "convert", lambda: [list(r) for r in raw])
+            resp = QueryResponse(sql=sql, params=params, rows=rows, columns=cols)
+            _timed(samples, "serialize", lambda: JSONResponse(jsonable_encoder(resp)).body)
+
+
+def _llm_stage(samples: dict, repeat: int) -> None:
+    for _ in range(repeat):
+        for q in QUESTIONS:
+            _timed(samples, "generate_llm", generate_sql_with_llm, q, 10)
+
+
+async def _http_stage(samples: dict, stage: str, repeat: int) -> None:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(repeat):
+            for q in QUESTIONS:
+                t0 = time.perf_counter()
+                r = await client.post("/query", json={"question": q, "limit": 10})
+                samples.setdefault(stage, []).append((time.perf_counter() - t0) * 1000)
+                if r.status_code != 200:
+                    raise RuntimeError(f"{stage}: /query {q!r} -> {r.status_code} {r.text[:200]}")
+
+
+def run(scales: list[float], repeat: int, use_synth: bool = False) -> dict:
+    settings = get_settings()
+    saved = settings.model_copy()
+    saved_key = os.environ.get("OPENAI_API_KEY")
+    settings.result_cache_max_bytes = 0   # measure the work, not the cache
+    settings.llm_cache_path = ""          # every LLM sample is a round trip to the stub
+    settings.openai_api_key = settings.openai_api_key or "stub"
+    os.environ.setdefault("OPENAI_API_KEY", settings.openai_api_key)
+
+    out = {"meta": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                    "platform": platform.platform(), "cpus": os.cpu_count(),
+                    "repeat": repeat, "questions": QUESTIONS, "data": "synth" if use_synth else "replicated"},
+           "scales": {}}
+    try:
+        with tempfile.TemporaryDirectory() as tmp, StubLLM() as stub, \
+                contextlib.redirect_stdout(io.StringIO()):   # keep stray app output out of the report
+            settings.llm_base_url = stub.url
+            for scale in scales:
+                db, counts = _build(Path(tmp), scale, use_synth)
+                dispose_engines()
+                settings.sqlite_path = db
+                samples: dict[str, list[float]] = {}
+
+                _local_stages({}, 1)                       # warm-up: imports, pool, page cache
+                _local_stages(samples, repeat)
+                _llm_stage(samples, repeat)
+                settings.use_llm = False
+                asyncio.run(_http_stage(samples, "http", repeat))
+                settings.use_llm = True
+                settings.llm_routing = "llm"
+                asyncio.run(_http_stage(samples, "http_llm", repeat))
+                settings.llm_routing = "hybrid"
+                asyncio.run(_http_stage(samples, "http_hybrid", repeat))
+
+                out["scales"][f"{'sf' if use_synth else ''}{scale:g}"] = {"rows": counts,
+                                             "stages": {s: _summary(samples[s]) for s in STAGES}}
+                dispose_engines()
+    finally:
+        for name, value in saved.model_dump().items():
+            setattr(settings, name, value)
+        if saved_key is None:
+            os.environ.pop("OPENAI_API_KEY", None)
+    return out
+
+
+def compare(results: dict, baseline: dict, tolerance: float, floor_ms: float) -> list[str]:
+    """Stages whose median got slower than the baseline's by more than tolerance and floor_ms."""
+    regressions = []
+    for scale, cur in results["scales"].items():
+        base = baseline.get("scales", {}).get(scale)
+        if base is None:
+            continue
+        for stage, stats in cur["stages"].items():
+            ref = base["stages"].get(stage)
+            if ref is None:
+                continue
+            now, before = stats["median_ms"], ref["median_ms"]
+            if now > before * (1 + tolerance) and now - before > floor_ms:
+                regressions.append(f"scale {scale} {stage}: {before:.3f} -> {now:.3f} ms ({now / before:.2f}x)")
+    return regressions
+
+
+def report(results: dict, baseline: dict | None = None) -> None:
+    for scale, cur in results["scales"].items():
+        rows = cur["rows"]
+        print(f"\nscale {scale}: {rows.get('orders', 0):,} orders, {rows.get('order_items', 0):,} order_items")
+        print(f"  {'stage':<14} {'median ms':>10} {'p95 ms':>10} {'baseline':>10}")
+        base = (baseline or {}).get("scales", {}).get(scale, {}).get("stages", {})
+        for stage, stats in cur["stages"].items():
+            ref = base.get(stage, {}).get("median_ms")
+            ref_txt = f"{ref:10.3f}" if ref is not None else f"{'-':>10}"
+            print(f"  {stage:<14} {stats['median_ms']:10.3f} {stats['p95_ms']:10.3f} {ref_txt}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scales", default="1,10", help="comma-separated dataset scales")
+    ap.add_argument("--synth", action="store_true", help="synthetic data; scales are scale factors (e.g. 0.1,1)")
+    ap.add_argument("--repeat", type=int, default=15, help="passes over the question set per stage")
+    ap.add_argument("--out", help="write the results JSON here")
+    ap.add_argument("--baseline", default=str(BASELINE))
+    ap.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed median slowdown ratio")
+    ap.add_argument("--floor-ms", type=float, default=0.05, help="ignore slowdowns smaller than this")
+    args = ap.parse_args()
+
+    results = run([float(s) for s in args.scales.split(",")], args.repeat, args.synth)
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2) + "\n")
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(results, indent=2) + "\n")
+        report(results)
+        print(f"\nbaseline saved to {args.baseline}")
+        return
+
+    baseline = json.loads(Path(args.baseline).read_text()) if Path(args.baseline).exists() else None
+    report(results, baseline)
+    if baseline is None:
+        print(f"\nno baseline at {args.baseline} (use --save-baseline)")
+        return
+    regressions = compare(results, baseline, args.tolerance, args.floor_ms)
+    for r in regressions:
+        print("REGRESSION", r)
+    print("\nno regressions" if not regressions else f"\n{len(regressions)} regressions")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# Startup benchmark: how long a fresh API process takes to become useful, per mode.
+#   import_ms        `import src.api.app` in a fresh interpreter (min over runs); also which heavy
+#                    optional packages that import pulled in (openai / pyarrow should not be)
+#   health_ms        uvicorn spawned -> first 200 from GET /health (process accepting requests)
+#   ready_ms         spawned -> first 200 from GET /ready (startup prewarm finished)
+#   first_query_ms   spawned -> first successful POST /query
+#   first_latency_ms latency of that first /query, vs warm_latency_ms for the second one
+# Modes: rules (USE_LLM=false) and llm (USE_LLM=true, LLM_ROUTING=llm against src/bench/stub_llm.py); --in-memory also
+# sets SQLITE_IN_MEMORY. Each server gets a temp copy of the database (data/retail.db is never touched)
+# and no LLM cache. Medians over --repeat runs go to JSON; --baseline / --save-baseline work like e2e.py.
+# Run: python -m src.bench.startup [--repeat 5] [--in-memory] [--out startup.json]
+#                                  [--baseline src/bench/startup_baseline.json] [--save-baseline]
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from src.bench.stub_llm import StubLLM
+from src.core.config import get_settings
+
+BASELINE = Path(__file__).with_name("startup_baseline.json")
+METRICS = ["import_ms", "health_ms", "ready_ms", "first_query_ms", "first_latency_ms", "warm_latency_ms"]
+QUESTION = {"question": "top 5 customers by total spend in 2024", "limit": 5}
+_IMPORT_PROBE = ("import sys, time, json; t = time.perf_counter(); import src.api.app; "
+                 "print(json.dumps({'ms': (time.perf_counter() - t) * 1000, "
+                 "'loaded': [m for m in ('openai', 'pyarrow', 'numpy') if m in sys.modules]}))")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _import(env: dict) -> dict:
+    out = subprocess.run([sys.executable, "-c", _IMPORT_PROBE], env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _wait_for(client: httpx.Client, method: str, path: str, t0: float, timeout_s: float, **kw) -> float:
+    while time.perf_counter() - t0 < timeout_s:
+        try:
+            if client.request(method, path, **kw).status_code == 200:
+                return (time.perf_counter() - t0) * 1000
+        except httpx.TransportError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError(f"{method} {path} not 200 after {timeout_s:.0f}s")
+
+
+def _serve_once(env: dict, timeout_s: float = 60) -> dict:
+    port = _free_port()
+    cmd = [sys.executable, "-m", "uvicorn", "src.api.app:app", "--port", str(port), "--log-level", "warning"]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            health = _wait_for(client, "GET", "/health", t0, timeout_s)
+            # queries are not gated on /ready (they work cold, just slower), so each is measured from spawn
+            t_q = time.perf_counter()
+            r = client.post("/query", json=QUESTION)
+            if r.status_code != 200:
+                raise RuntimeError(f"/query -> {r.status_code} {r.text[:200]}")
+            first_latency = (time.perf_counter() - t_q) * 1000
+            first_query = (time.perf_counter() - t0) * 1000
+            ready = _wait_for(client, "GET", "/ready", t0, timeout_s)
+            t_q = time.perf_counter()
+            client.post("/query", json=QUESTION)
+            warm_latency = (time.perf_counter() - t_q) * 1000
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return {"health_ms": health, "ready_ms": ready, "first_query_ms": first_query,
+            "first_latency_ms": first_latency, "warm_latency_ms": warm_latency}
+
+
+def run(repeat: int, in_memory: bool = False) -> dict:
+    out = {"meta": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+                    "repeat": repeat, "in_memory": in_memory}, "modes": {}}
+    with tempfile.TemporaryDirectory() as tmp, StubLLM() as stub:
+        db = str(Path(tmp) / "startup.db")
+        shutil.copyfile(get_settings().sqlite_path, db)
+        base = {**os.environ, "SQLITE_PATH": db, "LLM_CACHE_PATH": "", "RESULT_CACHE_MAX_BYTES": "0",
+                "SQLITE_IN_MEMORY": "true" if in_memory else "false", "PYTHONDONTWRITEBYTECODE": "1"}
+        for mode, extra in [("rules", {"USE_LLM": "false"}),
+                            ("llm", {"USE_LLM": "true", "LLM_ROUTING": "llm", "OPENAI_BASE_URL": stub.url,
+                                     "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "stub"})]:
+            env = {**base, **extra}
+            imports = [_import(env) for _ in range(repeat)]
+            samples = [_serve_once(env) for _ in range(repeat)]
+            stats = {"import_ms": round(min(i["ms"] for i in imports), 2)}
+            for m in METRICS[1:]:
+                stats[m] = round(statistics.median(s[m] for s in samples), 2)
+            out["modes"][mode] = {"loaded_at_import": imports[0]["loaded"], "metrics": stats}
+    return out
+
+
+def compare(results: dict, baseline: dict, tolerance: float, floor_ms: float) -> list[str]:
+    """Metrics that got slower than the baseline's by more than tolerance and floor_ms."""
+    regressions = []
+    for mode, cur in results["modes"].items():
+        ref = baseline.get("modes", {}).get(mode, {}).get("metrics", {})
+        for m, now in cur["metrics"].items():
+            before = ref.get(m)
+            if before is not None and now > before * (1 + tolerance) and now - before > floor_ms:
+                regressions.append(f"{mode} {m}: {before:.1f} -> {now:.1f} ms ({now / before:.2f}x)")
+    return regressions
+
+
+def report(results: dict, baseline: dict | None = None) -> None:
+    for mode, cur in results["modes"].items():
+        loaded = ", ".join(cur["loaded_at_import"]) or "none"
+        print(f"\n{mode}: optional packages loaded at import: {loaded}")
+        print(f"  {'metric':<17} {'ms':>9} {'baseline':>9}")
+        ref = (baseline or {}).get("modes", {}).get(mode, {}).get("metrics", {})
+        for m, v in cur["metrics"].items():
+            b = ref.get(m)
+            print(f"  {m:<17} {v:9.1f} {f'{b:9.1f}' if b is not None else f'{chr(45):>9}'}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5, help="server starts (and import probes) per mode")
+    ap.add_argument("--in-memory", action="store_true", help="serve from the in-memory replica")
+    ap.add_argument("--out", help="write the results JSON here")
+    ap.add_argument("--baseline", default=str(BASELINE))
+    ap.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown ratio")
+    ap.add_argument("--floor-ms", type=float, default=50, help="ignore slowdowns smaller than this")
+    args = ap.parse_args()
+
+    results = run(args.repeat, args.in_memory)
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2) + "\n")
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(results, indent=2) + "\n")
+        report(results)
+        print(f"\nbaseline saved to {args.baseline}")
+        return
+
+    baseline = json.loads(Path(args.baseline).read_text()) if Path(args.baseline).exists() else None
+    report(results, baseline)
+    if baseline is None:
+        print(f"\nno baseline at {args.baseline} (use --save-baseline)")
+        return
+    regressions = compare(results, baseline, args.tolerance, args.floor_ms)
+    for r in regressions:
+        print("REGRESSION", r)
+    print("\nno regressions" if not regressions else f"\n{len(regressions)} regressions")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
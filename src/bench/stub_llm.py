@@ -0,0 +1,148 @@
+# Local stand-in for the OpenAI Chat Completions endpoint, so LLM mode can be benchmarked and demoed
+# without a key or network. It answers POST /v1/chat/completions with the rule-based generator's SQL for
+# the question found in the last user message (base tables, literal values: like a model would write it),
+# after an optional artificial delay that stands in for model latency.
+# Usage is reported like the real API: prompt_tokens (pipeline.count_tokens) and
+# prompt_tokens_details.cached_tokens, the prefix shared with a recent prompt as OpenAI's prompt caching
+# counts it (only prompts of cache_min_tokens or more, in 128-token steps). With prefill_ms_per_1k the
+# delay also grows with the prompt: full price for new tokens, cached_cost of it for cached ones.
+#
+#   with StubLLM(latency_ms=50) as stub:
+#       settings.llm_base_url = stub.url      # OpenAI(base_url=...) / OPENAI_BASE_URL
+#       ...
+#       stub.requests                         # completions served so far
+#   StubLLM(answer=lambda messages: "...")    # a fixed or broken answer instead of the rule-based SQL
+#
+# Run standalone: python -m src.bench.stub_llm [--port 8808] [--latency-ms 0]
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.nlp.pipeline import count_tokens, generate_sql
+
+_QUESTION = re.compile(r"Question:\s*(.+)")
+_LIMIT = re.compile(r"LIMIT (\d+)")
+_BLOCK_CHARS = 128 * 4        # 128 tokens at the ~4 chars/token of count_tokens
+
+
+def _answer(messages: list[dict]) -> str:
+    user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+    q = _QUESTION.search(user)
+    lim = _LIMIT.search(user)
+    return generate_sql(q.group(1).strip() if q else user, limit=int(lim.group(1)) if lim else 10,
+                        use_rollups=False) + ";"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"     # keep-alive, like the real API
+    disable_nagle_algorithm = True    # headers and body go out in separate writes; don't wait on delayed ACKs
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        stub: StubLLM = self.server.stub
+        messages = body.get("messages") or []
+        prompt_tokens, cached = stub._prompt_usage(messages)
+        delay_ms = stub.latency_ms + (prompt_tokens - cached + cached * stub.cached_cost) / 1000 * stub.prefill_ms_per_1k
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        sql = stub.answer(messages)
+        with stub._lock:
+            stub.requests += 1
+            n = stub.requests
+        payload = json.dumps({
+            "id": f"chatcmpl-stub-{n}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model") or "stub",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": sql}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(sql) // 4,
+                      "total_tokens": prompt_tokens + len(sql) // 4,
+                      "prompt_tokens_details": {"cached_tokens": cached}},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubLLM:
+    """OpenAI-compatible completions server on 127.0.0.1, running in a background thread."""
+
+    def __init__(self, latency_ms: float = 0.0, port: int = 0, prefill_ms_per_1k: float = 0.0,
+                 cache_min_tokens: int = 1024, cached_cost: float = 0.2, answer=None):
+        self.latency_ms = latency_ms
+        self.answer = answer or _answer         # messages -> completion text
+        self.prefill_ms_per_1k = prefill_ms_per_1k
+        self.cache_min_tokens = cache_min_tokens
+        self.cached_cost = cached_cost
+        self.requests = 0
+        self._prefixes: dict[int, None] = {}   # hashes of recent 128-token prompt prefixes (insertion-ordered)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread: threading.Thread | None = None
+
+    def _prompt_usage(self, messages: list[dict]) -> tuple[int, int]:
+        text = "\x1e".join(f"{m.get('role')}\x1f{m.get('content') or ''}" for m in messages)
+        tokens = count_tokens(messages)
+        # like the providers: the prompt is cached in 128-token blocks, each keyed on everything before it
+        blocks = [hash(text[:end]) for end in range(_BLOCK_CHARS, len(text) + 1, _BLOCK_CHARS)]
+        with self._lock:
+            hits = next((i for i, h in enumerate(blocks) if h not in self._prefixes), len(blocks))
+            for h in blocks:
+                self._prefixes.pop(h, None)
+                self._prefixes[h] = None
+            while len(self._prefixes) > 4096:
+                del self._prefixes[next(iter(self._prefixes))]
+        cached = min(tokens, hits * 128)
+        return tokens, cached if tokens >= self.cache_min_tokens and cached >= self.cache_min_tokens else 0
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubLLM":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "StubLLM":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8808)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    args = ap.parse_args()
+    stub = StubLLM(args.latency_ms, args.port)
+    print(f"stub LLM on {stub.url} (OPENAI_BASE_URL={stub.url}); Ctrl+C to stop")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
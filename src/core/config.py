@@ -24,11 +24,91 @@ load_dotenv()  # loads .env from project root into process env
 # Got a warning when used model_provider and model_name as pydantic uses model_ prefix for its own internals. So changed to llm_.
 class Settings(BaseModel):
     # DB
-    sqlite_path: str = "data/retail.db"
+    sqlite_path: str = os.getenv("SQLITE_PATH", "data/retail.db")
+
+    # Read-only connection pool shared by every request (see src/db/engine.py)
+    # mmap/cache sizes are in bytes / KiB (negative cache_size = KiB, as SQLite expects)
+    sqlite_pool_size: int = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+    sqlite_pool_overflow: int = int(os.getenv("SQLITE_POOL_OVERFLOW", "8"))
+    sqlite_mmap_size: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    sqlite_cache_size: int = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+
+    # In-memory serving replica (src/db/engine.py): reads go to a RAM copy of sqlite_path made with the backup API;
+    # the file is checked every replica_refresh_s seconds (0 = never) and a changed file is re-copied and swapped in
+    sqlite_in_memory: bool = os.getenv("SQLITE_IN_MEMORY", "false").strip().lower() == "true"
+    replica_refresh_s: float = float(os.getenv("REPLICA_REFRESH_S", "2"))
+
+    # Per-statement execution budgets enforced by the runner (0 disables a budget)
+    statement_timeout_ms: int = int(os.getenv("STATEMENT_TIMEOUT_MS", "5000"))
+    max_vm_steps: int = int(os.getenv("MAX_VM_STEPS", "500000000"))
+    max_result_rows: int = int(os.getenv("MAX_RESULT_ROWS", "10000"))
+    max_result_bytes: int = int(os.getenv("MAX_RESULT_BYTES", str(32 * 1024 * 1024)))
+
+    # Pre-execution cost gate for LLM SQL (src/sql/cost.py): estimated rows visited, from EXPLAIN QUERY PLAN and
+    # table sizes; a statement estimated over max_query_cost is not run (0 disables the gate)
+    max_query_cost: float = float(os.getenv("MAX_QUERY_COST", "50000000"))
+
+    # Guardrail LRU: how many validated statements (verdict + AST) to remember
+    sql_cache_size: int = int(os.getenv("SQL_CACHE_SIZE", "512"))
+
+    # Workload capture for the index advisor (src/sql/advisor.py): distinct statements remembered in memory
+    # (0 disables); workload_path, if set, also appends each new statement to a JSON-lines file
+    workload_max_statements: int = int(os.getenv("WORKLOAD_MAX_STATEMENTS", "1000"))
+    workload_path: str = os.getenv("WORKLOAD_PATH", "")
+
+    # Slow-query log (src/sql/slowlog.py): requests slower than slow_query_ms (0 disables) are logged with their
+    # question, SQL, stage timings and plan, for a sampled fraction of them; to slow_query_log_path as JSON lines,
+    # or to the "slow_query" logger when the path is empty
+    slow_query_ms: float = float(os.getenv("SLOW_QUERY_MS", "500"))
+    slow_query_sample: float = float(os.getenv("SLOW_QUERY_SAMPLE", "1.0"))
+    slow_query_log_path: str = os.getenv("SLOW_QUERY_LOG", "")
+
+    # /query result cache (src/sql/cache.py): byte budget (0 disables) and per-entry TTL in seconds
+    result_cache_max_bytes: int = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    result_cache_ttl_s: float = float(os.getenv("RESULT_CACHE_TTL_S", "60"))
+
+    # Persistent question→SQL cache for LLM mode (src/nlp/llm_cache.py); empty path disables it.
+    # llm_cache_similarity: 0 = exact matches only, e.g. 0.8 lets close paraphrases reuse an answer.
+    # Entries unused for llm_cache_max_age_s are dropped, and at most llm_cache_max_entries are kept,
+    # least recently used evicted first (0 disables either limit)
+    llm_cache_path: str = os.getenv("LLM_CACHE_PATH", "data/llm_cache.db")
+    llm_cache_similarity: float = float(os.getenv("LLM_CACHE_SIMILARITY", "0"))
+    llm_cache_max_age_s: float = float(os.getenv("LLM_CACHE_MAX_AGE_S", str(30 * 24 * 3600)))
+    llm_cache_max_entries: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+
+    # LLM prompt (src/nlp/pipeline.py): only the tables/columns the question needs (src/nlp/schema_context.py)
+    # and the llm_fewshots most similar examples (0 = all of them) follow the static system prompt
+    llm_schema_pruning: bool = os.getenv("LLM_SCHEMA_PRUNING", "true").strip().lower() == "true"
+    llm_fewshots: int = int(os.getenv("LLM_FEWSHOTS", "2"))
+
+    # Per-request routing between the templates and the LLM (src/api/routing.py), with USE_LLM=true:
+    # llm_routing "hybrid" answers questions the templates match with confidence >= router_min_confidence
+    # right away and sends only the rest to the LLM; "llm" sends every question to the LLM.
+    # An LLM answer later than llm_deadline_ms (0 = no deadline) or failing validation falls back to the template.
+    llm_routing: str = os.getenv("LLM_ROUTING", "hybrid").strip().lower()
+    router_min_confidence: float = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.8"))
+    llm_deadline_ms: float = float(os.getenv("LLM_DEADLINE_MS", "3000"))
+
+    # Async /query concurrency (src/api/limits.py)
+    # max_inflight requests run at once, admission_queue more may wait up to admission_timeout_s, the rest get 503
+    max_inflight: int = int(os.getenv("MAX_INFLIGHT", "64"))
+    admission_queue: int = int(os.getenv("ADMISSION_QUEUE", "128"))
+    admission_timeout_s: float = float(os.getenv("ADMISSION_TIMEOUT_S", "2.0"))
+    llm_concurrency: int = int(os.getenv("LLM_CONCURRENCY", "16"))      # simultaneous LLM calls
+    db_workers: int = int(os.getenv("DB_WORKERS", "8"))                 # SQLite executor threads
+    db_concurrency: int = int(os.getenv("DB_CONCURRENCY", "0"))         # 0 = same as db_workers
+
+    # /query/stream: rows fetched from the cursor per chunk, and exports streamed at once (more get 503)
+    stream_chunk_rows: int = int(os.getenv("STREAM_CHUNK_ROWS", "2000"))
+    stream_concurrency: int = int(os.getenv("STREAM_CONCURRENCY", "8"))
+
+    # /query/batch: max questions per call
+    batch_max_items: int = int(os.getenv("BATCH_MAX_ITEMS", "100"))
 
     # LLM provider + model (use llm_* to avoid Pydantic 'model_' namespace warning)
     llm_provider: str | None = os.getenv("MODEL_PROVIDER")          # e.g., "openai"
     llm_model: str | None = os.getenv("MODEL_NAME")                 # e.g., "gpt-4o-mini"
+    llm_base_url: str | None = os.getenv("OPENAI_BASE_URL")         # OpenAI-compatible endpoint; None = api.openai.com
 
     # Secrets / flags
     openai_api_key: str | None = os.getenv("OPENAI_API_KEY")
@@ -0,0 +1,196 @@
+# In-process instrumentation: request traces, counters and latency histograms, no extra dependency.
+#
+# - span("stage") times a block. The duration goes into the stage_duration_seconds histogram and,
+#   when a request trace is active (see start_trace, used by the API middleware), into that trace,
+#   which the API turns into a Server-Timing header. The trace lives in a contextvar, so spans
+#   recorded in asyncio.to_thread / Limits.run_db workers land in the right request.
+# - Counter / Histogram are labeled, thread-safe and rendered in the Prometheus text format
+#   (exposition 0.0.4) by render(), which the API serves at /metrics.
+# - Cost when nothing scrapes: one perf_counter pair, a dict lookup and a lock per span.
+
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_SIZE_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000)
+
+
+def _labels_text(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = (f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+             for n, v in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+def _num(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._lock = Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labels)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels_text(self.labels, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """A value read at scrape time from `fn` (-> {label tuple: value}, or a number without labels)."""
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, labels=()):
+        super().__init__(name, help, labels)
+        self._fn = fn
+
+    def _samples(self):
+        out = self._fn()
+        items = out.items() if isinstance(out, dict) else [((), out)]
+        return [f"{self.name}{_labels_text(self.labels, k)} {_num(v)}" for k, v in sorted(items)]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=_LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series: dict[tuple, list] = {}    # key -> [per-bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = next(i for i, b in enumerate(self.buckets) if value <= b)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((k, list(s)) for k, s in self._series.items())
+        lines = []
+        for key, s in items:
+            cumulative = 0
+            for b, n in zip(self.buckets, s):
+                cumulative += n
+                labels = _labels_text(self.labels + ("le",), key + (_num(b),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labels, key)} {s[-2]!r}")
+            lines.append(f"{self.name}_count{_labels_text(self.labels, key)} {s[-1]}")
+        return lines
+
+
+_REGISTRY: list[_Metric] = []
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    return "\n".join(line for m in list(_REGISTRY) for line in m.render()) + "\n"
+
+
+# --- the application's metrics -------------------------------------------------------------------
+
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency.", ("route", "status"))
+STAGE_LATENCY = Histogram("stage_duration_seconds", "Time spent per pipeline stage.", ("stage",))
+RESULT_CACHE = Counter("result_cache_requests_total", "Result cache lookups by outcome.", ("status",))
+LLM_CACHE = Counter("llm_cache_requests_total", "LLM question->SQL cache lookups by outcome.", ("status",))
+LLM_COALESCED = Counter("llm_coalesced_total", "LLM generations that joined an identical in-flight call.")
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the LLM API.", ("kind",))
+LLM_PROMPT_TOKENS = Histogram("llm_prompt_tokens", "Prompt tokens per LLM request.",
+                              buckets=(128, 256, 512, 1024, 2048, 4096, 8192, 16384))
+ROUTER_DECISIONS = Counter("router_decisions_total", "Generation route chosen per request, and why.",
+                           ("route", "reason"))
+ROUTE_LATENCY = Histogram("route_duration_seconds", "SQL generation time per route.", ("route",))
+QUERY_COST = Histogram("query_cost_estimate_rows", "Estimated rows visited per cost-checked statement.", ("by",),
+                       buckets=(1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9, 1e10))
+ROWS_RETURNED = Histogram("rows_returned", "Rows returned per executed statement.", buckets=_SIZE_BUCKETS)
+QUERY_ERRORS = Counter("query_errors_total", "Failed statements by kind.", ("kind",))
+SLOW_QUERIES = Counter("slow_queries_total", "Requests over the slow-query threshold (logged or not).")
+
+
+# --- traces --------------------------------------------------------------------------------------
+
+class Trace:
+    """Stage durations (ms) of one request, in first-seen order; repeated stages add up."""
+
+    __slots__ = ("stages", "started")
+
+    def __init__(self):
+        self.stages: dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage: str, ms: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={ms:.2f}" for name, ms in self.stages.items()]
+        parts.append(f"total;dur={self.total_ms():.2f}")
+        return ", ".join(parts)
+
+
+_TRACE: ContextVar[Trace | None] = ContextVar("trace", default=None)
+
+
+def start_trace() -> Trace:
+    trace = Trace()
+    _TRACE.set(trace)
+    return trace
+
+
+def current_trace() -> Trace | None:
+    return _TRACE.get()
+
+
+@contextmanager
+def span(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_LATENCY.observe(elapsed, stage=stage)
+        trace = _TRACE.get()
+        if trace is not None:
+            trace.add(stage, elapsed * 1000)
@@ -0,0 +1,66 @@
+# Requests/sec of run_sql_safe: one engine per call (old behaviour) vs the shared pooled engine.
+# Run: python -m src.db._bench_engine [--threads 8] [--seconds 5]
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, text
+
+from src.core.config import get_settings
+from src.nlp.pipeline import generate_sql
+from src.sql.runner import _validate_sql, run_sql_safe
+
+QUESTIONS = [
+    "top 5 customers by total spend",
+    "total revenue by product in 2024",
+    "average order value",
+]
+
+
+def _legacy_run(sql: str):
+    # what run_sql_safe did before the engine registry: build an engine for every request
+    _validate_sql(sql)
+    engine = create_engine(f"sqlite:///{get_settings().sqlite_path}")
+    with engine.connect() as conn:
+        result = conn.execute(text(sql))
+        rows = result.fetchall()
+        cols = list(result.keys())
+    engine.dispose()
+    return cols, [list(r) for r in rows]
+
+
+def _measure(fn, sqls, threads: int, seconds: float) -> float:
+    deadline = time.perf_counter() + seconds
+
+    def worker(i: int) -> int:
+        n = 0
+        while time.perf_counter() < deadline:
+            fn(sqls[(i + n) % len(sqls)])
+            n += 1
+        return n
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        total = sum(pool.map(worker, range(threads)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    args = ap.parse_args()
+
+    sqls = [generate_sql(q, limit=10) for q in QUESTIONS]
+    run_sql_safe(sqls[0])  # warm the pool once so both sides start from an imported, parsed state
+
+    before = _measure(_legacy_run, sqls, args.threads, args.seconds)
+    after = _measure(run_sql_safe, sqls, args.threads, args.seconds)
+    print(f"threads={args.threads} seconds={args.seconds}")
+    print(f"engine per request : {before:8.1f} req/s")
+    print(f"shared pooled (ro) : {after:8.1f} req/s  ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# Reload speed: the old pandas to_sql path vs the chunked executemany loader in load_csvs.py.
+# Synthetic CSVs are produced by replicating data/real with shifted ids, in a temp directory;
+# the real data/retail.db is never touched.
+# Run: python -m src.db._bench_load [--scale 50]
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import create_engine
+
+from src.db import load_csvs
+
+ID_COLS = {
+    "customers": ["customer_id"],
+    "products": ["product_id"],
+    "orders": ["order_id", "customer_id"],
+    "order_items": ["order_item_id", "order_id", "product_id"],
+}
+# id ranges per table, so replicated copies never collide
+SPAN = {"customer_id": 10**6, "product_id": 10**6, "order_id": 10**7, "order_item_id": 10**8}
+
+
+def _make_csvs(src: Path, out: Path, scale: int) -> dict[str, int]:
+    counts = {}
+    for fname, table in load_csvs.FILES.items():
+        base = pd.read_csv(src / fname)
+        # dimension tables stay small; fact tables grow with the scale
+        reps = scale if table in ("orders", "order_items") else 1
+        parts = []
+        for k in range(reps):
+            df = base.copy()
+            for col in ID_COLS[table]:
+                if col in ("order_id", "order_item_id"):
+                    df[col] = df[col] + k * (SPAN[col] // max(scale, 1))
+            parts.append(df)
+        big = pd.concat(parts, ignore_index=True)
+        big.to_csv(out / fname, index=False)
+        counts[table] = len(big)
+    return counts
+
+
+def _legacy_coerce(df: pd.DataFrame, table: str) -> pd.DataFrame:
+    # the previous per-column dtype coercion of whole DataFrames
+    for col, dt in load_csvs.DTYPES.get(table, {}).items():
+        if col in df.columns:
+            if dt.startswith("Int"):
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype(dt)
+            elif dt == "float64":
+                df[col] = pd.to_numeric(df[col], errors="coerce")
+            else:
+                df[col] = df[col].astype(dt)
+    return df
+
+
+def _legacy_load(db_path: str, data_dir: Path):
+    # the previous load_csvs.main(): full read_csv, per-column coercion, df.to_sql, indexes in the same txn
+    engine = create_engine(f"sqlite:///{db_path}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("PRAGMA foreign_keys = OFF;")
+        for t in ["order_items", "orders", "products", "customers"]:
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {t};")
+        for fname, table in load_csvs.FILES.items():
+            df = _legacy_coerce(pd.read_csv(data_dir / fname), table)
+            df.to_sql(table, con=conn, if_exists="replace", index=False)
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders(customer_id);")
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id);")
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items(product_id);")
+        conn.exec_driver_sql("PRAGMA foreign_keys = ON;")
+    engine.dispose()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scale", type=int, default=50, help="copies of orders/order_items")
+    ap.add_argument("--chunk-rows", type=int, default=load_csvs.CHUNK_ROWS)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        counts = _make_csvs(load_csvs.DATA_DIR, tmp, args.scale)
+        total = sum(counts.values())
+        print("rows:", counts)
+
+        t0 = time.perf_counter()
+        _legacy_load(str(tmp / "legacy.db"), tmp)
+        legacy = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        load_csvs.main(str(tmp / "chunked.db"), tmp, args.chunk_rows)
+        chunked = time.perf_counter() - t0
+
+    print(f"\npandas to_sql  : {legacy:7.2f}s  {total / legacy:12,.0f} rows/s")
+    print(f"chunked loader : {chunked:7.2f}s  {total / chunked:12,.0f} rows/s  ({legacy / chunked:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
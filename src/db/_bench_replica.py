@@ -0,0 +1,111 @@
+# File-backed pooled engine vs the in-memory replica (Settings.sqlite_in_memory), then a hot refresh.
+#   1) run_sql_safe latency per statement, median / p95 / p99 over the template questions
+#   2) a write to the file shows up in the replica after the next poll, with a new generation,
+#      and reads keep working throughout
+#   3) the replica refuses writes like the file engine does (query_only)
+# Works on a synthetic database in a temp dir (data/retail.db is never touched).
+# Run: python -m src.db._bench_replica [--sf 0.1] [--repeat 30]
+
+import argparse
+import contextlib
+import io
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import sqlite3
+from sqlalchemy import text
+
+from src.core.config import get_settings
+from src.db import synth
+from src.db.engine import db_version, dispose_engines, get_engine
+from src.nlp.pipeline import generate_statement
+from src.sql.runner import run_sql_safe
+
+QUESTIONS = [
+    "top 5 customers by total spend",
+    "total revenue by product in 2024",
+    "orders by customer",
+    "average order value in 2025",
+    "daily sales in 2024",
+    "biggest orders",
+]
+
+
+def _latencies(statements, repeat: int) -> list[float]:
+    for sql, params in statements:                       # warm-up: pool, page cache, guardrail LRU
+        run_sql_safe(sql, params=params)
+    out = []
+    for _ in range(repeat):
+        for sql, params in statements:
+            t0 = time.perf_counter()
+            run_sql_safe(sql, params=params)
+            out.append((time.perf_counter() - t0) * 1000)
+    return sorted(out)
+
+
+def _pct(s: list[float], p: float) -> float:
+    return s[min(len(s) - 1, int(round(p * (len(s) - 1))))]
+
+
+def _orders() -> int:
+    return run_sql_safe("SELECT COUNT(*) FROM orders")[1][0][0]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sf", type=float, default=0.1)
+    ap.add_argument("--repeat", type=int, default=30)
+    args = ap.parse_args()
+    settings = get_settings()
+    saved = settings.model_copy()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = str(Path(tmp) / "replica_bench.db")
+            with contextlib.redirect_stdout(io.StringIO()):
+                synth.generate(db, args.sf)
+            settings.sqlite_path = db
+            statements = [generate_statement(q, 10, use_rollups=False) for q in QUESTIONS]
+
+            print(f"SF{args.sf:g}, {len(statements)} statements x {args.repeat}")
+            for label, in_memory in [("file (mmap, pooled)", False), ("in-memory replica", True)]:
+                dispose_engines()
+                settings.sqlite_in_memory = in_memory
+                settings.replica_refresh_s = 0.2
+                t0 = time.perf_counter()
+                get_engine()
+                setup = (time.perf_counter() - t0) * 1000
+                s = _latencies(statements, args.repeat)
+                print(f"  {label:<20} median {statistics.median(s):7.2f} ms  p95 {_pct(s, 0.95):7.2f} ms  "
+                      f"p99 {_pct(s, 0.99):7.2f} ms  (engine ready in {setup:.0f} ms)")
+
+            # hot refresh: still in in-memory mode
+            before, gen = _orders(), db_version()
+            with sqlite3.connect(db) as w:
+                w.execute("INSERT INTO orders (order_id, customer_id, order_date) "
+                          "SELECT MAX(order_id) + 1, 1, '2025-12-31' FROM orders")
+            t0 = time.perf_counter()
+            reads = 0
+            while _orders() == before:
+                reads += 1
+                if time.perf_counter() - t0 > 10:
+                    raise SystemExit("replica was not refreshed within 10 s")
+            print(f"refresh: orders {before} -> {_orders()} visible after {(time.perf_counter() - t0) * 1000:.0f} ms "
+                  f"({reads} reads served meanwhile), version {gen} -> {db_version()}")
+
+            try:
+                with get_engine().connect() as conn:
+                    conn.execute(text("DELETE FROM orders"))
+                print("write allowed?!")
+            except Exception as e:
+                print("write refused:", str(e).splitlines()[0])
+    finally:
+        dispose_engines()
+        for name, value in saved.model_dump().items():
+            setattr(settings, name, value)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Rollup correctness check: every rollup-backed answer must equal the base-table answer.
+# Builds a temp database from data/real (the real data/retail.db is never touched), compares
+# generate_sql(use_rollups=True) with use_rollups=False for each intent and year, routes some
+# LLM-style statements through src/sql/rollup_router.py, then appends rows and re-checks after an
+# incremental load.
+# Run: python -m src.db._demo_rollups
+
+import math
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from src.core.config import get_settings
+from src.db import load_csvs
+from src.db.engine import dispose_engines
+from src.nlp.pipeline import generate_sql
+from src.sql.rollup_router import route_to_rollup
+from src.sql.runner import run_sql_safe
+
+QUESTIONS = [
+    "top customers by spend",
+    "revenue by product",
+    "average order value",
+    "daily sales",
+]
+YEARS = ["", " in 2024", " in 2025"]
+
+LLM_STYLE = [
+    """SELECT p.category, ROUND(SUM(oi.quantity * p.price), 2) AS revenue, SUM(oi.quantity) AS units
+       FROM orders o JOIN order_items oi ON o.order_id = oi.order_id
+       JOIN products p ON oi.product_id = p.product_id
+       WHERE o.order_date >= '2024-01-01' GROUP BY p.category ORDER BY revenue DESC""",
+    """SELECT c.city, SUM(p.price * oi.quantity) AS spend
+       FROM customers c JOIN orders o ON o.customer_id = c.customer_id
+       JOIN order_items oi ON oi.order_id = o.order_id JOIN products p ON p.product_id = oi.product_id
+       GROUP BY c.city HAVING spend > 0 ORDER BY spend DESC LIMIT 5""",
+    """SELECT strftime('%Y-%m', o.order_date) AS month, ROUND(SUM(oi.quantity * p.price), 2) AS revenue
+       FROM order_items oi JOIN orders o ON oi.order_id = o.order_id JOIN products p ON oi.product_id = p.product_id
+       GROUP BY month ORDER BY month""",
+    """SELECT SUM(quantity * price) FROM orders o JOIN order_items oi ON o.order_id = oi.order_id
+       JOIN products p ON oi.product_id = p.product_id WHERE strftime('%Y', order_date) = '2025'""",
+]
+# must be left alone: per-order grain, outer join, non-additive aggregate
+NOT_ROUTABLE = [
+    """SELECT o.order_id, SUM(oi.quantity * p.price) FROM orders o JOIN order_items oi ON o.order_id = oi.order_id
+       JOIN products p ON oi.product_id = p.product_id GROUP BY o.order_id""",
+    """SELECT p.name, SUM(oi.quantity * p.price) FROM products p LEFT JOIN order_items oi ON oi.product_id = p.product_id
+       JOIN orders o ON oi.order_id = o.order_id GROUP BY p.name""",
+    """SELECT p.name, AVG(oi.quantity * p.price) FROM orders o JOIN order_items oi ON o.order_id = oi.order_id
+       JOIN products p ON oi.product_id = p.product_id GROUP BY p.name""",
+]
+
+
+def _norm(rows) -> list[tuple]:
+    out = []
+    for r in rows:
+        out.append(tuple(round(v, 2) if isinstance(v, float) else v for v in r))
+    return sorted(out, key=repr)
+
+
+def _same(a, b) -> bool:
+    a, b = _norm(a), _norm(b)
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        for u, v in zip(x, y):
+            if isinstance(u, float) or isinstance(v, float):
+                if not math.isclose(u or 0, v or 0, abs_tol=0.011):
+                    return False
+            elif u != v:
+                return False
+    return True
+
+
+def _timed(sql: str):
+    t0 = time.perf_counter()
+    _, rows = run_sql_safe(sql)
+    return rows, (time.perf_counter() - t0) * 1000
+
+
+def check() -> int:
+    failures = 0
+    for q in QUESTIONS:
+        for y in YEARS:
+            question = q + y
+            base, t_base = _timed(generate_sql(question, limit=None, use_rollups=False))
+            fast, t_fast = _timed(generate_sql(question, limit=None, use_rollups=True))
+            ok = _same(base, fast)
+            failures += not ok
+            print(f"{'ok ' if ok else 'BAD'} {question:<34} {len(base):5} rows  base {t_base:7.2f} ms  rollup {t_fast:7.2f} ms")
+
+    for sql in LLM_STYLE:
+        routed = route_to_rollup(sql)
+        if routed is None:
+            failures += 1
+            print("BAD not routed:", " ".join(sql.split())[:80])
+            continue
+        base, t_base = _timed(sql)
+        fast, t_fast = _timed(routed)
+        ok = _same(base, fast)
+        failures += not ok
+        print(f"{'ok ' if ok else 'BAD'} llm {' '.join(sql.split())[:40]:<40} base {t_base:7.2f} ms  rollup {t_fast:7.2f} ms")
+
+    for sql in NOT_ROUTABLE:
+        if route_to_rollup(sql) is not None:
+            failures += 1
+            print("BAD routed:", " ".join(sql.split())[:80])
+    return failures
+
+
+def main():
+    settings = get_settings()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        data = tmp / "csv"
+        shutil.copytree(load_csvs.DATA_DIR, data)
+        db = str(tmp / "rollups.db")
+        load_csvs.main(db, data)
+        settings.sqlite_path = db
+
+        print("\n-- full load")
+        failures = check()
+
+        # move one existing order to a new day and append a new order with an item
+        with open(data / "orders.csv", "a") as f:
+            f.write("1000,448,2025-12-31\n99999,2,2025-12-30\n")
+        with open(data / "order_items.csv", "a") as f:
+            f.write("999999,99999,1,3\n")
+        dispose_engines()
+        load_csvs.incremental(db, data)
+
+        print("\n-- after incremental load")
+        failures += check()
+        dispose_engines()
+
+    print(f"\n{'all rollup answers match' if not failures else f'{failures} mismatches'}")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# One shared, read-only SQLAlchemy engine per SQLite file.
+#
+# Before this module every request called create_engine() itself (runner + schema helpers),
+# which meant a fresh engine, a fresh file open and a cold page cache on every /query.
+# Now all readers go through get_engine(), which hands back the same pooled engine for a given path.
+# With Settings.sqlite_in_memory that engine reads an in-memory replica of the file instead (see below).
+
+import itertools
+import logging
+import os
+import sqlite3
+from functools import lru_cache
+from pathlib import Path
+from threading import Event, Lock, Thread
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from src.core.config import get_settings
+
+# registry: resolved sqlite path -> Engine
+_ENGINES: dict[str, Engine] = {}
+_LOCK = Lock()
+
+
+def _apply_read_pragmas(dbapi_conn, _record):
+    """
+    Tune every new pooled connection for read-heavy analytics.
+    query_only makes the connection refuse writes even if mode=ro were ever dropped.
+    """
+    s = get_settings()
+    cur = dbapi_conn.cursor()
+    cur.execute(f"PRAGMA mmap_size = {int(s.sqlite_mmap_size)};")      # memory-map the file, fewer read() syscalls
+    cur.execute(f"PRAGMA cache_size = {int(s.sqlite_cache_size)};")    # bigger page cache per connection
+    cur.execute("PRAGMA temp_store = MEMORY;")                         # GROUP BY / ORDER BY temp b-trees stay in RAM
+    cur.execute("PRAGMA query_only = ON;")                             # belt and braces on top of mode=ro
+    cur.close()
+
+
+def _build_engine(path: str, url: str | None = None) -> Engine:
+    s = get_settings()
+    # mode=ro opens the file read-only at the OS level; uri=true tells pysqlite to treat it as a URI.
+    url = url or f"sqlite:///file:{path}?mode=ro&uri=true"
+    engine = create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=s.sqlite_pool_size,          # connections kept open between requests
+        max_overflow=s.sqlite_pool_overflow,   # short bursts above pool_size, closed afterwards
+        pool_timeout=30,
+        pool_pre_ping=False,                   # local file, nothing to ping
+        # a pooled connection is only ever used by one thread at a time,
+        # but it may be a different thread from the one that opened it
+        connect_args={"check_same_thread": False},
+    )
+    event.listen(engine, "connect", _apply_read_pragmas)
+    return engine
+
+
+@lru_cache(maxsize=64)
+def _resolve(path: str) -> str:
+    return Path(path).resolve().as_posix()
+
+
+def get_engine(path: str | None = None) -> Engine:
+    """
+    Return the process-wide read-only engine for `path` (defaults to Settings.sqlite_path).
+    The engine is created on first use and reused afterwards.
+    In in-memory mode it is the current replica's engine, which changes when a refresh swaps one in.
+    """
+    key = _resolve(path or get_settings().sqlite_path)
+    if get_settings().sqlite_in_memory:
+        return _replica(key).engine
+    engine = _ENGINES.get(key)
+    if engine is not None:
+        return engine
+    with _LOCK:
+        # double-checked so two threads racing on the first request build only one engine
+        engine = _ENGINES.get(key)
+        if engine is None:
+            engine = _build_engine(key)
+            _ENGINES[key] = engine
+    return engine
+
+
+def dispose_engines() -> None:
+    """Close every pooled connection (e.g. after a reload, or at shutdown)."""
+    with _LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose()
+        _ENGINES.clear()
+        for conn, _ in _MONITORS.values():
+            conn.close()
+        _MONITORS.clear()
+    with _REPLICA_LOCK:
+        replicas = list(_REPLICAS.values())
+        _REPLICAS.clear()
+    for replica in replicas:
+        replica.close()
+
+
+# --- change detection -------------------------------------------------------------------------
+# PRAGMA data_version is per connection: it only moves when *another* connection commits.
+# So each database gets one long-lived "monitor" connection that we never write through;
+# polling it tells us whether anyone (this process or e.g. a load_csvs run) changed the data.
+# The file stat (inode, size, mtime, plus the -wal file) covers the file being replaced outright.
+
+_MONITORS: dict[str, tuple[sqlite3.Connection, Lock]] = {}
+
+
+def _stat_sig(path: str) -> tuple:
+    sig = []
+    for p in (path, path + "-wal"):
+        try:
+            st = os.stat(p)
+            sig.extend((st.st_ino, st.st_size, st.st_mtime_ns))
+        except FileNotFoundError:
+            sig.extend((0, 0, 0))
+    return tuple(sig)
+
+
+def db_version(path: str | None = None) -> tuple:
+    """
+    Cheap token that changes whenever the database contents change.
+    Use it as a cache-key component so cached results go stale on reload.
+    In in-memory mode it follows the served replica, not the file: results stay valid until the swap.
+    """
+    key = _resolve(path or get_settings().sqlite_path)
+    if get_settings().sqlite_in_memory:
+        return ("replica", _replica(key).generation)
+    return _file_version(key)
+
+
+def _file_version(key: str) -> tuple:
+    mon = _MONITORS.get(key)
+    if mon is None:
+        with _LOCK:
+            mon = _MONITORS.get(key)
+            if mon is None:
+                conn = sqlite3.connect(f"file:{key}?mode=ro", uri=True, check_same_thread=False)
+                mon = _MONITORS[key] = (conn, Lock())
+    conn, lock = mon
+    with lock:
+        data_version = conn.execute("PRAGMA data_version;").fetchone()[0]
+    return (data_version, *_stat_sig(key))
+
+
+# --- in-memory replica --------------------------------------------------------------------------
+# Settings.sqlite_in_memory: the file is copied into a shared-cache in-memory database with the sqlite3
+# backup API (one step, so the copy is a consistent snapshot even while a load is writing), and every
+# reader is served from that copy: no file I/O, no page-cache misses. The pooled connections get the same
+# read PRAGMAs as file connections, query_only included, and the runner's guardrails are unchanged.
+# A daemon thread polls the file's version token every replica_refresh_s; when a load_csvs run (or a
+# replaced file) moves it, a fresh replica is built off to the side and swapped in with a single
+# assignment. The previous generation stays open until the next swap, so a request that picked up
+# the old engine just before the swap still finds its data.
+
+log = logging.getLogger(__name__)
+_REPLICAS: dict[str, "Replica"] = {}
+_REPLICA_LOCK = Lock()     # not _LOCK: the first copy opens a monitor connection, which takes _LOCK
+_GENERATIONS = itertools.count(1)
+
+
+class Replica:
+    def __init__(self, path: str):
+        self.path = path
+        self.generation = 0
+        self.source_version: tuple | None = None
+        self.engine: Engine | None = None
+        self._keeper: sqlite3.Connection | None = None       # keeps the in-memory database alive
+        self._retired: tuple[Engine, sqlite3.Connection] | None = None
+        self._swap_lock = Lock()
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def refresh(self) -> bool:
+        """Copy the file into a new in-memory database and swap it in. False if the file hasn't changed."""
+        with self._swap_lock:
+            version = _file_version(self.path)   # read before copying: a write during the copy triggers another round
+            if version == self.source_version:
+                return False
+            generation = next(_GENERATIONS)
+            name = f"replica_{os.getpid()}_{generation}"
+            keeper = sqlite3.connect(f"file:{name}?mode=memory&cache=shared", uri=True, check_same_thread=False)
+            source = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            try:
+                source.backup(keeper)
+            except Exception:
+                keeper.close()
+                raise
+            finally:
+                source.close()
+            engine = _build_engine(self.path, f"sqlite:///file:{name}?mode=memory&cache=shared&uri=true")
+
+            retired = self._retired
+            self._retired = (self.engine, self._keeper) if self.engine is not None else None
+            self.engine, self._keeper = engine, keeper
+            self.source_version, self.generation = version, generation
+        if retired is not None:
+            retired[0].dispose()
+            retired[1].close()
+        return True
+
+    def start(self, interval_s: float) -> None:
+        if interval_s > 0 and self._thread is None:
+            self._thread = Thread(target=self._poll, args=(interval_s,), name="sqlite-replica", daemon=True)
+            self._thread.start()
+
+    def _poll(self, interval_s: float) -> None:
+        while not self._stop.wait(interval_s):
+            try:
+                if self.refresh():
+                    log.info("replica of %s refreshed (generation %d)", self.path, self.generation)
+            except Exception:
+                log.exception("replica refresh of %s failed; still serving generation %d", self.path, self.generation)
+
+    def close(self) -> None:
+        self._stop.set()
+        with self._swap_lock:
+            for pair in (self._retired, (self.engine, self._keeper)):
+                if pair and pair[0] is not None:
+                    pair[0].dispose()
+                    pair[1].close()
+            self._retired = None
+            self.engine = self._keeper = None
+
+
+def _replica(key: str) -> Replica:
+    replica = _REPLICAS.get(key)
+    if replica is not None:
+        return replica
+    with _REPLICA_LOCK:
+        replica = _REPLICAS.get(key)
+        if replica is None:
+            replica = Replica(key)
+            replica.refresh()
+            replica.start(get_settings().replica_refresh_s)
+            _REPLICAS[key] = replica
+    return replica
+
+
+def refresh_replica(path: str | None = None) -> bool:
+    """Re-copy the file now instead of waiting for the poll (e.g. right after a load). False if unchanged."""
+    return _replica(_resolve(path or get_settings().sqlite_path)).refresh()
@@ -1,11 +1,20 @@
-from sqlalchemy import create_engine
-import pandas as pd
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+from collections import Counter
 from pathlib import Path
 
+import pandas as pd
+
+from src.db.rollups import ROLLUP_TABLES, drop_rollups, refresh_rollups
+
 DB_PATH = "data/retail.db"           # where the SQLite file lives
 DATA_DIR = Path("data/real")         # where your CSVs are stored
+CHUNK_ROWS = 100_000                 # rows read from a CSV and inserted per batch
 
-# Map CSV file names → target table names
+# Map CSV file names → target table names (parents first, so the load order is FK-friendly)
 FILES = {
     "customers.csv": "customers",
     "products.csv": "products",
@@ -13,7 +22,8 @@ FILES = {
     "order_items.csv": "order_items",
 }
 
-# Friendly dtype coercions so SQLite types are predictable
+# Friendly dtype coercions so SQLite types are predictable. A value that doesn't parse becomes NULL; rows where
+# that leaves a NOT NULL column (or the primary key) empty are skipped and counted, see REQUIRED below.
 DTYPES = {
     "customers": {"customer_id": "Int64", "name": "string", "city": "string", "join_date": "string"},
     "products":  {"product_id": "Int64", "name": "string", "category": "string", "price": "float64"},
@@ -21,49 +31,455 @@ DTYPES = {
     "order_items": {"order_item_id": "Int64", "order_id": "Int64", "product_id": "Int64", "quantity": "Int64"},
 }
 
-def main():
-    engine = create_engine(f"sqlite:///{DB_PATH}")
-    with engine.begin() as conn:
-        
-        # 1) turn off FKs to make dropping/reloading tables simple & atomic
-        conn.exec_driver_sql("PRAGMA foreign_keys = OFF;")
-        
-        # 2) drop existing tables so the load is repeatable
-        for t in ["order_items","orders","products","customers"]:
-            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {t};")
-        
-        # 3) load every CSV into its table
+# Typed tables with real primary keys, created up front (same schema as seed_db.py)
+# instead of letting pandas infer BIGINT/FLOAT columns without keys.
+TABLE_DDL = {
+    "customers": """
+        CREATE TABLE customers (
+            customer_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            city TEXT,
+            join_date TEXT
+        );""",
+    "products": """
+        CREATE TABLE products (
+            product_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            category TEXT,
+            price REAL NOT NULL
+        );""",
+    "orders": """
+        CREATE TABLE orders (
+            order_id INTEGER PRIMARY KEY,
+            customer_id INTEGER NOT NULL,
+            order_date TEXT NOT NULL,
+            FOREIGN KEY(customer_id) REFERENCES customers(customer_id)
+        );""",
+    "order_items": """
+        CREATE TABLE order_items (
+            order_item_id INTEGER PRIMARY KEY,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            FOREIGN KEY(order_id) REFERENCES orders(order_id),
+            FOREIGN KEY(product_id) REFERENCES products(product_id)
+        );""",
+}
+
+# Columns a row can't be loaded without: the NOT NULL columns of TABLE_DDL plus the primary key (a NULL
+# INTEGER PRIMARY KEY would silently get a fresh rowid). Rows missing one, e.g. quantity "two", are skipped
+# and reported per table instead of failing the whole load on a constraint error.
+REQUIRED = {
+    "customers": ("customer_id", "name"),
+    "products": ("product_id", "name", "price"),
+    "orders": ("order_id", "customer_id", "order_date"),
+    "order_items": ("order_item_id", "order_id", "product_id", "quantity"),
+}
+
+# Primary key of each table: the watermark column for incremental loads
+PKS = {"customers": "customer_id", "products": "product_id", "orders": "order_id", "order_items": "order_item_id"}
+
+# What each CSV looked like when it was last ingested. Tables starting with "_" are internal
+# and never shown to the LLM (see src/db/schema.py).
+MANIFEST_DDL = """
+CREATE TABLE IF NOT EXISTS _ingest_manifest (
+    file TEXT PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    ends_with_newline INTEGER NOT NULL,
+    loaded_at REAL NOT NULL
+);"""
+
+# Secondary indexes, built only after every row is in (one sorted build beats incremental b-tree inserts)
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders(customer_id);",
+    "CREATE INDEX IF NOT EXISTS idx_orders_date ON orders(order_date);",
+    "CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id);",
+    "CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items(product_id);",
+]
+
+# Load-time PRAGMAs: WAL so readers keep using the old snapshot while we write,
+# no fsync per commit, a big page cache and in-memory temp b-trees for the index builds.
+LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = OFF;",
+    "PRAGMA cache_size = -262144;",       # 256 MiB
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA foreign_keys = OFF;",         # parents/children arrive in separate batches
+]
+
+
+def _column_values(series: pd.Series, dt: str | None) -> list:
+    # Column-at-a-time conversion to plain Python values for sqlite3 (NaN / pd.NA → None).
+    # The common case (the CSV parser already inferred the right type, no missing values) is a single
+    # C-level tolist(); only dirty columns fall back to the slower coercion path.
+    if dt is not None and dt.startswith("Int"):
+        if pd.api.types.is_integer_dtype(series.dtype):
+            return series.tolist()
+        vals = pd.to_numeric(series, errors="coerce").tolist()
+        return [None if v != v else int(v) for v in vals]
+    if dt == "float64":
+        if not pd.api.types.is_numeric_dtype(series.dtype):
+            series = pd.to_numeric(series, errors="coerce")
+        vals = series.tolist()
+    else:
+        if series.dtype != object:
+            series = series.astype(str).where(series.notna())
+        vals = series.tolist()
+    if series.isna().any():
+        vals = [None if v is None or v != v else v for v in vals]
+    return vals
+
+
+def _to_tuples(df: pd.DataFrame, table: str) -> list[tuple]:
+    types = DTYPES.get(table, {})
+    return list(zip(*(_column_values(df[c], types.get(c)) for c in df.columns)))
+
+
+def _complete_rows(table: str, cols: list[str], rows: list[tuple], skipped: Counter | None) -> list[tuple]:
+    idx = [cols.index(c) for c in REQUIRED.get(table, ()) if c in cols]
+    good = [r for r in rows if all(r[i] is not None for i in idx)]
+    if skipped is not None and len(good) < len(rows):
+        skipped[table] += len(rows) - len(good)
+    return good
+
+
+def iter_csv_chunks(fp: Path, table: str, chunk_rows: int = CHUNK_ROWS, skipped: Counter | None = None):
+    """
+    Yield (columns, rows) batches from a CSV without ever holding the whole file in memory.
+    Rows missing a REQUIRED value are left out and counted in `skipped[table]`.
+    """
+    for df in pd.read_csv(fp, chunksize=chunk_rows):
+        cols = list(df.columns)
+        yield cols, _complete_rows(table, cols, _to_tuples(df, table), skipped)
+
+
+def _report_skipped(skipped: Counter) -> None:
+    for table, n in skipped.items():
+        print(f"⚠️  skipped {n:,} {table} rows with a missing or unparseable required value ({', '.join(REQUIRED[table])})")
+
+
+def insert_sql(table: str, cols: list[str], verb: str = "INSERT") -> str:
+    col_list = ", ".join(cols)
+    marks = ", ".join("?" for _ in cols)
+    return f"{verb} INTO {table} ({col_list}) VALUES ({marks});"
+
+
+def connect_for_load(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, isolation_level=None)   # we issue BEGIN/COMMIT ourselves
+    for p in LOAD_PRAGMAS:
+        conn.execute(p)
+    return conn
+
+
+def build_indexes(conn: sqlite3.Connection) -> None:
+    for stmt in INDEXES:
+        conn.execute(stmt)
+
+
+# --- manifest helpers -------------------------------------------------------------------------
+
+def file_digest(fp: Path, upto: int | None = None) -> str:
+    """sha256 of the whole file, or of its first `upto` bytes (streamed, constant memory)."""
+    h = hashlib.sha256()
+    remaining = upto
+    with open(fp, "rb") as f:
+        while remaining is None or remaining > 0:
+            block = f.read(1 << 20 if remaining is None else min(1 << 20, remaining))
+            if not block:
+                break
+            h.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return h.hexdigest()
+
+
+def _file_state(fp: Path) -> dict:
+    st = os.stat(fp)
+    with open(fp, "rb") as f:
+        if st.st_size:
+            f.seek(st.st_size - 1)
+        last = f.read(1)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": file_digest(fp),
+            "ends_with_newline": int(last == b"\n")}
+
+
+def _record(conn: sqlite3.Connection, fname: str, table: str, state: dict) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO _ingest_manifest (file, table_name, size, mtime_ns, sha256, ends_with_newline, loaded_at)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?);",
+        (fname, table, state["size"], state["mtime_ns"], state["sha256"], state["ends_with_newline"], time.time()),
+    )
+
+
+def finish_load(conn: sqlite3.Connection) -> None:
+    """Everything a full load does once the base tables are filled (also used by src/db/synth.py)."""
+    # 4) helpful indexes, built once all the data is in
+    t0 = time.perf_counter()
+    conn.execute("BEGIN;")
+    build_indexes(conn)
+    conn.execute("COMMIT;")
+    print(f"✅ built {len(INDEXES)} indexes in {time.perf_counter() - t0:.2f}s")
+
+    # 5) precomputed aggregates for the common revenue questions (src/db/rollups.py)
+    t0 = time.perf_counter()
+    conn.execute("BEGIN;")
+    drop_rollups(conn)
+    refresh_rollups(conn)
+    conn.execute("COMMIT;")
+    print(f"✅ built rollups in {time.perf_counter() - t0:.2f}s")
+
+    # 6) fold the WAL back into the main file and refresh planner statistics.
+    # A full (sampled) ANALYZE: PRAGMA optimize alone skips tables it has no history for, and without
+    # stats on orders the planner never prefers idx_orders_date for date-range filters.
+    conn.execute("PRAGMA analysis_limit = 1000;")
+    conn.execute("ANALYZE;")
+    conn.execute("PRAGMA optimize;")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+
+
+def main(db_path: str = DB_PATH, data_dir: Path = DATA_DIR, chunk_rows: int = CHUNK_ROWS):
+    conn = connect_for_load(db_path)
+    stats = []
+    skipped = Counter()
+    try:
+        # fingerprint the inputs first, so the manifest describes exactly what we are about to read
+        states = {fname: _file_state(Path(data_dir) / fname) for fname in FILES}
+
+        conn.execute("BEGIN;")
+
+        # 1) drop existing tables so the load is repeatable. The rollups go in the same transaction: they are
+        # rebuilt by finish_load() after this COMMIT, and until then readers must not be routed to aggregates
+        # of the old data (generate_statement only uses rollups while rollups_available()).
+        for t in ["order_items", "orders", "products", "customers"]:
+            conn.execute(f"DROP TABLE IF EXISTS {t};")
+        drop_rollups(conn)
+
+        # 2) create typed tables with primary keys
+        for table in FILES.values():
+            conn.execute(TABLE_DDL[table])
+
+        # 3) stream every CSV into its table in fixed-size chunks
+        for fname, table in FILES.items():
+            t0 = time.perf_counter()
+            n = 0
+            for cols, rows in iter_csv_chunks(Path(data_dir) / fname, table, chunk_rows, skipped):
+                conn.executemany(insert_sql(table, cols), rows)
+                n += len(rows)
+            dt = time.perf_counter() - t0
+            stats.append((table, n, dt))
+            print(f"✅ loaded {n:,} rows into {table} ({n / dt if dt else 0:,.0f} rows/s)")
+
+        # remember what was loaded so --incremental runs can skip unchanged files
+        conn.execute(MANIFEST_DDL)
+        for fname, table in FILES.items():
+            _record(conn, fname, table, states[fname])
+
+        conn.execute("COMMIT;")
+
+        # 4) - 6) indexes, rollups, statistics
+        finish_load(conn)
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK;")
+        raise
+    finally:
+        conn.close()
+
+    _report_skipped(skipped)
+    print(f"🎉 Data loaded into {db_path}")
+    return stats
+
+
+# --- incremental ingestion ----------------------------------------------------------------------
+# Instead of dropping and reloading everything, compare every CSV with the manifest:
+#   unchanged (same size+mtime, or same hash)          → skipped without reading the data
+#   grown, and the old bytes are an unchanged prefix   → only the appended tail is parsed; rows above the
+#                                                        table's primary-key watermark are inserted, rows at
+#                                                        or below it are upserted
+#   anything else (rewritten / truncated)              → that table's rows are replaced
+# All changes land in ONE short write transaction. The database is in WAL mode, so readers
+# (run_sql_safe) keep answering from the previous snapshot and never block; the schema does not
+# change, so the schema cache stays warm and only data_version-keyed result caches roll over.
+# Rollups are refreshed in the same transaction, for the affected order dates only when possible.
+
+def upsert_sql(table: str, cols: list[str]) -> str:
+    pk = PKS[table]
+    updates = ", ".join(f"{c} = excluded.{c}" for c in cols if c != pk)
+    return insert_sql(table, cols)[:-1] + f" ON CONFLICT({pk}) DO UPDATE SET {updates};"
+
+
+def _iter_tail_chunks(fp: Path, table: str, offset: int, chunk_rows: int, skipped: Counter | None = None):
+    # header comes from the top of the file, rows from the bytes appended after `offset`
+    header = pd.read_csv(fp, nrows=0).columns.tolist()
+    with open(fp, "rb") as f:
+        f.seek(offset)
+        for df in pd.read_csv(f, names=header, header=None, chunksize=chunk_rows):
+            yield header, _complete_rows(table, header, _to_tuples(df, table), skipped)
+
+
+class _RollupScope:
+    """
+    Tracks which order dates an incremental load touches, so only those rollup rows are recomputed.
+    Old dates are captured before rows are overwritten (an upsert may move an order to another day).
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        (have,) = conn.execute(
+            f"SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name IN ({','.join('?' * len(ROLLUP_TABLES))});",
+            ROLLUP_TABLES,
+        ).fetchone()
+        # a database loaded before rollups existed gets them built in full on its first incremental run
+        self.full = have < len(ROLLUP_TABLES)
+        self.dates: set[str] = set()
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS _touched_orders (id INTEGER PRIMARY KEY);")
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS _chunk_ids (id INTEGER PRIMARY KEY);")
+        conn.execute("DELETE FROM temp._touched_orders;")
+
+    def _stage(self, ids) -> None:
+        self.conn.execute("DELETE FROM temp._chunk_ids;")
+        self.conn.executemany("INSERT OR IGNORE INTO temp._chunk_ids (id) VALUES (?);",
+                              [(i,) for i in ids if i is not None])
+
+    def before_chunk(self, table: str, cols: list[str], rows: list[tuple]) -> None:
+        if self.full or table not in ("orders", "order_items"):
+            return
+        order_ids = {r[cols.index("order_id")] for r in rows}
+        if table == "order_items":
+            # an upserted item may be moving away from another order
+            self._stage(r[cols.index("order_item_id")] for r in rows)
+            order_ids.update(r[0] for r in self.conn.execute(
+                "SELECT order_id FROM order_items WHERE order_item_id IN (SELECT id FROM temp._chunk_ids);"))
+        self._stage(order_ids)
+        self.dates.update(r[0] for r in self.conn.execute(
+            "SELECT order_date FROM orders WHERE order_id IN (SELECT id FROM temp._chunk_ids);"))
+        self.conn.execute("INSERT OR IGNORE INTO temp._touched_orders SELECT id FROM temp._chunk_ids;")
+
+    def finish(self) -> None:
+        if self.full:
+            refresh_rollups(self.conn)
+            return
+        self.dates.update(r[0] for r in self.conn.execute(
+            "SELECT DISTINCT order_date FROM orders WHERE order_id IN (SELECT id FROM temp._touched_orders);"))
+        refresh_rollups(self.conn, self.dates)
+
+
+def _apply_rows(conn: sqlite3.Connection, table: str, chunks, scope: _RollupScope | None = None) -> tuple[int, int]:
+    pk = PKS[table]
+    (watermark,) = conn.execute(f"SELECT COALESCE(MAX({pk}), -1) FROM {table};").fetchone()
+    inserted = upserted = 0
+    for cols, rows in chunks:
+        if scope is not None:
+            scope.before_chunk(table, cols, rows)
+        i = cols.index(pk)
+        new = [r for r in rows if r[i] is not None and r[i] > watermark]
+        old = [r for r in rows if not (r[i] is not None and r[i] > watermark)]
+        if new:
+            conn.executemany(insert_sql(table, cols), new)
+            inserted += len(new)
+        if old:
+            conn.executemany(upsert_sql(table, cols), old)
+            upserted += len(old)
+    return inserted, upserted
+
+
+def incremental(db_path: str = DB_PATH, data_dir: Path = DATA_DIR, chunk_rows: int = CHUNK_ROWS):
+    conn = connect_for_load(db_path)
+    try:
+        have = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table';")}
+        if "_ingest_manifest" not in have or not set(FILES.values()) <= have:
+            print("ℹ️  no manifest yet, doing a full load")
+            return main(db_path, data_dir, chunk_rows)
+
+        manifest = {r[0]: dict(zip(("size", "mtime_ns", "sha256", "ends_with_newline"), r[1:]))
+                    for r in conn.execute("SELECT file, size, mtime_ns, sha256, ends_with_newline FROM _ingest_manifest;")}
+
+        # 1) decide per file, outside the write transaction (hashing can take a while on big files)
+        plan = []
         for fname, table in FILES.items():
-            fp = DATA_DIR / fname
-            df = pd.read_csv(fp)
-            
-            # Coerce dtypes for stable schema
-            if table in DTYPES:
-                for col, dt in DTYPES[table].items():
-                    if col in df.columns:
-                        if dt.startswith("Int"):
-                            df[col] = pd.to_numeric(df[col], errors="coerce").astype(dt)
-                        elif dt == "float64":
-                            df[col] = pd.to_numeric(df[col], errors="coerce")
-                        else:
-                            df[col] = df[col].astype(dt)
-
-            # Write to SQLite; pandas creates/overwrites the table
-            df.to_sql(table, con=conn, if_exists="replace", index=False)
-            print(f"✅ loaded {len(df):,} rows into {table}")
-
-        # 4) helpful indexes (ignore if they fail)
-        try:
-            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders(customer_id);")
-            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items(order_id);")
-            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items(product_id);")
-        except Exception:
-            pass
-        
-        # 5) re-enable FKs for future queries (good hygiene)
-        conn.exec_driver_sql("PRAGMA foreign_keys = ON;")
-
-    print(f"🎉 Data loaded into {DB_PATH}")
+            fp = Path(data_dir) / fname
+            old = manifest.get(fname)
+            st = os.stat(fp)
+            if old and st.st_size == old["size"] and st.st_mtime_ns == old["mtime_ns"]:
+                print(f"⏭️  {fname}: unchanged")
+                continue
+            state = _file_state(fp)
+            if old and state["sha256"] == old["sha256"]:
+                plan.append((fname, table, fp, state, "touch"))
+            elif (old and state["size"] > old["size"] and old["ends_with_newline"]
+                  and file_digest(fp, upto=old["size"]) == old["sha256"]):
+                plan.append((fname, table, fp, state, ("append", old["size"])))
+            else:
+                plan.append((fname, table, fp, state, "replace"))
+
+        if not plan:
+            print("🎉 nothing to do")
+            return []
+
+        # 2) apply everything in one short transaction
+        stats = []
+        skipped = Counter()
+        conn.execute("BEGIN IMMEDIATE;")
+        scope = _RollupScope(conn)
+        for fname, table, fp, state, action in plan:
+            t0 = time.perf_counter()
+            if action == "touch":
+                ins = ups = 0
+            else:
+                # prices feed every revenue number, and a rewritten fact table has no cheap diff
+                if table == "products" or (action == "replace" and table in ("orders", "order_items")):
+                    scope.full = True
+                if action == "replace":
+                    conn.execute(f"DELETE FROM {table};")
+                    chunks = iter_csv_chunks(fp, table, chunk_rows, skipped)
+                else:
+                    chunks = _iter_tail_chunks(fp, table, action[1], chunk_rows, skipped)
+                ins, ups = _apply_rows(conn, table, chunks, scope)
+            _record(conn, fname, table, state)
+            dt = time.perf_counter() - t0
+            kind = action if isinstance(action, str) else action[0]
+            stats.append((table, kind, ins, ups, dt))
+            print(f"✅ {fname}: {kind}, {ins:,} inserted, {ups:,} upserted ({(ins + ups) / dt if dt else 0:,.0f} rows/s)")
+        # databases loaded before an index was added to INDEXES pick it up here (no-op otherwise)
+        build_indexes(conn)
+        # rollups change in the same transaction, so readers never see them out of step with the base tables
+        scope.finish()
+        conn.execute("COMMIT;")
+        conn.execute("PRAGMA optimize;")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK;")
+        raise
+    finally:
+        conn.close()
+
+    _report_skipped(skipped)
+    print(f"🎉 Incremental load into {db_path} done")
+    return stats
+
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Load data/real/*.csv into SQLite")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--data-dir", default=str(DATA_DIR))
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    ap.add_argument("--incremental", action="store_true",
+                    help="only ingest files that changed since the last load (see _ingest_manifest)")
+    ap.add_argument("--advise", action="store_true",
+                    help="afterwards, create the indexes src/sql/advisor.py recommends for the captured workload")
+    args = ap.parse_args()
+    if args.incremental:
+        incremental(args.db, Path(args.data_dir), args.chunk_rows)
+    else:
+        main(args.db, Path(args.data_dir), args.chunk_rows)
+    if args.advise:
+        from src.sql import advisor   # heavy imports (sqlglot, pipeline) only when asked
+
+        findings, recs = advisor.advise(args.db)
+        advisor.report(findings, recs)
+        if recs:
+            before, after = advisor.apply(args.db, recs)
+            print(f"✅ applied {len(recs)} advised indexes: workload {before:.2f} ms -> {after:.2f} ms")
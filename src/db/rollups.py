@@ -0,0 +1,108 @@
+# Materialized rollup tables, built and refreshed at load time.
+#
+# Every template in generate_sql recomputes SUM(oi.quantity * p.price) over a 3-4 way join.
+# These tables hold those sums pre-aggregated, so the same questions become small scans:
+#
+#   _rollup_order_totals     one row per order:              order_id, customer_id, order_date, basket_total
+#   _rollup_product_daily    one row per (day, product):     quantity, revenue
+#   _rollup_customer_daily   one row per (day, customer):    orders (all orders), revenue (NULL if no items)
+#
+# They use the same INNER joins as the base-table templates, so answers match exactly
+# (see src/db/_demo_rollups.py). Names start with "_" so they are hidden from the LLM schema prompt;
+# queries reach them through the rule-based templates and src/sql/rollup_router.py instead.
+
+import sqlite3
+
+from src.db.schema import get_schema
+
+ROLLUP_TABLES = ("_rollup_order_totals", "_rollup_product_daily", "_rollup_customer_daily")
+
+ROLLUP_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS _rollup_order_totals (
+        order_id INTEGER PRIMARY KEY,
+        customer_id INTEGER NOT NULL,
+        order_date TEXT NOT NULL,
+        basket_total REAL NOT NULL
+    );""",
+    "CREATE INDEX IF NOT EXISTS idx_rollup_order_totals_date ON _rollup_order_totals(order_date);",
+    """
+    CREATE TABLE IF NOT EXISTS _rollup_product_daily (
+        order_date TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL,
+        revenue REAL NOT NULL,
+        PRIMARY KEY (order_date, product_id)
+    ) WITHOUT ROWID;""",
+    """
+    CREATE TABLE IF NOT EXISTS _rollup_customer_daily (
+        order_date TEXT NOT NULL,
+        customer_id INTEGER NOT NULL,
+        orders INTEGER NOT NULL,
+        revenue REAL,
+        PRIMARY KEY (order_date, customer_id)
+    ) WITHOUT ROWID;""",
+]
+
+# {where} restricts the refresh to some order dates (empty = everything)
+_FILL = [
+    """
+    INSERT INTO _rollup_order_totals (order_id, customer_id, order_date, basket_total)
+    SELECT o.order_id, o.customer_id, o.order_date, SUM(oi.quantity * p.price)
+    FROM orders o
+    JOIN order_items oi ON o.order_id = oi.order_id
+    JOIN products p ON oi.product_id = p.product_id
+    WHERE 1=1 {where}
+    GROUP BY o.order_id;""",
+    """
+    INSERT INTO _rollup_product_daily (order_date, product_id, quantity, revenue)
+    SELECT o.order_date, oi.product_id, SUM(oi.quantity), SUM(oi.quantity * p.price)
+    FROM order_items oi
+    JOIN orders o ON oi.order_id = o.order_id
+    JOIN products p ON oi.product_id = p.product_id
+    WHERE 1=1 {where}
+    GROUP BY o.order_date, oi.product_id;""",
+    """
+    INSERT INTO _rollup_customer_daily (order_date, customer_id, orders, revenue)
+    SELECT o.order_date, o.customer_id, COUNT(*), SUM(t.basket_total)
+    FROM orders o
+    LEFT JOIN _rollup_order_totals t ON t.order_id = o.order_id
+    WHERE 1=1 {where}
+    GROUP BY o.order_date, o.customer_id;""",
+]
+
+
+def drop_rollups(conn: sqlite3.Connection) -> None:
+    for t in ROLLUP_TABLES:
+        conn.execute(f"DROP TABLE IF EXISTS {t};")
+
+
+def refresh_rollups(conn: sqlite3.Connection, dates: set[str] | None = None) -> None:
+    """
+    Rebuild the rollups inside the caller's transaction.
+    With `dates`, only those order dates are recomputed (incremental loads); otherwise everything.
+    """
+    for ddl in ROLLUP_DDL:
+        conn.execute(ddl)
+
+    if dates is None:
+        for t in ROLLUP_TABLES:
+            conn.execute(f"DELETE FROM {t};")
+        where = ""
+    else:
+        if not dates:
+            return
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS _rollup_dates (d TEXT PRIMARY KEY);")
+        conn.execute("DELETE FROM temp._rollup_dates;")
+        conn.executemany("INSERT OR IGNORE INTO temp._rollup_dates (d) VALUES (?);", [(d,) for d in dates])
+        for t in ROLLUP_TABLES:
+            conn.execute(f"DELETE FROM {t} WHERE order_date IN (SELECT d FROM temp._rollup_dates);")
+        where = "AND o.order_date IN (SELECT d FROM temp._rollup_dates)"
+
+    for stmt in _FILL:
+        conn.execute(stmt.format(where=where))
+
+
+def rollups_available() -> bool:
+    """True when the serving database has every rollup table (i.e. it was built by load_csvs)."""
+    return set(ROLLUP_TABLES) <= get_schema().internal_tables
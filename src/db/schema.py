@@ -0,0 +1,170 @@
+# Cached, structured view of the SQLite catalog (tables, columns, foreign keys, indexes).
+#
+# The whole catalog is read in one pass with the pragma table-valued functions joined against
+# sqlite_master, and the result is memoized per database file. The cache is keyed on
+# PRAGMA schema_version (a counter in the file header that SQLite bumps on every DDL change),
+# so a warm request costs one header read and never walks the catalog again.
+# Tables whose name starts with "_" (the loader's _ingest_manifest, rollups) are internal: they are kept out of
+# `tables` (and therefore the LLM prompt) and only listed by name in `internal_tables`.
+
+import hashlib
+from dataclasses import dataclass
+from functools import cached_property
+from threading import Lock
+
+from sqlalchemy import text
+
+from src.core.config import get_settings
+from src.db.engine import _resolve, get_engine
+
+
+@dataclass(frozen=True)
+class Column:
+    name: str
+    type: str
+    notnull: bool = False
+    pk: bool = False
+
+
+@dataclass(frozen=True)
+class ForeignKey:
+    table: str                 # child table
+    columns: tuple[str, ...]   # child columns
+    ref_table: str             # parent table
+    ref_columns: tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class Index:
+    name: str
+    table: str
+    columns: tuple[str, ...]   # "<expr>" for expression index terms
+    unique: bool = False
+
+
+@dataclass(frozen=True)
+class Table:
+    name: str
+    columns: tuple[Column, ...]
+
+    @property
+    def column_names(self) -> tuple[str, ...]:
+        return tuple(c.name for c in self.columns)
+
+
+@dataclass(frozen=True)
+class Schema:
+    version: int
+    tables: dict[str, Table]
+    foreign_keys: tuple[ForeignKey, ...] = ()
+    indexes: tuple[Index, ...] = ()
+    internal_tables: frozenset[str] = frozenset()   # "_"-prefixed helper tables (manifest, rollups)
+
+    def fks_for(self, table: str) -> list[ForeignKey]:
+        return [fk for fk in self.foreign_keys if fk.table == table or fk.ref_table == table]
+
+    def indexes_for(self, table: str) -> list[Index]:
+        return [ix for ix in self.indexes if ix.table == table]
+
+    # derived text is computed once per schema version and reused by every prompt
+    @cached_property
+    def summary(self) -> str:
+        # one "TABLE name (col type, ...)" line per table, in catalog order
+        lines = []
+        for t in self.tables.values():
+            sig = ", ".join(f"{c.name} {c.type or ''}".strip() for c in t.columns)
+            lines.append(f"TABLE {t.name} ({sig})")
+        return "\n".join(lines)
+
+    @cached_property
+    def fingerprint(self) -> str:
+        # stable digest of the logical schema (not the version counter), used as a cache-key component
+        h = hashlib.sha1(self.summary.encode())
+        for fk in self.foreign_keys:
+            h.update(repr(fk).encode())
+        return h.hexdigest()[:16]
+
+
+_TABLES_SQL = """
+SELECT m.name, p.name, p.type, p."notnull", p.pk
+FROM sqlite_master AS m
+JOIN pragma_table_info(m.name) AS p
+WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%' AND substr(m.name, 1, 1) != '_'
+ORDER BY m.rowid, p.cid;
+"""
+
+_FKS_SQL = """
+SELECT m.name, f.id, f."table", f."from", f."to"
+FROM sqlite_master AS m
+JOIN pragma_foreign_key_list(m.name) AS f
+WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%' AND substr(m.name, 1, 1) != '_'
+ORDER BY m.name, f.id, f.seq;
+"""
+
+_INDEXES_SQL = """
+SELECT m.name, il.name, il."unique", ii.name
+FROM sqlite_master AS m
+JOIN pragma_index_list(m.name) AS il
+JOIN pragma_index_info(il.name) AS ii
+WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%' AND substr(m.name, 1, 1) != '_'
+ORDER BY m.name, il.name, ii.seqno;
+"""
+
+_INTERNAL_SQL = "SELECT name FROM sqlite_master WHERE type = 'table' AND substr(name, 1, 1) = '_';"
+
+# resolved sqlite path -> (engine URL, Schema). Keyed on the file, not the engine URL: in-memory mode swaps
+# in a replica with a fresh URL on every refresh, and a URL key would leave one entry behind per generation.
+# The URL is still compared, because a backup copy restarts schema_version, so the same version number
+# on a new replica says nothing; the catalog is re-read once per swap and the entry replaced.
+_CACHE: dict[str, tuple[str, Schema]] = {}
+_LOCK = Lock()
+
+
+def _read_schema(conn, version: int) -> Schema:
+    cols: dict[str, list[Column]] = {}
+    for t, name, typ, notnull, pk in conn.execute(text(_TABLES_SQL)):
+        cols.setdefault(t, []).append(Column(name, typ or "", bool(notnull), bool(pk)))
+    tables = {t: Table(t, tuple(cs)) for t, cs in cols.items()}
+
+    fk_parts: dict[tuple[str, int], list] = {}
+    for t, fk_id, ref, frm, to in conn.execute(text(_FKS_SQL)):
+        fk_parts.setdefault((t, fk_id), []).append((ref, frm, to))
+    fks = tuple(
+        ForeignKey(t, tuple(p[1] for p in parts), parts[0][0], tuple(p[2] for p in parts))
+        for (t, _), parts in fk_parts.items()
+    )
+
+    ix_parts: dict[tuple[str, str], list] = {}
+    for t, ix, unique, col in conn.execute(text(_INDEXES_SQL)):
+        ix_parts.setdefault((t, ix), []).append((bool(unique), col or "<expr>"))
+    indexes = tuple(
+        Index(ix, t, tuple(p[1] for p in parts), parts[0][0])
+        for (t, ix), parts in ix_parts.items()
+    )
+    internal = frozenset(r[0] for r in conn.execute(text(_INTERNAL_SQL)))
+    return Schema(version=version, tables=tables, foreign_keys=fks, indexes=indexes, internal_tables=internal)
+
+
+def get_schema(path: str | None = None) -> Schema:
+    """
+    Return the structured schema for `path` (defaults to Settings.sqlite_path).
+    Only re-reads the catalog when PRAGMA schema_version has moved.
+    """
+    path = path or get_settings().sqlite_path
+    engine = get_engine(path)
+    key, url = _resolve(path), str(engine.url)
+    with engine.connect() as conn:
+        version = conn.exec_driver_sql("PRAGMA schema_version;").scalar()
+        cached = _CACHE.get(key)
+        if cached is not None and cached[0] == url and cached[1].version == version:
+            return cached[1]
+        with _LOCK:
+            cached = _CACHE.get(key)
+            if cached is None or cached[0] != url or cached[1].version != version:
+                cached = _CACHE[key] = (url, _read_schema(conn, version))
+    return cached[1]
+
+
+def invalidate_schema_cache() -> None:
+    with _LOCK:
+        _CACHE.clear()
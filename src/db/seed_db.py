@@ -1,5 +1,6 @@
 # create_engine - used to connect to a database using the sqlalchemy library.
 from sqlalchemy import create_engine
+from src.db.rollups import ROLLUP_TABLES
 
 # defintion of main function
 def main():
@@ -19,6 +20,10 @@ def main():
         conn.exec_driver_sql("DROP TABLE IF EXISTS products;")
         conn.exec_driver_sql("DROP TABLE IF EXISTS customers;")
 
+        # rollups built by load_csvs would no longer match the seed data
+        for t in ROLLUP_TABLES:
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {t};")
+
         # schema
         # create the customers table with features and the primary key of customer id
         conn.exec_driver_sql("""
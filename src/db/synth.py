@@ -0,0 +1,209 @@
+# Synthetic retail data at production-like volumes, written straight into the SQLite schema.
+#
+# Scale factor SF1 ≈ 1M order_items (≈ 555k orders, 50k customers, 1k products); everything grows
+# linearly with SF except products (√SF). Sampling is NumPy-vectorized, block by block, with skew that
+# makes plans and indexes behave like real data:
+#   - product popularity is Zipfian (s = 1.1 over a shuffled catalogue: a few best sellers, a long tail)
+#   - customers are Zipfian too, but flatter (s = 0.6: regulars and one-off buyers)
+#   - order dates follow a yearly season (Nov/Dec peak, summer lull) plus a weekend bump, over
+#     2023-01-01 .. 2025-12-31; order ids increase with the date, as in an OLTP system
+#   - 1 + Poisson(0.8) items per order, quantities 1..5 skewed towards 1
+# Deterministic: every block draws from its own generator seeded by (seed, stream, block), so the same
+# (sf, seed) gives byte-identical tables on every run and machine.
+#
+# Rows go in through the same path as load_csvs.main(): load PRAGMAs, chunked executemany into the
+# typed tables, then indexes, rollups and ANALYZE once all the data is in.
+# Run: python -m src.db.synth --sf 1 [--seed 42] [--db data/synth_sf1.db]
+
+import argparse
+import datetime as dt
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.db import load_csvs
+from src.db.rollups import drop_rollups
+
+ITEMS_PER_SF = 1_000_000
+ITEMS_PER_ORDER = 1.8                    # mean of 1 + Poisson(0.8)
+CUSTOMERS_PER_SF = 50_000
+PRODUCTS_PER_SQRT_SF = 1_000
+BLOCK = 100_000                          # rows sampled (and inserted) per block
+START, END = dt.date(2023, 1, 1), dt.date(2025, 12, 31)
+
+FIRST = ["Alice", "Bob", "Carol", "David", "Eve", "Frank", "Grace", "Hank", "Ivy", "Jack", "Kathy", "Leo",
+         "Mona", "Nate", "Olivia", "Paul", "Quinn", "Rita", "Sam", "Tina", "Uma", "Vince", "Walt", "Xena",
+         "Yara", "Zack"]
+LAST = ["Anderson", "Brown", "Clark", "Davis", "Garcia", "Harris", "Jackson", "Johnson", "Lee", "Martin",
+        "Martinez", "Miller", "Moore", "Robinson", "Smith", "Taylor", "Thomas", "Thompson", "White", "Wilson"]
+CITIES = ["New York", "Chicago", "San Francisco", "Boston", "Seattle", "Austin", "Denver", "Miami", "Atlanta",
+          "Dallas", "Phoenix", "Portland", "San Diego", "Philadelphia", "Minneapolis"]
+# category -> (short name used in product names, median price, lognormal sigma)
+CATEGORIES = {
+    "Office Supplies": ("Office", 12.0, 0.6),
+    "Books": ("Book", 30.0, 0.5),
+    "Toys": ("Toy", 55.0, 0.6),
+    "Appliances": ("Appliance", 250.0, 0.5),
+    "Furniture": ("Furniture", 350.0, 0.6),
+    "Technology": ("Technology", 420.0, 0.5),
+}
+_STREAMS = {"customers": 1, "products": 2, "orders": 3, "order_items": 4,
+            "customer_ranks": 5, "product_ranks": 6}
+
+
+def sizes(sf: float) -> dict[str, int]:
+    items = int(ITEMS_PER_SF * sf)
+    return {
+        "customers": max(1, int(CUSTOMERS_PER_SF * sf)),
+        "products": max(len(CATEGORIES), int(PRODUCTS_PER_SQRT_SF * sf ** 0.5)),
+        "orders": max(1, round(items / ITEMS_PER_ORDER)),
+        "order_items": items,   # target; the actual count follows the sampled basket sizes
+    }
+
+
+def _rng(seed: int, stream: str, block: int = 0) -> np.random.Generator:
+    return np.random.default_rng([seed, _STREAMS[stream], block])
+
+
+class _Zipf:
+    """Draws ids 1..n with P(rank k) ∝ 1/k^s; which id gets which rank is a seeded shuffle."""
+
+    def __init__(self, n: int, s: float, rng: np.random.Generator):
+        weights = 1.0 / np.arange(1, n + 1) ** s
+        self.cdf = np.cumsum(weights / weights.sum())
+        self.ids = rng.permutation(n) + 1
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        ranks = np.minimum(np.searchsorted(self.cdf, rng.random(size)), len(self.ids) - 1)
+        return self.ids[ranks]
+
+
+def _day_weights() -> tuple[np.ndarray, np.ndarray]:
+    # (ISO date strings, relative order volume) for every day in START..END
+    days = np.arange(np.datetime64(START), np.datetime64(END) + 1)
+    doy = (days - days.astype("datetime64[Y]")).astype(int)
+    weekday = (days.astype(int) + 3) % 7                     # 1970-01-01 was a Thursday; 0 = Monday
+    season = 1.0 + 0.25 * np.cos(2 * np.pi * (doy - 15) / 365.25)
+    season += 0.8 * np.exp(-(((doy - 340) / 18.0) ** 2))      # holiday peak around early December
+    season *= np.where(weekday >= 5, 1.25, 1.0)
+    years = days.astype("datetime64[Y]").astype(int) - (START.year - 1970)
+    season *= 1.0 + 0.15 * years                              # steady growth year over year
+    return np.datetime_as_string(days).astype(object), season / season.sum()
+
+
+def _blocks(n: int):
+    for b, lo in enumerate(range(0, n, BLOCK)):
+        yield b, lo, min(lo + BLOCK, n)
+
+
+def _insert(conn, table: str, cols: list[str], columns: list[np.ndarray]) -> int:
+    rows = list(zip(*(c.tolist() for c in columns)))
+    conn.executemany(load_csvs.insert_sql(table, cols), rows)
+    return len(rows)
+
+
+def _customers(conn, n: int, seed: int) -> int:
+    span = (END - START).days
+    for b, lo, hi in _blocks(n):
+        rng = _rng(seed, "customers", b)
+        size = hi - lo
+        names = np.char.add(np.char.add(np.array(FIRST)[rng.integers(len(FIRST), size=size)], " "),
+                            np.array(LAST)[rng.integers(len(LAST), size=size)])
+        joined = np.datetime64(START) + rng.integers(0, span + 1, size=size)
+        _insert(conn, "customers", ["customer_id", "name", "city", "join_date"],
+                [np.arange(lo + 1, hi + 1), names, np.array(CITIES)[rng.integers(len(CITIES), size=size)],
+                 np.datetime_as_string(joined)])
+    return n
+
+
+def _products(conn, n: int, seed: int) -> int:
+    rng = _rng(seed, "products")
+    cats = list(CATEGORIES)
+    which = np.arange(n) % len(cats)                          # even spread of categories
+    short = np.array([CATEGORIES[c][0] for c in cats])[which]
+    median = np.array([CATEGORIES[c][1] for c in cats])[which]
+    sigma = np.array([CATEGORIES[c][2] for c in cats])[which]
+    number = np.arange(n) // len(cats) + 1
+    names = np.char.add(np.char.add(short, " Item "), number.astype(str))
+    prices = np.round(np.maximum(median * np.exp(rng.normal(0.0, sigma)), 0.99), 2)
+    _insert(conn, "products", ["product_id", "name", "category", "price"],
+            [np.arange(1, n + 1), names, np.array(cats)[which], prices])
+    return n
+
+
+def _orders_and_items(conn, n_orders: int, n_customers: int, n_products: int, seed: int) -> tuple[int, int]:
+    dates, weights = _day_weights()
+    per_day = _rng(seed, "orders").multinomial(n_orders, weights)
+    # day index per order, ascending (order ids follow the calendar); int16 keeps SF100 at ~110 MB
+    order_day = np.repeat(np.arange(len(dates), dtype=np.int16), per_day)
+    customers = _Zipf(n_customers, 0.6, _rng(seed, "customer_ranks"))
+    products = _Zipf(n_products, 1.1, _rng(seed, "product_ranks"))
+
+    n_items = 0
+    for b, lo, hi in _blocks(n_orders):
+        rng = _rng(seed, "orders", b + 1)
+        ids = np.arange(lo + 1, hi + 1)
+        _insert(conn, "orders", ["order_id", "customer_id", "order_date"],
+                [ids, customers.sample(rng, hi - lo), dates[order_day[lo:hi]]])
+
+        irng = _rng(seed, "order_items", b)
+        basket = 1 + irng.poisson(ITEMS_PER_ORDER - 1, size=hi - lo)
+        item_order = np.repeat(ids, basket)
+        quantity = np.minimum(irng.geometric(0.5, size=len(item_order)), 5)
+        first = n_items + 1
+        n_items += _insert(conn, "order_items", ["order_item_id", "order_id", "product_id", "quantity"],
+                           [np.arange(first, first + len(item_order)), item_order,
+                            products.sample(irng, len(item_order)), quantity])
+    return n_orders, n_items
+
+
+def generate(db_path: str, sf: float = 1.0, seed: int = 42) -> dict[str, int]:
+    """(Re)create the four tables in `db_path` with SF-scaled synthetic data. Returns row counts."""
+    n = sizes(sf)
+    conn = load_csvs.connect_for_load(db_path)
+    counts = {}
+    try:
+        conn.execute("BEGIN;")
+        for t in ["order_items", "orders", "products", "customers"]:
+            conn.execute(f"DROP TABLE IF EXISTS {t};")
+        conn.execute("DROP TABLE IF EXISTS _ingest_manifest;")   # these rows came from no CSV
+        drop_rollups(conn)                                        # stale until finish_load() rebuilds them
+        for table in load_csvs.FILES.values():
+            conn.execute(load_csvs.TABLE_DDL[table])
+
+        t0 = time.perf_counter()
+        counts["customers"] = _customers(conn, n["customers"], seed)
+        counts["products"] = _products(conn, n["products"], seed)
+        counts["orders"], counts["order_items"] = _orders_and_items(
+            conn, n["orders"], n["customers"], n["products"], seed)
+        conn.execute("COMMIT;")
+        took = time.perf_counter() - t0
+        total = sum(counts.values())
+        print(f"✅ generated SF{sf:g} (seed {seed}): " + ", ".join(f"{v:,} {k}" for k, v in counts.items())
+              + f" in {took:.1f}s ({total / took:,.0f} rows/s)")
+
+        load_csvs.finish_load(conn)
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK;")
+        raise
+    finally:
+        conn.close()
+    return counts
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate synthetic retail data at a scale factor (SF1 ≈ 1M order_items).")
+    ap.add_argument("--sf", type=float, default=1.0, help="scale factor, e.g. 0.1, 1, 10, 100")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--db", help="target SQLite file (default data/synth_sf<SF>.db; never data/retail.db by accident)")
+    args = ap.parse_args()
+    db = args.db or f"data/synth_sf{args.sf:g}.db"
+    Path(db).parent.mkdir(parents=True, exist_ok=True)
+    generate(db, args.sf, args.seed)
+    print(f"🎉 Synthetic data written to {db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Rule-based generator: the old if-chain matcher + f-string SQL vs src/nlp/templates.py.
+#   1) intent matching: if-chain vs the keyword-bitmask matcher (µs per question)
+#   2) distinct SQL texts a mixed question stream produces: every (intent, year, limit) used to be its
+#      own string, so each one paid a sqlglot parse in the guardrail; templates keep that set fixed
+#   3) guardrail cost per request: parse + check of a never-seen literal statement vs a template hit
+# Run: python -m src.nlp._bench_intent [--questions 5000]
+
+import argparse
+import random
+import time
+
+from src.nlp.pipeline import generate_statement
+from src.nlp.templates import match_intent, render
+from src.sql.runner import _parse_and_check, _validate_sql
+
+PHRASES = [
+    "top {n} customers by total spend", "total revenue by product", "sales per product",
+    "orders by customer", "average order value", "what is our aov", "daily sales",
+    "sales by day", "biggest orders", "show me something interesting",
+]
+
+
+def _legacy_intent(text: str) -> str:
+    # the matcher generate_sql used before templates.py
+    t = text.lower()
+    if "top" in t and "customer" in t:
+        return "top_customers_by_spend"
+    if ("revenue" in t or "sales" in t) and ("by product" in t or "per product" in t):
+        return "revenue_by_product"
+    if "orders" in t and "by" in t and "customer" in t:
+        return "orders_by_customer"
+    if "average order value" in t or "aov" in t:
+        return "avg_order_value"
+    if "daily sales" in t or ("sales" in t and "by day" in t):
+        return "daily_sales"
+    return "fallback_search"
+
+
+def _questions(n: int, seed: int = 7) -> list[tuple[str, int]]:
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        q = rnd.choice(PHRASES).format(n=rnd.randint(3, 20))
+        if rnd.random() < 0.7:
+            q += f" in {rnd.randint(2015, 2025)}"
+        out.append((q, rnd.choice([5, 10, 20, 50, 100])))
+    return out
+
+
+def _per_call_us(fn, items) -> float:
+    t0 = time.perf_counter()
+    for x in items:
+        fn(x)
+    return (time.perf_counter() - t0) / len(items) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--questions", type=int, default=5000)
+    args = ap.parse_args()
+    qs = _questions(args.questions)
+    texts = [q for q, _ in qs]
+
+    mismatched = sum(_legacy_intent(t) != match_intent(t) for t in texts)
+    legacy_us = min(_per_call_us(_legacy_intent, texts) for _ in range(3))
+    table_us = min(_per_call_us(match_intent, texts) for _ in range(3))
+    print(f"intent matching      : if-chain {legacy_us:6.2f} µs  table {table_us:6.2f} µs  "
+          f"({mismatched} disagreements over {len(texts)} questions)")
+
+    statements = [generate_statement(q, lim, use_rollups=False) for q, lim in qs]
+    literal = [render(sql, params) for sql, params in statements]
+    print(f"distinct SQL texts   : literal {len(set(literal)):5}  templated {len({s for s, _ in statements}):5}")
+
+    # a literal statement seen for the first time is a full sqlglot parse; a template is an LRU hit
+    sample = list(dict.fromkeys(literal))[:300]
+    cold_us = _per_call_us(_parse_and_check, sample)
+    for sql, _ in statements:
+        _validate_sql(sql)
+    hit_us = _per_call_us(lambda s: _validate_sql(s[0]), statements)
+    print(f"guardrail / request  : new literal {cold_us / 1000:6.2f} ms  template hit {hit_us / 1000:6.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
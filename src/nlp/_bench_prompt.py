@@ -0,0 +1,125 @@
+# LLM prompt size and latency: the old prompt (full schema inside a system prompt, every few-shot) vs the
+# pruned one (static system prompt, question-relevant schema slice, most similar few-shots), against
+# src/bench/stub_llm.py with a per-token prefill cost and a prefix-cache estimate.
+#   retail   the serving database (temp copy)
+#   wide     the same plus 40 unrelated tables, like a warehouse schema the questions never touch
+# Also checks, on the hand-written FEW_SHOTS pairs, that every table their SQL uses is in the pruned schema
+# for their question (FK closure included). The stub counts cached tokens as OpenAI does (prompts of
+# 1024+ tokens) and charges them a fifth of the prefill cost.
+# Run: python -m src.nlp._bench_prompt [--prefill-ms 60] [--latency-ms 20]
+
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import sqlglot
+from sqlglot import expressions as exp
+
+from src.bench.stub_llm import StubLLM
+from src.core.config import get_settings
+from src.db.engine import dispose_engines
+from src.db.schema import get_schema
+from src.nlp.pipeline import FEW_SHOTS, SYSTEM_PROMPT, _fewshot_block, _llm_client, _llm_messages, get_schema_summary
+from src.nlp.schema_context import get_schema_index
+
+QUESTIONS = [
+    "top 5 customers by total spend",
+    "total revenue by product in 2024",
+    "revenue by category in 2024",
+    "orders by customer",
+    "average order value in 2025",
+    "daily sales in 2024",
+    "biggest orders",
+    "best selling products",
+]
+_DISTRACTORS = ["supplier", "shipment", "warehouse", "inventory_level", "employee", "department", "payroll_run",
+                "campaign", "campaign_click", "support_ticket", "ticket_comment", "refund", "carrier", "route",
+                "vehicle", "maintenance_log", "invoice", "ledger_entry", "budget_line", "cost_center"]
+
+
+def _legacy_messages(question: str, limit: int | None):
+    # what _llm_messages sent before: schema inside the system prompt, the original three few-shots
+    user_msg = f"Question: {question}\nReturn only SQL. If appropriate, include LIMIT {limit or 10}."
+    return [
+        {"role": "system", "content": f"{SYSTEM_PROMPT}\nSchema:\n{get_schema_summary()}"},
+        {"role": "user", "content": _fewshot_block(FEW_SHOTS[:3])},
+        {"role": "user", "content": user_msg},
+    ]
+
+
+def _widen(db: str) -> None:
+    with sqlite3.connect(db) as conn:
+        for i in range(40):
+            name = f"{_DISTRACTORS[i % len(_DISTRACTORS)]}{'s' if i < len(_DISTRACTORS) else f'_archive_{i}'}"
+            parent = _DISTRACTORS[(i + 1) % len(_DISTRACTORS)]
+            conn.execute(f"CREATE TABLE {name} ({_DISTRACTORS[i % len(_DISTRACTORS)]}_id INTEGER PRIMARY KEY, "
+                         f"{parent}_id INTEGER, code TEXT, description TEXT, status TEXT, created_at TEXT, "
+                         f"updated_at TEXT, amount_cents INTEGER, region TEXT, notes TEXT, owner TEXT)")
+
+
+def _tables_used(sql: str) -> set[str]:
+    return {t.name for t in sqlglot.parse_one(sql, read="sqlite").find_all(exp.Table)}
+
+
+def _run(build, label: str, passes: int) -> None:
+    client = _llm_client(get_settings())
+    tokens, cached, build_ms, latency = [], [], [], []
+    for _ in range(passes):
+        for q in QUESTIONS:
+            t0 = time.perf_counter()
+            messages = build(q, 10)
+            t1 = time.perf_counter()
+            resp = client.chat.completions.create(model="stub", messages=messages, temperature=0)
+            build_ms.append((t1 - t0) * 1000)
+            latency.append((time.perf_counter() - t0) * 1000)
+            tokens.append(resp.usage.prompt_tokens)
+            cached.append(resp.usage.prompt_tokens_details.cached_tokens)
+    print(f"  {label:<7} prompt tokens {statistics.fmean(tokens):6.0f}  cached {statistics.fmean(cached):6.0f}  "
+          f"build {statistics.median(build_ms):5.2f} ms  end-to-end median {statistics.median(latency):6.1f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--prefill-ms", type=float, default=60.0, help="stub prefill cost per 1k uncached tokens")
+    ap.add_argument("--latency-ms", type=float, default=20.0, help="stub fixed latency per request")
+    ap.add_argument("--passes", type=int, default=3, help="passes over the question set per layout")
+    args = ap.parse_args()
+    settings = get_settings()
+    saved = settings.model_copy()
+    settings.openai_api_key = settings.openai_api_key or "stub"
+    os.environ.setdefault("OPENAI_API_KEY", settings.openai_api_key)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ["retail", "wide"]:
+                db = str(Path(tmp) / f"{name}.db")
+                shutil.copyfile(saved.sqlite_path, db)
+                if name == "wide":
+                    _widen(db)
+                dispose_engines()
+                settings.sqlite_path = db
+                index = get_schema_index(get_schema())
+                picked = [len(index.select(q)[0]) for q in QUESTIONS]
+                covered = sum(_tables_used(ex["sql"]) <= set(index.select(ex["q"])[0] or index.tables)
+                              for ex in FEW_SHOTS)
+                print(f"{name}: {len(index.tables)} tables, {statistics.fmean(picked):.1f} picked per question; "
+                      f"{covered}/{len(FEW_SHOTS)} few-shot answers covered by their pruned schema")
+
+                for label, build in [("legacy", _legacy_messages), ("pruned", _llm_messages)]:
+                    # a fresh stub per layout, so one layout's prompts can't warm the other's prefix cache
+                    with StubLLM(latency_ms=args.latency_ms, prefill_ms_per_1k=args.prefill_ms) as stub:
+                        settings.llm_base_url = stub.url
+                        _run(build, label, args.passes)
+    finally:
+        dispose_engines()
+        for name, value in saved.model_dump().items():
+            setattr(settings, name, value)
+
+
+if __name__ == "__main__":
+    main()
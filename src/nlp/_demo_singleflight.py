@@ -0,0 +1,66 @@
+# N concurrent identical LLM questions against the local stub endpoint -> one upstream completion,
+# for both the asyncio path (/query) and threads; then a fresh client per call vs the pooled one.
+# Run: python -m src.nlp._demo_singleflight [--n 50] [--latency-ms 200]
+
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import OpenAI
+
+from src.bench.stub_llm import StubLLM
+from src.core.config import get_settings
+from src.nlp.pipeline import _llm_client, generate_sql_with_llm, generate_sql_with_llm_async
+
+Q = "top 5 customers by total spend"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=50)
+    ap.add_argument("--latency-ms", type=float, default=200)
+    args = ap.parse_args()
+
+    settings = get_settings()
+    settings.llm_cache_path = ""      # every miss would go upstream; only coalescing can save calls
+    settings.openai_api_key = settings.openai_api_key or "stub"
+    os.environ.setdefault("OPENAI_API_KEY", settings.openai_api_key)
+
+    with StubLLM(latency_ms=args.latency_ms) as stub:
+        settings.llm_base_url = stub.url
+
+        async def burst():
+            return await asyncio.gather(*(generate_sql_with_llm_async(Q, 5) for _ in range(args.n)))
+
+        t0 = time.perf_counter()
+        answers = asyncio.run(burst())
+        took = (time.perf_counter() - t0) * 1000
+        assert len(set(answers)) == 1
+        print(f"asyncio: {args.n} concurrent requests -> {stub.requests} upstream call(s) in {took:.0f} ms")
+        assert stub.requests == 1, stub.requests
+
+        before = stub.requests
+        with ThreadPoolExecutor(max_workers=args.n) as pool:
+            answers = list(pool.map(lambda _: generate_sql_with_llm(Q, 5), range(args.n)))
+        assert len(set(answers)) == 1
+        print(f"threads: {args.n} concurrent requests -> {stub.requests - before} upstream call(s)")
+
+        # connection reuse: no artificial latency, so the client setup and connect cost is what shows
+        stub.latency_ms = 0
+        msgs = [{"role": "user", "content": f"Question: {Q}"}]
+        for label, client_for in [("new client per call", lambda: OpenAI(api_key=settings.openai_api_key,
+                                                                            base_url=stub.url)),
+                                  ("pooled client", lambda: _llm_client(settings))]:
+            samples = []
+            for _ in range(20):
+                t0 = time.perf_counter()
+                client_for().chat.completions.create(model="stub", messages=msgs, temperature=0)
+                samples.append((time.perf_counter() - t0) * 1000)
+            samples.sort()
+            print(f"{label:<20}: median {samples[len(samples) // 2]:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# Persistent question → SQL cache for generate_sql_with_llm.
+#
+# Each entry is stored in a small side SQLite file (Settings.llm_cache_path), so answers survive
+# restarts and are shared by every uvicorn worker on the box (WAL mode + busy timeout).
+# An entry is only reused when the whole context matches: normalized question, limit,
+# schema fingerprint, few-shot fingerprint and model name. Entries of other contexts are never deleted
+# because of that (during a rolling deploy another worker may still be serving the old schema or
+# few-shots); they simply stop being looked up and age out: at most every _PURGE_INTERVAL_S, each process
+# drops entries unused for llm_cache_max_age_s and trims the file to llm_cache_max_entries, least recently
+# used first.
+# A hit is a read. Hit counts and last-use times are buffered in memory and written in one batch every
+# _FLUSH_HITS hits or _FLUSH_INTERVAL_S seconds, so lookups don't turn into a WAL write each.
+# Optionally, a near-duplicate lookup (word n-gram Jaccard similarity) lets paraphrases reuse an answer.
+
+import atexit
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from src.core.config import get_settings
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS llm_sql_cache (
+    key TEXT PRIMARY KEY,          -- hash of (question, ctx)
+    ctx TEXT NOT NULL,             -- hash of (limit, model, schema fp, few-shot fp): scope for lookups
+    schema_fp TEXT NOT NULL,
+    fewshot_fp TEXT NOT NULL,
+    question TEXT NOT NULL,        -- normalized question text
+    sql TEXT NOT NULL,             -- validated SQL
+    created_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_llm_sql_cache_ctx ON llm_sql_cache(ctx, created_at);
+"""
+# files created before entries tracked their last use get the column on first open
+_USED_AT = "ALTER TABLE llm_sql_cache ADD COLUMN used_at REAL;"
+_USED_AT_INDEX = "CREATE INDEX IF NOT EXISTS idx_llm_sql_cache_used ON llm_sql_cache(COALESCE(used_at, created_at));"
+
+# how many recent entries of a context are compared in the near-duplicate scan
+_NEAR_DUP_CANDIDATES = 500
+
+# age-out purge cadence per process, and when buffered hit counts are written back
+_PURGE_INTERVAL_S = 3600.0
+_FLUSH_HITS = 64
+_FLUSH_INTERVAL_S = 30.0
+
+_local = threading.local()
+_last_purge: dict[str, float] = {}           # path -> when this process last aged entries out of it
+_purge_lock = threading.Lock()
+_pending: dict[str, dict[str, list]] = {}    # path -> key -> [hits, last used]; written back by _flush_hits
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def normalize_question(q: str) -> str:
+    # lowercase, drop punctuation, collapse whitespace: "Top 5 customers?" == "top 5  customers"
+    return " ".join(re.sub(r"[^\w\s]", " ", q.lower()).split())
+
+
+def _ngrams(q: str) -> set[str]:
+    toks = q.split()
+    return set(toks) | {f"{a} {b}" for a, b in zip(toks, toks[1:])}
+
+
+def _numbers(q: str) -> set[str]:
+    # years/limits change the answer completely, so paraphrase matching requires them to be equal
+    return set(re.findall(r"\d+", q))
+
+
+def similarity(a: str, b: str) -> float:
+    ga, gb = _ngrams(a), _ngrams(b)
+    if not ga or not gb:
+        return 0.0
+    return len(ga & gb) / len(ga | gb)
+
+
+def _hash(*parts) -> str:
+    return hashlib.sha1("\x1f".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _conn(path: str) -> sqlite3.Connection:
+    # one connection per thread per file; sqlite3 connections are not shared across threads here
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5.0, isolation_level=None)   # autocommit
+        conn.execute("PRAGMA journal_mode = WAL;")      # readers in other workers never block on a writer
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.executescript(_DDL)
+        if "used_at" not in {r[1] for r in conn.execute("PRAGMA table_info(llm_sql_cache);")}:
+            try:
+                conn.execute(_USED_AT)
+            except sqlite3.OperationalError:
+                pass                                   # another worker added it first
+        conn.execute(_USED_AT_INDEX)
+        conns[path] = conn
+    return conn
+
+
+def _note_hit(path: str, key: str) -> None:
+    global _last_flush
+    with _pending_lock:
+        entry = _pending.setdefault(path, {}).setdefault(key, [0, 0.0])
+        entry[0] += 1
+        entry[1] = time.time()
+        due = (sum(len(keys) for keys in _pending.values()) >= _FLUSH_HITS
+               or time.monotonic() - _last_flush >= _FLUSH_INTERVAL_S)
+    if due:
+        _flush_hits()
+
+
+def _flush_hits() -> None:
+    """Write the buffered hit counts and last-use times back, one transaction per cache file."""
+    global _last_flush
+    with _pending_lock:
+        batch = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    for path, keys in batch.items():
+        conn = None
+        try:
+            conn = _conn(path)
+            conn.execute("BEGIN;")
+            conn.executemany("UPDATE llm_sql_cache SET hits = hits + ?, used_at = MAX(COALESCE(used_at, 0), ?)"
+                             " WHERE key = ?;", [(n, used, key) for key, (n, used) in keys.items()])
+            conn.execute("COMMIT;")
+        except sqlite3.Error:
+            # statistics only; never fail a request over them, but never leave the shared autocommit
+            # connection inside a transaction either (later puts would never commit)
+            if conn is not None and conn.in_transaction:
+                try:
+                    conn.execute("ROLLBACK;")
+                except sqlite3.Error:
+                    pass
+
+
+atexit.register(_flush_hits)
+
+
+class LLMSQLCache:
+    """Disk-backed cache scoped to one (limit, model, schema, few-shot set) context."""
+
+    def __init__(self, path: str, *, limit, model: str, schema_fp: str, fewshot_fp: str,
+                 similarity_threshold: float = 0.0):
+        self.path = path
+        self.schema_fp = schema_fp
+        self.fewshot_fp = fewshot_fp
+        self.ctx = _hash(limit, model, schema_fp, fewshot_fp)
+        self.threshold = similarity_threshold
+        self._age_out()
+
+    def _age_out(self) -> None:
+        last = _last_purge.get(self.path)
+        if last is not None and time.monotonic() - last < _PURGE_INTERVAL_S:
+            return
+        with _purge_lock:
+            last = _last_purge.get(self.path)
+            if last is not None and time.monotonic() - last < _PURGE_INTERVAL_S:
+                return
+            _last_purge[self.path] = time.monotonic()
+            _flush_hits()
+            s = get_settings()
+            conn = _conn(self.path)
+            if s.llm_cache_max_age_s > 0:
+                conn.execute("DELETE FROM llm_sql_cache WHERE COALESCE(used_at, created_at) < ?;",
+                             (time.time() - s.llm_cache_max_age_s,))
+            if s.llm_cache_max_entries > 0:
+                conn.execute(
+                    "DELETE FROM llm_sql_cache WHERE key IN (SELECT key FROM llm_sql_cache"
+                    " ORDER BY COALESCE(used_at, created_at) DESC LIMIT -1 OFFSET ?);",
+                    (s.llm_cache_max_entries,),
+                )
+
+    def get(self, question: str) -> str | None:
+        q = normalize_question(question)
+        conn = _conn(self.path)
+        key = _hash(q, self.ctx)
+        row = conn.execute("SELECT sql FROM llm_sql_cache WHERE key = ?;", (key,)).fetchone()
+        if row is None and self.threshold > 0:
+            key, row = self._near_duplicate(conn, q)
+        if row is None:
+            return None
+        _note_hit(self.path, key)
+        return row[0]
+
+    def _near_duplicate(self, conn: sqlite3.Connection, q: str):
+        best, best_score = (None, None), self.threshold
+        nums = _numbers(q)
+        candidates = conn.execute(
+            "SELECT key, question, sql FROM llm_sql_cache WHERE ctx = ? ORDER BY created_at DESC LIMIT ?;",
+            (self.ctx, _NEAR_DUP_CANDIDATES),
+        )
+        for key, other, sql in candidates:
+            if _numbers(other) != nums:
+                continue
+            score = similarity(q, other)
+            if score >= best_score:
+                best, best_score = (key, (sql,)), score
+        return best
+
+    def put(self, question: str, sql: str) -> None:
+        q = normalize_question(question)
+        _conn(self.path).execute(
+            "INSERT OR REPLACE INTO llm_sql_cache (key, ctx, schema_fp, fewshot_fp, question, sql, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?);",
+            (_hash(q, self.ctx), self.ctx, self.schema_fp, self.fewshot_fp, q, sql, time.time()),
+        )
+
+
+def get_llm_cache(*, limit, model: str, schema_fp: str, fewshot_fp: str) -> LLMSQLCache | None:
+    """Cache for this request's context, or None when disabled (empty LLM_CACHE_PATH)."""
+    s = get_settings()
+    if not s.llm_cache_path:
+        return None
+    return LLMSQLCache(s.llm_cache_path, limit=limit, model=model, schema_fp=schema_fp,
+                       fewshot_fp=fewshot_fp, similarity_threshold=s.llm_cache_similarity)
+
+
+def cached_statements(path: str | None = None) -> list[tuple[str, int]]:
+    """Every cached (sql, times used) pair, e.g. as a workload sample for src/sql/advisor.py."""
+    path = path if path is not None else get_settings().llm_cache_path
+    if not path or not Path(path).exists():
+        return []
+    _flush_hits()
+    return [(sql, uses) for sql, uses in _conn(path).execute("SELECT sql, hits + 1 FROM llm_sql_cache;")]
@@ -1,155 +1,41 @@
 # this script turns a natural language question into a safe SQL query that runner.py will execute.
 
-from sqlalchemy import create_engine, text
 from src.core.config import get_settings
-
-def _list_tables_sqlite():
-    engine = create_engine(f"sqlite:///{get_settings().sqlite_path}")
-    with engine.connect() as conn:
-        rows = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")).fetchall()
-    return [r[0] for r in rows]
-
-def _columns_sqlite(table: str):
-    engine = create_engine(f"sqlite:///{get_settings().sqlite_path}")
-    with engine.connect() as conn:
-        rows = conn.execute(text(f"PRAGMA table_info({table});")).fetchall()
-    return [(r[1], r[2]) for r in rows]  # (name, type)
+from src.db.rollups import rollups_available
+from src.db.schema import get_schema
 
 def get_schema_summary() -> str:
-    lines = []
-    for t in _list_tables_sqlite():
-        cols = _columns_sqlite(t)
-        sig = ", ".join(f"{c} {typ or ''}".strip() for c, typ in cols)
-        lines.append(f"TABLE {t} ({sig})")
-    return "\n".join(lines)
-
-
-
-# re - regular expressions, generalized strings sort of
-# You use the regular expression (regex) module to extract patterns like years (e.g., 2024) from text.
-import re
+    # the catalog is read once per PRAGMA schema_version and memoized (see src/db/schema.py)
+    return get_schema().summary
 
-def _year_from_text(text: str):
-    
-    # re.search() - scans the entire string for the first occurance of a match
-    # Looks for a 4-digit number starting with 19 or 20 (matches years like 1999, 2024).
-    # If found, returns the year as a string; otherwise returns None.
-    
-    m = re.search(r"(19|20)\d{2}", text)
-    return m.group(0) if m else None
 
-def _intent_from_text(text: str):
-    
-    # Converts text to lowercase
-    t = text.lower()
-    
-    # Checks for simple keyword patterns. Maps them to a short “intent name”.
-    if "top" in t and "customer" in t:
-        return "top_customers_by_spend"
-    if ("revenue" in t or "sales" in t) and ("by product" in t or "per product" in t):
-        return "revenue_by_product"
-    if "orders" in t and "by" in t and "customer" in t:
-        return "orders_by_customer"
-    if "average order value" in t or "aov" in t:
-        return "avg_order_value"
-    if "daily sales" in t or ("sales" in t and "by day" in t):
-        return "daily_sales"
-    
-    # if none of them match then fallback search
-    return "fallback_search"
 
-def _date_filters(year: str | None):
-    # If a year exists, returns an SQL snippet to filter rows by that year. If no year is found, returns an empty string.
-    if not year:
-        return ""
-    # filters Orders table by year
-    return f" AND strftime('%Y', o.order_date) = '{year}' "
+# The keyword→intent matcher and the parameterized statement per intent live in src/nlp/templates.py.
+# Templates are compiled and validated on first use (or during the startup warmup, src/api/warmup.py);
+# after that a request only picks one and binds the year/limit values.
+from src.nlp.templates import bind, get_templates, match_intent, render, year_from_text
 
-def generate_sql(question: str, limit: int | None = 10) -> str:
+def generate_statement(question: str, limit: int | None = 10, use_rollups: bool | None = None) -> tuple[str, dict]:
     """
-    Simple keyword→template baseline that returns safe, read-only SQL for our schema.
+    Simple keyword→template baseline: returns (sql, params) for run_sql_safe / run_sql_cached.
+    The SQL text is one of a fixed set of read-only statements; the year and limit are bound parameters.
+    Aggregate intents read the precomputed rollups when the database has them
+    (use_rollups=None: auto-detect; False forces the base-table joins).
     """
-    intent = _intent_from_text(question)
-    year = _year_from_text(question)
-    
-    # Builds a LIMIT clause string only if the user asked for one.
-    lim = f" LIMIT {limit} " if limit else ""
-
-    if intent == "top_customers_by_spend":
-        return f"""
-        SELECT c.name AS customer, ROUND(SUM(oi.quantity * p.price), 2) AS total_spend
-        FROM orders o
-        JOIN customers c ON o.customer_id = c.customer_id
-        JOIN order_items oi ON o.order_id = oi.order_id
-        JOIN products p ON oi.product_id = p.product_id
-        
-        WHERE 1=1 {_date_filters(year)}
-        GROUP BY c.customer_id
-        ORDER BY total_spend DESC
-        {lim};
-        """
-
-    if intent == "revenue_by_product":
-        return f"""
-        SELECT p.name AS product, ROUND(SUM(oi.quantity * p.price), 2) AS revenue
-        FROM order_items oi
-        JOIN orders o ON oi.order_id = o.order_id
-        JOIN products p ON oi.product_id = p.product_id
-        WHERE 1=1 {_date_filters(year)}
-        GROUP BY p.product_id
-        ORDER BY revenue DESC
-        {lim};
-        """
-
-    if intent == "orders_by_customer":
-        return f"""
-        SELECT c.name AS customer, COUNT(DISTINCT o.order_id) AS orders
-        FROM orders o
-        JOIN customers c ON o.customer_id = c.customer_id
-        WHERE 1=1 {_date_filters(year)}
-        GROUP BY c.customer_id
-        ORDER BY orders DESC
-        {lim};
-        """
-
-    if intent == "avg_order_value":
-        return f"""
-        SELECT ROUND(AVG(basket_total), 2) AS avg_order_value
-        FROM (
-            SELECT o.order_id, SUM(oi.quantity * p.price) AS basket_total
-            FROM orders o
-            JOIN order_items oi ON o.order_id = oi.order_id
-            JOIN products p ON oi.product_id = p.product_id
-            WHERE 1=1 {_date_filters(year)}
-            GROUP BY o.order_id
-        ) t
-        {lim};
-        """
-
-    if intent == "daily_sales":
-        return f"""
-        SELECT o.order_date AS day, ROUND(SUM(oi.quantity * p.price), 2) AS revenue
-        FROM orders o
-        JOIN order_items oi ON o.order_id = oi.order_id
-        JOIN products p ON oi.product_id = p.product_id
-        WHERE 1=1 {_date_filters(year)}
-        GROUP BY o.order_date
-        ORDER BY o.order_date ASC
-        {lim};
-        """
-
-    # fallback: show top orders by basket size
-    # If nothing matches, it gives a generic “top orders by total value” query.
-    return f"""
-    SELECT o.order_id, c.name AS customer, o.order_date, SUM(oi.quantity * p.price) AS total
-    FROM orders o
-    JOIN customers c ON o.customer_id = c.customer_id
-    JOIN order_items oi ON o.order_id = oi.order_id
-    JOIN products p ON oi.product_id = p.product_id
-    GROUP BY o.order_id, c.name, o.order_date
-    ORDER BY total DESC
-    {lim};
+    intent = match_intent(question)
+    year = year_from_text(question)
+    if use_rollups is None:
+        use_rollups = rollups_available()
+    template = get_templates()[(intent, bool(use_rollups), year is not None)]
+    return template.sql, bind(template, year, limit)
+
+def generate_sql(question: str, limit: int | None = 10, use_rollups: bool | None = None) -> str:
+    """
+    Same as generate_statement, with the parameters written into the SQL as literals
+    (for display, demos and A/B against the LLM). Prefer generate_statement for execution.
     """
+    sql, params = generate_statement(question, limit, use_rollups)
+    return render(sql, params)
 
 
 # Appending the LLM Integrerated code
@@ -157,11 +43,22 @@ def generate_sql(question: str, limit: int | None = 10) -> str:
 # --- LLM integration (OpenAI) ---
 
 import os                        # read environment variables
+import asyncio                   # async twin of the LLM generator
+import contextlib                # no-op slot when the caller sets no LLM concurrency limit
+import hashlib                   # fingerprint the few-shot set for the LLM cache
+import threading                 # guards the shared client table
+import weakref                   # async clients are kept per event loop
+from functools import lru_cache  # prompt pieces are built once, not per request
 from textwrap import dedent      # clean multi-line string indentation
-try:
-    from openai import OpenAI    # OpenAI client (v1+)
-except Exception:
-    OpenAI = None                # graceful fallback if package missing
+
+# The openai package (OpenAI clients v1+, sync and asyncio) is imported on first LLM use, not here:
+# it costs ~0.5 s of startup that rule-based mode (USE_LLM=false) never needs.
+def _openai():
+    try:
+        import openai
+    except Exception:
+        return None               # graceful fallback if package missing
+    return openai
 
 # Gives the model the exact tables/columns it’s allowed to use. Important: keeps the model “on rails” for SQLite.
 
@@ -213,7 +110,7 @@ SELECT p.name AS product, ROUND(SUM(oi.quantity * p.price), 2) AS revenue
 FROM order_items oi
 JOIN orders o ON oi.order_id = o.order_id
 JOIN products p ON oi.product_id = p.product_id
-WHERE strftime('%Y', o.order_date) = '2024'
+WHERE o.order_date >= '2024-01-01' AND o.order_date < '2025-01-01'
 GROUP BY p.product_id
 ORDER BY revenue DESC;
 """.strip()
@@ -225,40 +122,121 @@ SELECT p.category AS category, ROUND(SUM(oi.quantity * p.price), 2) AS revenue
 FROM order_items oi
 JOIN orders o   ON oi.order_id = o.order_id
 JOIN products p ON oi.product_id = p.product_id
-WHERE strftime('%Y', o.order_date) = '2024'
+WHERE o.order_date >= '2024-01-01' AND o.order_date < '2025-01-01'
 GROUP BY p.category
 ORDER BY revenue DESC
 LIMIT 10;
 """.strip()
-}
+    },
+    {
+        "q": "number of orders by customer",
+        "sql": """
+SELECT c.name AS customer, COUNT(o.order_id) AS orders
+FROM customers c
+JOIN orders o ON o.customer_id = c.customer_id
+GROUP BY c.customer_id
+ORDER BY orders DESC
+LIMIT 10;
+""".strip()
+    },
+    {
+        "q": "average order value in 2025",
+        "sql": """
+SELECT ROUND(AVG(t.total), 2) AS avg_order_value
+FROM (
+  SELECT o.order_id, SUM(oi.quantity * p.price) AS total
+  FROM orders o
+  JOIN order_items oi ON o.order_id = oi.order_id
+  JOIN products p ON oi.product_id = p.product_id
+  WHERE o.order_date >= '2025-01-01' AND o.order_date < '2026-01-01'
+  GROUP BY o.order_id
+) t;
+""".strip()
+    },
+    {
+        "q": "monthly sales in 2024",
+        "sql": """
+SELECT substr(o.order_date, 1, 7) AS month, ROUND(SUM(oi.quantity * p.price), 2) AS revenue
+FROM orders o
+JOIN order_items oi ON o.order_id = oi.order_id
+JOIN products p ON oi.product_id = p.product_id
+WHERE o.order_date >= '2024-01-01' AND o.order_date < '2025-01-01'
+GROUP BY month
+ORDER BY month
+LIMIT 12;
+""".strip()
+    },
+    {
+        "q": "customers per city",
+        "sql": """
+SELECT c.city AS city, COUNT(*) AS customers
+FROM customers c
+GROUP BY c.city
+ORDER BY customers DESC
+LIMIT 10;
+""".strip()
+    },
+    {
+        "q": "best selling products by units",
+        "sql": """
+SELECT p.name AS product, SUM(oi.quantity) AS units
+FROM order_items oi
+JOIN products p ON oi.product_id = p.product_id
+GROUP BY p.product_id
+ORDER BY units DESC
+LIMIT 10;
+""".strip()
+    },
 ]
 
 # Hard constraints to prevent unsafe / irrelevant SQL. Tells the model to output SQL only (no explanations).
+# This is the first message of every request and the only part that never changes: the schema (pruned per
+# question, or the full summary) is the next message. At ~150 tokens it is well under the 1024-token minimum
+# before providers cache a prompt prefix, so it is not a cache hit on its own; putting the stable parts
+# first only pays off for prompts that are long anyway (_bench_prompt reports the cached tokens).
 
-# modified prompt where instead of a defined set of guidelines for the data, it gets it automatically (generalized).
-    
-def _system_prompt():
-    schema_text = get_schema_summary()
-    return f"""
+SYSTEM_PROMPT = """
 You are a SQLite SQL assistant. Return ONLY a valid SQL query — no comments, no prose, no markdown.
 Rules:
 - The output must start with SELECT or WITH (or PRAGMA).
-- Use ONLY the listed tables/columns; do not invent columns.
+- Use ONLY the tables/columns listed under Schema; do not invent columns.
 - Read-only only: no INSERT/UPDATE/DELETE/DDL.
 - If the question says "by X", include X in SELECT and GROUP BY.
 - If no limit is specified, add a reasonable LIMIT.
-Schema:
-{schema_text}
+- Filter dates with ranges on the raw column (o.order_date >= '2024-01-01' AND o.order_date < '2025-01-01'), not strftime().
 """.strip()
 
+# modified prompt where instead of a defined set of guidelines for the data, it gets it automatically (generalized).
+# Only the tables/columns the question needs (src/nlp/schema_context.py), unless pruning is switched off.
+def _schema_context(question: str) -> str:
+    if not get_settings().llm_schema_pruning:
+        return get_schema_summary()
+    return get_schema_index(get_schema()).render(question)
+
 
 # Concatenates examples in a readable “Q: … / SQL: …” format.
-def _fewshot_block():
+def _fewshot_block(examples=None):
     blocks = []
-    for ex in FEW_SHOTS:
+    for ex in FEW_SHOTS if examples is None else examples:
         blocks.append(f"Q: {ex['q']}\nSQL:\n{ex['sql']}")
     return "\n\n".join(blocks)
 
+# The k examples closest to the question (word n-gram similarity, as the LLM cache's paraphrase match),
+# in library order so equal selections render to identical text. k = 0 sends the whole library.
+def _select_fewshots(question: str, k: int) -> list[dict]:
+    if k <= 0 or k >= len(FEW_SHOTS):
+        return FEW_SHOTS
+    q = normalize_question(question)
+    ranked = sorted(range(len(FEW_SHOTS)), key=lambda i: -similarity(q, _FEWSHOT_QUESTIONS[i]))
+    return [FEW_SHOTS[i] for i in sorted(ranked[:k])]
+
+# Short digest of the prompt recipe (rules, few-shot library, selection and pruning settings); part of the
+# LLM cache key so editing any of them invalidates old answers.
+@lru_cache(maxsize=8)
+def _fewshot_fingerprint(k: int = 0, pruned: bool = False):
+    recipe = f"{SYSTEM_PROMPT}\x1f{_fewshot_block()}\x1f{k}\x1f{pruned}"
+    return hashlib.sha1(recipe.encode()).hexdigest()[:16]
+
 # Removes code fences if the model adds them; ensures a trailing semicolon—helpful for SQLite.
 def _clean_sql(s: str) -> str:
     s = s.strip()
@@ -278,6 +256,122 @@ def _clean_sql(s: str) -> str:
 # Cleans the returned text and hands a pure SQL string back.
 
 from src.core.config import get_settings
+from src.core.telemetry import LLM_CACHE, LLM_COALESCED, LLM_PROMPT_TOKENS, LLM_TOKENS, span
+from src.nlp.llm_cache import get_llm_cache, normalize_question, similarity
+from src.nlp.schema_context import get_schema_index
+from src.nlp.singleflight import AsyncSingleFlight, SingleFlight
+from src.sql.rollup_router import route_to_rollup
+from src.sql.runner import _validate_sql
+
+_FEWSHOT_QUESTIONS = [normalize_question(ex["q"]) for ex in FEW_SHOTS]
+
+def _llm_cache_for(limit: int | None, model_name: str):
+    s = get_settings()
+    return get_llm_cache(limit=limit, model=model_name, schema_fp=get_schema().fingerprint,
+                         fewshot_fp=_fewshot_fingerprint(s.llm_fewshots, s.llm_schema_pruning))
+
+# Most stable first: static rules → schema slice (shared by questions about the same tables) → chosen
+# examples → the question. Only the pruned renderer writes a JOINS line, so only then is it explained.
+def _llm_messages(question: str, limit: int | None):
+    user_msg = f"Question: {question}\nReturn only SQL. If appropriate, include LIMIT {limit or 10}."
+    examples = _select_fewshots(question, get_settings().llm_fewshots)
+    schema = _schema_context(question)
+    if any(line.startswith("JOINS ") for line in schema.splitlines()):
+        schema += "\n(JOINS lists how the tables connect.)"
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Schema:\n{schema}"},
+        {"role": "user", "content": _fewshot_block(examples)},
+        {"role": "user", "content": user_msg},
+    ]
+
+# Prompt size before sending: tiktoken when installed (optional), otherwise ~4 characters per token.
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _ENCODING = None
+
+def count_tokens(messages: list[dict]) -> int:
+    text = "".join(m["content"] for m in messages)
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text)) + 4 * len(messages)
+    return len(text) // 4 + 4 * len(messages)
+
+def _check_llm_prereqs():
+    if _openai() is None:
+        raise RuntimeError("openai package not installed. Install 'openai' in your venv.")
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY not set. Put it in your .env.")
+
+# Long-lived clients, one per (API key, base URL): the pooled httpx client keeps connections alive, so only
+# the first call pays connect + TLS. An async pool belongs to the event loop it was opened on, hence per loop.
+_CLIENTS: dict = {}
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+_CLIENTS_LOCK = threading.Lock()
+
+def _http_limits():
+    import httpx
+    n = get_settings().llm_concurrency
+    return httpx.Limits(max_connections=max(n, 100), max_keepalive_connections=n, keepalive_expiry=60)
+
+def _llm_client(settings):
+    openai = _openai()
+    key = (settings.openai_api_key, settings.llm_base_url)
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = _CLIENTS[key] = openai.OpenAI(api_key=settings.openai_api_key, base_url=settings.llm_base_url,
+                                                   http_client=openai.DefaultHttpxClient(limits=_http_limits()))
+    return client
+
+def _async_llm_client(settings):
+    openai = _openai()
+    key = (settings.openai_api_key, settings.llm_base_url)
+    per_loop = _ASYNC_CLIENTS.setdefault(asyncio.get_running_loop(), {})
+    client = per_loop.get(key)
+    if client is None:
+        client = per_loop[key] = openai.AsyncOpenAI(
+            api_key=settings.openai_api_key, base_url=settings.llm_base_url,
+            http_client=openai.DefaultAsyncHttpxClient(limits=_http_limits()))
+    return client
+
+# Concurrent identical generations (same normalized question, limit and model) share one upstream call;
+# see src/nlp/singleflight.py.
+_FLIGHTS = SingleFlight()
+_ASYNC_FLIGHTS = AsyncSingleFlight()
+
+def _flight_key(question: str, limit: int | None, model_name: str) -> tuple:
+    return normalize_question(question), limit, model_name
+
+# LLM aggregates that a rollup can answer are rewritten to read it; the LLM cache keeps the original SQL
+def _routed(sql: str) -> str:
+    if not rollups_available():
+        return sql
+    return route_to_rollup(sql) or sql
+
+# per request: prompt size (as the API reports it, else our estimate) and how much of it the provider served
+# from its prompt cache
+def _count_tokens(resp, messages):
+    usage = getattr(resp, "usage", None)
+    prompt = (getattr(usage, "prompt_tokens", 0) or 0) or count_tokens(messages)
+    LLM_PROMPT_TOKENS.observe(prompt)
+    LLM_TOKENS.inc(prompt, kind="prompt")
+    if usage is not None:
+        LLM_TOKENS.inc(usage.completion_tokens or 0, kind="completion")
+        details = getattr(usage, "prompt_tokens_details", None)
+        LLM_TOKENS.inc(getattr(details, "cached_tokens", 0) or 0, kind="cached")
+
+# only answers that pass the guardrails are worth remembering
+def _remember(cache, question: str, sql: str):
+    if cache is None:
+        return
+    try:
+        _validate_sql(sql)
+        cache.put(question, sql)
+    except ValueError:
+        pass
 
 def generate_sql_with_llm(question: str, limit: int | None = 10) -> str:
     """
@@ -286,31 +380,76 @@ def generate_sql_with_llm(question: str, limit: int | None = 10) -> str:
     """
     
     settings = get_settings()
-    
-    if OpenAI is None:
-        raise RuntimeError("openai package not installed. Install 'openai' in your venv.")
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY not set. Put it in your .env.")
-    
-    client = OpenAI(api_key=settings.openai_api_key)
     model_name = settings.llm_model or "gpt-4o-mini"
-    user_msg = f"Question: {question}\nReturn only SQL. If appropriate, include LIMIT {limit or 10}."
 
-    messages = [
-        {"role": "system", "content": _system_prompt()},
-        {"role": "user", "content": _fewshot_block()},
-        {"role": "user", "content": user_msg},
-    ]
+    # Same question (or a close paraphrase) asked before against the same schema/few-shots/model?
+    # Then skip the round trip entirely.
+    cache = _llm_cache_for(limit, model_name)
+    if cache is not None:
+        cached = cache.get(question)
+        LLM_CACHE.inc(status="miss" if cached is None else "hit")
+        if cached is not None:
+            return _routed(cached)
+
+    _check_llm_prereqs()
+
+    def call():
+        messages = _llm_messages(question, limit)
+        # Using Chat Completions
+        with span("llm"):
+            resp = _llm_client(settings).chat.completions.create(
+                model=model_name,
+                messages=messages,
+                temperature=0,
+            )
+        _count_tokens(resp, messages)
+        sql = _clean_sql(resp.choices[0].message.content or "")
+        _remember(cache, question, sql)
+        return sql
+
+    sql, shared = _FLIGHTS.do(_flight_key(question, limit, model_name), call)
+    if shared:
+        LLM_COALESCED.inc()
+    return _routed(sql)
+
+async def generate_sql_with_llm_async(question: str, limit: int | None = 10,
+                                      slot: asyncio.Semaphore | None = None) -> str:
+    """
+    asyncio twin of generate_sql_with_llm for the async /query path.
+    The network round trip is awaited; the small local steps (cache, schema) run in a worker thread.
+    `slot` (e.g. the API's LLM semaphore) is held by the shared call itself, not by the callers waiting
+    on it: a caller that gives up does not free it while the request is still going upstream.
+    """
+    settings = get_settings()
+    model_name = settings.llm_model or "gpt-4o-mini"
 
-    # Using Chat Completions
-    resp = client.chat.completions.create(
-        model=model_name,
-        messages=messages,
-        temperature=0,
-    )
-    sql = resp.choices[0].message.content
-    return _clean_sql(sql or "")
+    cache = await asyncio.to_thread(_llm_cache_for, limit, model_name)
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, question)
+        LLM_CACHE.inc(status="miss" if cached is None else "hit")
+        if cached is not None:
+            return await asyncio.to_thread(_routed, cached)
+
+    _check_llm_prereqs()
+
+    async def call():
+        messages = await asyncio.to_thread(_llm_messages, question, limit)
+        async with slot or contextlib.nullcontext():
+            with span("llm"):
+                resp = await _async_llm_client(settings).chat.completions.create(
+                    model=model_name,
+                    messages=messages,
+                    temperature=0,
+                )
+        _count_tokens(resp, messages)
+        sql = _clean_sql(resp.choices[0].message.content or "")
+        await asyncio.to_thread(_remember, cache, question, sql)
+        return sql
+
+    sql, shared = await _ASYNC_FLIGHTS.do(_flight_key(question, limit, model_name), call)
+    if shared:
+        LLM_COALESCED.inc()
+    return await asyncio.to_thread(_routed, sql)
 
 
 
@@ -0,0 +1,201 @@
+# Question-relevant slice of the schema for the LLM prompt.
+#
+# The full catalog dump grows with every table, and most of it has nothing to do with any one question.
+# SchemaIndex is built once per schema fingerprint and maps words to tables:
+#   - strong matches: a table name ("customers" -> customer), a column name token ("category",
+#     "city", the "customer" in orders.customer_id), or a measure word ("revenue", "spend", ...) that
+#     stands for the price/quantity columns
+#   - weak matches: time words and years ("daily", "month", "2024") -> a date column: the matched tables'
+#     own, else their neighbours', so "revenue in 2024" brings in orders.order_date but not
+#     customers.join_date
+# The chosen tables are then closed over the join graph (shortest FK paths between them), so every join
+# the answer needs is in the prompt. The join graph is the declared foreign keys, or when a database
+# declares none, inferred from <x>_id columns that another table owns (primary key, or named after x).
+# Tables up to _KEEP_ALL_COLUMNS columns are listed whole; wider ones keep keys, label columns and
+# matched columns. If nothing matches, the whole schema is used (never a guess).
+
+import re
+from collections import deque
+from dataclasses import dataclass
+from threading import Lock
+
+from src.db.schema import Schema, Table
+
+_KEEP_ALL_COLUMNS = 8
+_GENERIC = {"id", "by", "of", "in", "the", "a", "an", "and", "or", "per", "for", "to", "what", "is", "me",
+            "show", "list", "top", "total", "all", "each", "with", "how", "many", "much", "our", "we"}
+# measure words -> the column name tokens that compute them
+_MEASURES = {
+    "revenue": ("price", "quantity"), "sale": ("price", "quantity"), "spend": ("price", "quantity"),
+    "spent": ("price", "quantity"), "value": ("price", "quantity"), "aov": ("price", "quantity"),
+    "amount": ("price", "quantity"), "cost": ("price",), "unit": ("quantity",), "sold": ("quantity",),
+    "bought": ("quantity",), "buyer": ("customer",), "client": ("customer",), "item": ("product",),
+    "sku": ("product",), "basket": ("order",), "purchase": ("order",), "biggest": ("price", "quantity"),
+    "largest": ("price", "quantity"), "best": ("price", "quantity"), "selling": ("quantity",),
+    "seller": ("quantity",), "expensive": ("price",), "cheapest": ("price",),
+}
+_TIME_WORDS = {"date", "day", "daily", "week", "weekly", "month", "monthly", "year", "yearly", "annual",
+               "quarter", "quarterly", "when", "recent", "latest", "last", "trend", "over", "since"}
+_YEAR = re.compile(r"^(19|20)\d\d$")
+_LABELS = ("name", "title")
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _tokens(name: str) -> set[str]:
+    return {_stem(t) for t in re.findall(r"[a-z0-9]+", name.lower())} - {"id"}
+
+
+def _is_date(col_name: str, col_type: str) -> bool:
+    return "DATE" in col_type.upper() or "TIME" in col_type.upper() or "date" in _tokens(col_name)
+
+
+@dataclass(frozen=True)
+class Edge:
+    table: str
+    column: str
+    ref_table: str
+    ref_column: str
+
+    def sql(self) -> str:
+        return f"{self.table}.{self.column} = {self.ref_table}.{self.ref_column}"
+
+
+class SchemaIndex:
+    def __init__(self, schema: Schema):
+        self.schema = schema
+        self.tables = schema.tables
+        self.edges = self._edges(schema)
+        self.graph: dict[str, set[str]] = {t: set() for t in self.tables}
+        for e in self.edges:
+            self.graph[e.table].add(e.ref_table)
+            self.graph[e.ref_table].add(e.table)
+        self.by_table_token: dict[str, set[str]] = {}
+        self.by_column_token: dict[str, set[tuple[str, str]]] = {}
+        for t in self.tables.values():
+            for tok in _tokens(t.name):
+                self.by_table_token.setdefault(tok, set()).add(t.name)
+            for c in t.columns:
+                for tok in _tokens(c.name):
+                    self.by_column_token.setdefault(tok, set()).add((t.name, c.name))
+        self.date_columns = {(t.name, c.name) for t in self.tables.values() for c in t.columns
+                             if _is_date(c.name, c.type)}
+
+    @staticmethod
+    def _edges(schema: Schema) -> tuple[Edge, ...]:
+        declared = tuple(Edge(fk.table, c, fk.ref_table, r) for fk in schema.foreign_keys
+                         for c, r in zip(fk.columns, fk.ref_columns) if fk.table in schema.tables)
+        if declared:
+            return declared
+        # no declared FKs (e.g. tables written by pandas): <x>_id points at the table that owns it, i.e. has
+        # it as primary key or is named after x (orders.customer_id -> customers.customer_id)
+        owner = {}
+        for t in schema.tables.values():
+            for c in t.columns:
+                if c.name.endswith("_id") and (c.pk or _tokens(t.name) == _tokens(c.name[:-3])):
+                    owner.setdefault(c.name, t.name)
+        return tuple(Edge(t.name, c.name, owner[c.name], c.name) for t in schema.tables.values()
+                     for c in t.columns if c.name in owner and owner[c.name] != t.name)
+
+    def select(self, question: str) -> tuple[list[str], dict[str, set[str]]]:
+        """(tables in catalog order, matched columns per table); no tables = nothing matched."""
+        words = re.findall(r"[a-z0-9]+", question.lower())
+        strong: set[str] = set()
+        matched: dict[str, set[str]] = {}
+        timed = False
+        for w in words:
+            if _YEAR.match(w) or w in _TIME_WORDS:
+                timed = True
+                continue
+            tok = _stem(w)
+            if tok in _GENERIC:
+                continue
+            for key in (tok, *_MEASURES.get(tok, ())):
+                strong.update(self.by_table_token.get(key, ()))
+                for t, c in self.by_column_token.get(key, ()):
+                    strong.add(t)
+                    matched.setdefault(t, set()).add(c)
+        if timed:
+            # the matched tables' own date columns; failing that, their neighbours'; failing that, any
+            dated = {t for t, _ in self.date_columns}
+            near = strong & dated or set().union(*(self.graph[t] for t in strong)) & dated or dated
+            for t, c in self.date_columns:
+                if t in near:
+                    strong.add(t)
+                    matched.setdefault(t, set()).add(c)
+        chosen = self._closure(strong)
+        return [t for t in self.tables if t in chosen], matched
+
+    def _closure(self, tables: set[str]) -> set[str]:
+        # grow a connected set: attach each table through its shortest path to what is already chosen
+        order = [t for t in self.tables if t in tables]
+        if not order:
+            return set()
+        tree = {order[0]}
+        for t in order[1:]:
+            if t in tree:
+                continue
+            path = self._path(t, tree)
+            tree.update(path or [t])   # unreachable tables are still listed, just without a join
+        return tree
+
+    def _path(self, start: str, goal: set[str]) -> list[str] | None:
+        prev = {start: None}
+        queue = deque([start])
+        while queue:
+            t = queue.popleft()
+            if t in goal:
+                path = []
+                while t is not None:
+                    path.append(t)
+                    t = prev[t]
+                return path
+            for n in sorted(self.graph[t]):
+                if n not in prev:
+                    prev[n] = t
+                    queue.append(n)
+        return None
+
+    def _columns(self, table: Table, matched: set[str]) -> list:
+        if len(table.columns) <= _KEEP_ALL_COLUMNS:
+            return list(table.columns)
+        keys = {e.column for e in self.edges if e.table == table.name}
+        keys |= {e.ref_column for e in self.edges if e.ref_table == table.name}
+        return [c for c in table.columns
+                if c.pk or c.name in keys or c.name in matched or _tokens(c.name) & set(_LABELS)]
+
+    def render(self, question: str) -> str:
+        """Schema text for the prompt: TABLE lines (as in Schema.summary) plus the joins between them."""
+        tables, matched = self.select(question)
+        if not tables:
+            tables = list(self.tables)
+        chosen = set(tables)
+        lines = []
+        for name in tables:
+            cols = self._columns(self.tables[name], matched.get(name, set()))
+            lines.append(f"TABLE {name} (" + ", ".join(f"{c.name} {c.type or ''}".strip() for c in cols) + ")")
+        joins = [e.sql() for e in self.edges if e.table in chosen and e.ref_table in chosen]
+        if joins:
+            lines.append("JOINS " + "; ".join(joins))
+        return "\n".join(lines)
+
+
+_INDEXES: dict[str, SchemaIndex] = {}
+_LOCK = Lock()
+
+
+def get_schema_index(schema: Schema) -> SchemaIndex:
+    """The index for this schema, built once per schema fingerprint."""
+    idx = _INDEXES.get(schema.fingerprint)
+    if idx is None:
+        with _LOCK:
+            idx = _INDEXES.get(schema.fingerprint)
+            if idx is None:
+                idx = _INDEXES[schema.fingerprint] = SchemaIndex(schema)
+    return idx
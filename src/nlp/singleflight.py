@@ -0,0 +1,69 @@
+# In-process single-flight: concurrent calls with the same key share one execution.
+#
+# When a dashboard opens for many users at once, the same question arrives dozens of times within a
+# second, all of them missing the LLM cache before the first answer has been stored. The first caller
+# (the leader) does the work; everyone who asks for the same key while it is in flight waits for that
+# result (or exception) instead of making their own upstream call. Nothing is kept once the call
+# finishes: remembering answers is the LLM cache's job (src/nlp/llm_cache.py).
+#
+#   SingleFlight       threads (sync generate_sql_with_llm)
+#   AsyncSingleFlight  asyncio (generate_sql_with_llm_async); a waiter being cancelled, e.g. by a client
+#                      disconnect, does not cancel the shared call the others are waiting for
+
+import asyncio
+from concurrent.futures import Future
+from threading import Lock
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = Lock()
+        self._calls: dict = {}
+
+    def do(self, key, fn) -> tuple[object, bool]:
+        """fn() once per key at a time. Returns (result, shared): shared is True for the waiters."""
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._calls[key] = Future()
+        if not leader:
+            return fut.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def inflight(self) -> int:
+        return len(self._calls)
+
+
+class AsyncSingleFlight:
+    def __init__(self):
+        self._calls: dict = {}
+
+    async def do(self, key, factory) -> tuple[object, bool]:
+        """await factory() once per key at a time (per event loop). Returns (result, shared)."""
+        loop = asyncio.get_running_loop()
+        key = (loop, key)
+        task = self._calls.get(key)
+        shared = task is not None
+        if task is None:
+            task = self._calls[key] = loop.create_task(factory())
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task), shared
+
+    def _done(self, key, task: asyncio.Task) -> None:
+        self._calls.pop(key, None)
+        if not task.cancelled():
+            task.exception()   # mark as retrieved: every waiter may have gone away already
+
+    def inflight(self) -> int:
+        return len(self._calls)
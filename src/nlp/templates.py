@@ -0,0 +1,271 @@
+# Statement templates and intent matcher for the rule-based generator (generate_statement in pipeline.py).
+#
+# Every intent is a parameterized statement: the year and row limit are bound at execution time
+# instead of being pasted into the SQL text. So the same few strings reach the runner over and over:
+#   - the guardrail check (sqlglot) runs once per template, when get_templates() first builds them, and stays in its LRU
+#   - sqlite3's per-connection statement cache reuses the prepared statement across requests
+#   - nothing derived from the question ever becomes SQL text
+#
+# Parameters:
+#   :year_start / :year_end   half-open ISO date range on order_date
+#   :row_limit                LIMIT value, -1 = no limit (SQLite semantics); the runner clamps it to its row cap
+# (`:limit` cannot be used as a name: sqlglot reads LIMIT :limit as a missing LIMIT operand.)
+#
+# Questions without a year get a second variant with the date range removed, not an open-ended
+# '0000-01-01'..'9999-12-31' range: SQLite plans before it sees bound values, so a range on
+# order_date would walk idx_orders_date for the whole table (several times slower than a scan).
+#
+# The intent matcher is table-driven: INTENT_RULES lists, per intent, alternative sets of keywords
+# that must all appear. Keywords are compiled once into bit positions, so matching a question is one
+# substring test per distinct keyword plus a few integer comparisons.
+#
+# IntentMatcher.score() also says how sure the match is, for the hybrid router (src/api/routing.py):
+# the share of the question's content words (fillers, the limit and one year dropped) that the matched
+# template accounts for, i.e. its keywords or its INTENT_VOCAB. "top 5 customers by total spend in 2024"
+# scores 1.0; "top customers in texas last month" 0.4 (the template has no state or month filter);
+# fallback_search always scores 0.
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+from sqlglot import expressions as exp
+
+from src.sql.runner import _validate_sql
+
+FALLBACK = "fallback_search"
+
+# first rule that matches wins; each alternative is a tuple of keywords that must all be present
+INTENT_RULES: list[tuple[str, list[tuple[str, ...]]]] = [
+    ("top_customers_by_spend", [("top", "customer")]),
+    ("revenue_by_product", [("revenue", "by product"), ("revenue", "per product"),
+                            ("sales", "by product"), ("sales", "per product")]),
+    ("orders_by_customer", [("orders", "by", "customer")]),
+    ("avg_order_value", [("average order value",), ("aov",)]),
+    ("daily_sales", [("daily sales",), ("sales", "by day")]),
+]
+
+# words each template answers besides its keywords (stemmed like _stem: no plural "s")
+INTENT_VOCAB: dict[str, set[str]] = {
+    "top_customers_by_spend": {"top", "customer", "client", "buyer", "spend", "spending", "spent", "total",
+                               "revenue", "sale", "best", "biggest", "highest", "most", "value"},
+    "revenue_by_product": {"revenue", "sale", "product", "item", "total", "top", "best", "selling", "highest"},
+    "orders_by_customer": {"order", "customer", "client", "count", "number", "most"},
+    "avg_order_value": {"average", "avg", "mean", "order", "value", "aov", "basket", "size"},
+    "daily_sales": {"daily", "sale", "revenue", "day", "total"},
+}
+_FILLER = {"a", "an", "the", "of", "in", "for", "by", "per", "what", "which", "who", "is", "are", "was", "were",
+           "show", "me", "list", "give", "get", "find", "our", "we", "my", "all", "each", "every", "how",
+           "much", "many", "year", "please", "to", "and", "do", "did"}
+
+_YEAR = re.compile(r"(19|20)\d{2}")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+class IntentMatcher:
+    """INTENT_RULES compiled into keyword bitmasks."""
+
+    def __init__(self, rules: list[tuple[str, list[tuple[str, ...]]]]):
+        keywords = list(dict.fromkeys(k for _, alts in rules for alt in alts for k in alt))
+        self._keywords = [(k, 1 << i) for i, k in enumerate(keywords)]
+        bit = dict(self._keywords)
+        self._rules = [(intent, [sum(bit[k] for k in alt) for alt in alts]) for intent, alts in rules]
+        self._vocab = {intent: {_stem(w) for alt in alts for k in alt for w in k.split()} | INTENT_VOCAB.get(intent, set())
+                       for intent, alts in rules}
+
+    def __call__(self, text: str) -> str:
+        t = text.lower()
+        present = 0
+        for kw, b in self._keywords:
+            if kw in t:
+                present |= b
+        for intent, masks in self._rules:
+            for m in masks:
+                if present & m == m:
+                    return intent
+        return FALLBACK
+
+    def score(self, text: str) -> tuple[str, float]:
+        """(intent, confidence in [0, 1]): how much of the question the matched template answers."""
+        intent = self(text)
+        if intent == FALLBACK:
+            return intent, 0.0
+        words = [w for w in _WORD.findall(text.lower()) if w not in _FILLER]
+        years = {w for w in words if _YEAR.fullmatch(w)}
+        content = [_stem(w) for w in words if not w.isdigit()]
+        # one year is a bound parameter; each further year is a filter the template can't express
+        unexplained = sum(w not in self._vocab[intent] for w in content) + max(0, len(years) - 1)
+        total = len(content) + max(0, len(years) - 1)
+        return intent, round(1 - unexplained / total, 3) if total else 1.0
+
+
+match_intent = IntentMatcher(INTENT_RULES)
+
+
+def year_from_text(text: str) -> str | None:
+    # 4-digit year starting with 19 or 20 (1999, 2024, ...), or None
+    m = _YEAR.search(text)
+    return m.group(0) if m else None
+
+
+@dataclass(frozen=True)
+class Template:
+    intent: str
+    sql: str
+    params: tuple[str, ...]     # bind names the statement uses
+    dated: bool                 # filters on :year_start / :year_end
+
+
+_BASE = {
+    "top_customers_by_spend": """
+        SELECT c.name AS customer, ROUND(SUM(oi.quantity * p.price), 2) AS total_spend
+        FROM orders o
+        JOIN customers c ON o.customer_id = c.customer_id
+        JOIN order_items oi ON o.order_id = oi.order_id
+        JOIN products p ON oi.product_id = p.product_id
+        WHERE o.order_date >= :year_start AND o.order_date < :year_end
+        GROUP BY c.customer_id
+        ORDER BY total_spend DESC
+        LIMIT :row_limit""",
+    "revenue_by_product": """
+        SELECT p.name AS product, ROUND(SUM(oi.quantity * p.price), 2) AS revenue
+        FROM order_items oi
+        JOIN orders o ON oi.order_id = o.order_id
+        JOIN products p ON oi.product_id = p.product_id
+        WHERE o.order_date >= :year_start AND o.order_date < :year_end
+        GROUP BY p.product_id
+        ORDER BY revenue DESC
+        LIMIT :row_limit""",
+    "orders_by_customer": """
+        SELECT c.name AS customer, COUNT(DISTINCT o.order_id) AS orders
+        FROM orders o
+        JOIN customers c ON o.customer_id = c.customer_id
+        WHERE o.order_date >= :year_start AND o.order_date < :year_end
+        GROUP BY c.customer_id
+        ORDER BY orders DESC
+        LIMIT :row_limit""",
+    "avg_order_value": """
+        SELECT ROUND(AVG(basket_total), 2) AS avg_order_value
+        FROM (
+            SELECT o.order_id, SUM(oi.quantity * p.price) AS basket_total
+            FROM orders o
+            JOIN order_items oi ON o.order_id = oi.order_id
+            JOIN products p ON oi.product_id = p.product_id
+            WHERE o.order_date >= :year_start AND o.order_date < :year_end
+            GROUP BY o.order_id
+        ) t
+        LIMIT :row_limit""",
+    "daily_sales": """
+        SELECT o.order_date AS day, ROUND(SUM(oi.quantity * p.price), 2) AS revenue
+        FROM orders o
+        JOIN order_items oi ON o.order_id = oi.order_id
+        JOIN products p ON oi.product_id = p.product_id
+        WHERE o.order_date >= :year_start AND o.order_date < :year_end
+        GROUP BY o.order_date
+        ORDER BY o.order_date ASC
+        LIMIT :row_limit""",
+    # no intent matched: top orders by basket size (not year-filtered)
+    FALLBACK: """
+        SELECT o.order_id, c.name AS customer, o.order_date, SUM(oi.quantity * p.price) AS total
+        FROM orders o
+        JOIN customers c ON o.customer_id = c.customer_id
+        JOIN order_items oi ON o.order_id = oi.order_id
+        JOIN products p ON oi.product_id = p.product_id
+        GROUP BY o.order_id, c.name, o.order_date
+        ORDER BY total DESC
+        LIMIT :row_limit""",
+}
+
+# same answers, read from the tables in src/db/rollups.py
+_ROLLUP = {
+    "top_customers_by_spend": """
+        SELECT c.name AS customer, ROUND(SUM(r.revenue), 2) AS total_spend
+        FROM _rollup_customer_daily r
+        JOIN customers c ON r.customer_id = c.customer_id
+        WHERE r.revenue IS NOT NULL AND r.order_date >= :year_start AND r.order_date < :year_end
+        GROUP BY c.customer_id
+        ORDER BY total_spend DESC
+        LIMIT :row_limit""",
+    "revenue_by_product": """
+        SELECT p.name AS product, ROUND(SUM(r.revenue), 2) AS revenue
+        FROM _rollup_product_daily r
+        JOIN products p ON r.product_id = p.product_id
+        WHERE r.order_date >= :year_start AND r.order_date < :year_end
+        GROUP BY p.product_id
+        ORDER BY revenue DESC
+        LIMIT :row_limit""",
+    "avg_order_value": """
+        SELECT ROUND(AVG(r.basket_total), 2) AS avg_order_value
+        FROM _rollup_order_totals r
+        WHERE r.order_date >= :year_start AND r.order_date < :year_end
+        LIMIT :row_limit""",
+    "daily_sales": """
+        SELECT r.order_date AS day, ROUND(SUM(r.revenue), 2) AS revenue
+        FROM _rollup_product_daily r
+        WHERE r.order_date >= :year_start AND r.order_date < :year_end
+        GROUP BY r.order_date
+        ORDER BY r.order_date ASC
+        LIMIT :row_limit""",
+}
+
+_PLACEHOLDER = re.compile(r":(\w+)")
+_YEAR_PARAMS = {"year_start", "year_end"}
+
+
+def _undated(sql: str) -> str:
+    # the same statement without the comparisons against :year_start / :year_end
+    ast = _validate_sql(sql).ast.copy()
+    for select in ast.find_all(exp.Select):
+        where = select.args.get("where")
+        if where is None:
+            continue
+        kept = [c for c in where.this.flatten()
+                if not any(ph.name in _YEAR_PARAMS for ph in c.find_all(exp.Placeholder))]
+        select.set("where", exp.Where(this=exp.and_(*kept)) if kept else None)
+    return ast.sql(dialect="sqlite")
+
+
+def _compile(intent: str, sql: str) -> Template:
+    sql = " ".join(sql.split())
+    _validate_sql(sql)   # raises ValueError (at startup prewarm) if a template ever stops being read-only / parseable
+    params = tuple(dict.fromkeys(_PLACEHOLDER.findall(sql)))
+    return Template(intent, sql, params, dated=bool(_YEAR_PARAMS & set(params)))
+
+
+@lru_cache(maxsize=1)
+def get_templates() -> dict[tuple[str, bool, bool], Template]:
+    """
+    (intent, reads rollups?, year asked?) -> Template, compiled and validated once per process.
+    Built on first use rather than at import (the API's startup prewarm calls it), so importing
+    the module costs no sqlglot parsing.
+    """
+    templates = {}
+    for intent, sql in _BASE.items():
+        for rollup in (False, True):
+            dated = _compile(intent, _ROLLUP[intent] if rollup and intent in _ROLLUP else sql)
+            templates[(intent, rollup, True)] = dated
+            templates[(intent, rollup, False)] = _compile(intent, _undated(dated.sql)) if dated.dated else dated
+    return templates
+
+
+def bind(template: Template, year: str | None, limit: int | None) -> dict:
+    values = {"row_limit": limit if limit else -1}
+    if year:
+        values.update(year_start=f"{year}-01-01", year_end=f"{int(year) + 1}-01-01")
+    return {k: values[k] for k in template.params}
+
+
+def render(sql: str, params: dict) -> str:
+    """`sql` with its parameters inlined as literals (LIMIT -1 dropped), e.g. for display."""
+    ast = _validate_sql(sql).ast.copy()
+    for ph in list(ast.find_all(exp.Placeholder)):
+        value = params[ph.name]
+        if isinstance(ph.parent, exp.Limit) and value is not None and int(value) < 0:
+            ph.parent.pop()
+            continue
+        ph.replace(exp.Literal.number(value) if isinstance(value, (int, float)) else exp.Literal.string(str(value)))
+    return ast.sql(dialect="sqlite")
@@ -0,0 +1,116 @@
+# Cost gate (src/sql/cost.py): estimate vs what the statement really does, and what the check costs.
+#   1) per statement: estimated rows visited, how it was estimated (structure bound or plan), the verdict
+#      at --budget, the structural findings, and the real run time under a --timeout-ms statement budget
+#      (statements the gate rejects should be the ones that run long or hit the timeout)
+#   2) overhead on the statements that pass: check() with a cold verdict cache (EXPLAIN QUERY PLAN) and a
+#      warm one, next to executing them; the guardrail LRU is warm in both, as it is on the request path
+# Works on a synthetic database in a temp dir (data/retail.db is never touched).
+# Run: python -m src.sql._bench_cost [--sf 0.1] [--budget 5e7] [--timeout-ms 3000] [--repeat 20]
+
+import argparse
+import contextlib
+import io
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from src.core.config import get_settings
+from src.db import synth
+from src.db.engine import dispose_engines
+from src.nlp.pipeline import generate_sql
+from src.sql import cost
+from src.sql.runner import Budget, BudgetExceeded, _validate_sql, run_sql_safe
+
+TEMPLATE_QUESTIONS = [
+    "top 5 customers by total spend in 2024",
+    "total revenue by product in 2024",
+    "orders by customer",
+    "average order value in 2025",
+    "daily sales in 2024",
+]
+# shapes an LLM can produce that pass the read-only check
+LLM_STATEMENTS = [
+    "SELECT c.name, COUNT(*) AS orders FROM customers c JOIN orders o ON o.customer_id = c.customer_id "
+    "GROUP BY c.customer_id ORDER BY orders DESC LIMIT 10",
+    "SELECT p.category, SUM(oi.quantity) AS units FROM order_items oi JOIN products p "
+    "ON p.product_id = oi.product_id GROUP BY p.category",
+    "SELECT COUNT(*) FROM customers c, products p, orders o",
+    "SELECT o.order_id, (SELECT SUM(oi.quantity) FROM order_items oi WHERE oi.order_id = o.order_id) AS units "
+    "FROM orders o",
+    "SELECT o.order_id, (SELECT COUNT(*) FROM order_items oi WHERE oi.quantity > o.order_id % 5) AS n "
+    "FROM orders o",
+    "SELECT oi.order_item_id FROM order_items oi ORDER BY oi.quantity * oi.order_item_id DESC",
+    "SELECT COUNT(*) FROM orders o JOIN customers c ON o.order_date = c.join_date",
+]
+
+
+def _run(sql: str, timeout_ms: int) -> str:
+    t0 = time.perf_counter()
+    try:
+        run_sql_safe(sql, budget=Budget(timeout_ms=timeout_ms))
+    except BudgetExceeded as e:
+        return f"{e.kind} after {(time.perf_counter() - t0) * 1000:,.0f} ms"
+    return f"ran in {(time.perf_counter() - t0) * 1000:,.1f} ms"
+
+
+def _median_ms(fn, repeat: int, before=None) -> float:
+    out = []
+    for _ in range(repeat):
+        if before:
+            before()
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(out)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sf", type=float, default=0.1)
+    ap.add_argument("--budget", type=float, default=get_settings().max_query_cost)
+    ap.add_argument("--timeout-ms", type=int, default=3000)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+    settings = get_settings()
+    saved = settings.model_copy()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = str(Path(tmp) / "cost_bench.db")
+            with contextlib.redirect_stdout(io.StringIO()):
+                synth.generate(db, args.sf)
+            dispose_engines()
+            settings.sqlite_path = db
+            settings.max_query_cost = args.budget
+            statements = [generate_sql(q, 10, use_rollups=False) for q in TEMPLATE_QUESTIONS] + LLM_STATEMENTS
+
+            print(f"SF{args.sf:g}, budget {args.budget:,.0f} rows, statement timeout {args.timeout_ms} ms")
+            passed = []
+            for sql in statements:
+                est = cost.estimate(sql)
+                ok = est.rows <= args.budget
+                if ok:
+                    passed.append(sql)
+                print(f"  {'pass' if ok else 'REJECT':<6} {est.rows:>16,.0f} ({est.by:<9}) {_run(sql, args.timeout_ms):<22} "
+                      f"{sql[:58]}{'...' if len(sql) > 58 else ''}")
+                for f in est.findings:
+                    print(f"{'':34}- {f}")
+
+            for sql in passed:
+                _validate_sql(sql)
+            cold = [_median_ms(lambda: cost.check(s), args.repeat, cost.clear_cost_cache) for s in passed]
+            warm = [_median_ms(lambda: cost.check(s), args.repeat) for s in passed]
+            run = [_median_ms(lambda: run_sql_safe(s), max(3, args.repeat // 4)) for s in passed]
+            print(f"overhead on the {len(passed)} passing statements (median of medians): "
+                  f"check cold {statistics.median(cold):.3f} ms (incl. table sizes), warm {statistics.median(warm):.4f} ms; "
+                  f"execute {statistics.median(run):.2f} ms")
+    finally:
+        cost.clear_cost_cache()
+        dispose_engines()
+        for name, value in saved.model_dump().items():
+            setattr(settings, name, value)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Sargable date predicates: the runner's rewrite must keep answers identical and let SQLite use
+# idx_orders_date. Builds a temp database from data/real (data/retail.db is never touched) and checks,
+# for each statement, EXPLAIN QUERY PLAN before/after the rewrite plus the result rows.
+# Run: python -m src.sql._demo_sargable
+
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from src.core.config import get_settings
+from src.db import load_csvs
+from src.db.engine import dispose_engines, get_engine
+from src.nlp.pipeline import generate_sql
+from src.sql.runner import _validate_sql
+
+INDEX = "idx_orders_date"
+SEARCHED = re.compile(rf"SEARCH \w+ USING (COVERING )?INDEX {INDEX} \(order_date")
+
+# (what the LLM / older templates write, must it be rewritten?)
+CASES = [
+    ("SELECT COUNT(*) FROM orders o WHERE strftime('%Y', o.order_date) = '2024'", True),
+    ("SELECT COUNT(*) FROM orders WHERE strftime('%Y-%m', order_date) = '2024-03'", True),
+    ("SELECT COUNT(*) FROM orders WHERE date(order_date) = '2024-04-15'", True),
+    ("SELECT COUNT(*) FROM orders WHERE CAST(strftime('%Y', order_date) AS INTEGER) >= 2025", True),
+    ("SELECT COUNT(*) FROM orders WHERE strftime('%Y', order_date) BETWEEN '2023' AND '2024'", True),
+    ("SELECT COUNT(*) FROM orders WHERE order_date LIKE '2024-12%'", True),
+    ("""SELECT p.name, ROUND(SUM(oi.quantity * p.price), 2) AS revenue
+        FROM order_items oi JOIN orders o ON oi.order_id = o.order_id JOIN products p ON oi.product_id = p.product_id
+        WHERE strftime('%Y-%m', o.order_date) = '2025-02' GROUP BY p.product_id ORDER BY revenue DESC""", True),
+    # not expressible as a range: left alone
+    ("SELECT COUNT(*) FROM orders WHERE strftime('%m', order_date) = '03'", False),
+]
+
+
+def _plan(conn, sql: str) -> str:
+    return " | ".join(r[3] for r in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"))
+
+
+def _rows(conn, sql: str):
+    t0 = time.perf_counter()
+    rows = [tuple(r) for r in conn.exec_driver_sql(sql)]
+    return rows, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db = str(Path(tmp) / "sargable.db")
+        load_csvs.main(db)
+        get_settings().sqlite_path = db
+
+        # the rule-based generator emits ranges directly
+        for q in ["revenue by product in 2024", "daily sales in 2025", "top customers by spend in 2024"]:
+            sql = generate_sql(q, use_rollups=False)
+            ok = "strftime" not in sql and _validate_sql(sql).optimized is None
+            failures += not ok
+            print(f"{'ok ' if ok else 'BAD'} template {q!r} already sargable")
+
+        with get_engine().connect() as conn:
+            for sql, expect_rewrite in CASES:
+                short = " ".join(sql.split())[:70]
+                optimized = _validate_sql(sql).optimized
+                if (optimized is not None) != expect_rewrite:
+                    failures += 1
+                    print(f"BAD rewrite={optimized is not None}: {short}")
+                    continue
+                if optimized is None:
+                    print(f"ok  left alone: {short}")
+                    continue
+                before, after = _plan(conn, sql), _plan(conn, optimized)
+                (base, t_base), (fast, t_fast) = _rows(conn, sql), _rows(conn, optimized)
+                # before: idx_orders_date can at best be scanned end to end; after: it is range-searched
+                ok = not SEARCHED.search(before) and SEARCHED.search(after) and sorted(base) == sorted(fast)
+                failures += not ok
+                print(f"{'ok ' if ok else 'BAD'} {short}")
+                print(f"      before: {before}  ({t_base:.2f} ms)")
+                print(f"      after:  {after}  ({t_fast:.2f} ms)")
+        dispose_engines()
+
+    print(f"\n{'all rewrites range-search ' + INDEX if not failures else f'{failures} failures'}")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
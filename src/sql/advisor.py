@@ -0,0 +1,432 @@
+# Workload-driven index advisor.
+#
+# 1) Collect a workload: statements captured by run_sql_safe (Settings.workload_path file and/or this
+#    process), the LLM answer cache, and, if none of those have anything, the rule-based templates.
+# 2) EXPLAIN QUERY PLAN each statement and note full scans ("SCAN t") and temp B-tree sorts.
+# 3) Derive candidate indexes from the statement's AST for each finding: equality columns first,
+#    then one range column; group/order columns; a covering variant that adds every other column
+#    the statement reads; and expression indexes for function-wrapped predicates.
+# 4) Measure every candidate on a scratch copy of the database (backup API, never the real file):
+#    create it, ANALYZE it, and re-time the statements that touch its table. The benefit is the
+#    count-weighted latency saved.
+#
+# Rollup tables (src/db/rollups.py) are left out: every full load drops and recreates them, so an index
+# added to one would silently disappear; their own indexes are declared in rollups.ROLLUP_DDL instead.
+#
+# Nothing changes unless asked: `--apply` creates the recommended indexes in the real database and
+# reports the workload latency before and after. load_csvs can do the same after ingestion (--advise).
+# Run: python -m src.sql.advisor [--db data/retail.db] [--workload workload.jsonl] [--apply]
+
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sqlglot import expressions as exp
+
+from src.core.config import get_settings
+from src.db.rollups import ROLLUP_TABLES
+from src.sql.runner import _validate_sql, workload_snapshot
+
+# tables smaller than this are cheap to scan; no index is proposed for them
+MIN_ROWS = 1000
+# a candidate must save at least this share of its statements' latency to be recommended
+MIN_GAIN = 0.10
+# widest index proposed (key + covered columns)
+MAX_TERMS = 6
+
+_SCAN = re.compile(r"^SCAN (\S+)")
+_TEMP_BTREE = re.compile(r"USE TEMP B-TREE FOR (.+)$")
+
+
+@dataclass
+class Statement:
+    sql: str
+    count: int = 1
+    params: dict | None = None   # bound values of a parameterized statement (src/nlp/templates.py)
+
+
+@dataclass(frozen=True)
+class Finding:
+    sql: str
+    table: str
+    kind: str      # "scan" or "temp_btree"
+    detail: str    # the EXPLAIN QUERY PLAN line
+
+
+@dataclass(frozen=True)
+class Candidate:
+    table: str
+    terms: tuple[str, ...]   # column names or SQL expressions, in index order
+    reason: str = field(default="", compare=False)
+
+    @property
+    def name(self) -> str:
+        words = [t if re.fullmatch(r"\w+", t) else "expr" for t in self.terms]
+        digest = hashlib.sha1("|".join(self.terms).encode()).hexdigest()[:6]
+        return f"idx_adv_{self.table}_{'_'.join(words)}"[:48] + f"_{digest}"
+
+    @property
+    def ddl(self) -> str:
+        return f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.table}({', '.join(self.terms)});"
+
+
+@dataclass
+class Recommendation:
+    candidate: Candidate
+    statements: int          # workload statements whose plan now uses the index
+    before_ms: float         # count-weighted latency of those statements
+    after_ms: float
+    plan: str                # one plan after the index, for the report
+
+    @property
+    def benefit_ms(self) -> float:
+        return self.before_ms - self.after_ms
+
+
+# --- workload ------------------------------------------------------------------------------------
+
+def load_workload(path: str | Path) -> list[Statement]:
+    """JSON lines of {"sql": ..., "params": optional, "count": optional}; repeated statements are summed."""
+    out: dict[tuple, Statement] = {}
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            row = json.loads(line)
+            params = row.get("params") or None
+            key = (row["sql"], json.dumps(params, sort_keys=True))
+            out.setdefault(key, Statement(row["sql"], 0, params)).count += int(row.get("count", 1))
+    return list(out.values())
+
+
+def _template_workload(db_path: str) -> list[Statement]:
+    from src.nlp.pipeline import generate_sql
+
+    with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as conn:
+        have = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table';")}
+    use_rollups = set(ROLLUP_TABLES) <= have
+    questions = ["top customers by spend", "revenue by product", "orders by customer",
+                 "average order value", "daily sales", "biggest orders"]
+    return [Statement(generate_sql(q + y, limit=10, use_rollups=use_rollups))
+            for q in questions for y in ("", " in 2024", " in 2025")]
+
+
+def default_workload(db_path: str) -> list[Statement]:
+    from src.nlp.llm_cache import cached_statements
+
+    settings = get_settings()
+    sources = []
+    if settings.workload_path and Path(settings.workload_path).exists():
+        sources += load_workload(settings.workload_path)
+    sources += [Statement(e["sql"], e["count"], e.get("params")) for e in workload_snapshot()]
+    sources += [Statement(sql, n) for sql, n in cached_statements()]
+    # _prepare() merges duplicates across sources
+    return sources or _template_workload(db_path)
+
+
+def _prepare(workload: list[Statement]) -> list[Statement]:
+    # only valid SELECTs, as the runner would execute them (sargable rewrite applied), merged by SQL.
+    # Bound values are inlined: EXPLAIN and the timings then see the ranges the statement really ran with.
+    from src.nlp.templates import render
+
+    merged: dict[str, int] = {}
+    for s in workload:
+        try:
+            sql = render(s.sql, s.params) if s.params else s.sql
+            checked = _validate_sql(sql)
+        except (ValueError, KeyError):
+            continue
+        if isinstance(checked.ast, (exp.Select, exp.With, exp.Union)):
+            sql = checked.optimized or sql
+            merged[sql] = merged.get(sql, 0) + s.count
+    return [Statement(sql, n) for sql, n in merged.items()]
+
+
+# --- plans and candidates ------------------------------------------------------------------------
+
+def explain(conn: sqlite3.Connection, sql: str) -> list[str]:
+    return [r[3] for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+class _Catalog:
+    """Columns, row counts and existing index prefixes of the scratch database."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.columns: dict[str, list[str]] = {}
+        self.rowid_pk: dict[str, str] = {}
+        self.rows: dict[str, int] = {}
+        self.index_terms: dict[str, list[tuple[str, ...]]] = {}
+        for (t,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%';"):
+            info = conn.execute(f'SELECT name, type, pk FROM pragma_table_info("{t}");').fetchall()
+            self.columns[t] = [r[0] for r in info]
+            pks = [r for r in info if r[2]]
+            if len(pks) == 1 and pks[0][1].upper() == "INTEGER":
+                self.rowid_pk[t] = pks[0][0]
+            self.rows[t] = conn.execute(f'SELECT COUNT(*) FROM "{t}";').fetchone()[0]
+            self.index_terms[t] = [
+                tuple(r[0] or "<expr>" for r in conn.execute(
+                    f'SELECT name FROM pragma_index_info("{ix}") ORDER BY seqno;'))
+                for (ix,) in conn.execute(f'SELECT name FROM pragma_index_list("{t}");')
+            ]
+
+    def redundant(self, c: Candidate) -> bool:
+        # an existing index already starts with these terms, or it would lead with the rowid
+        if c.terms[0] == self.rowid_pk.get(c.table):
+            return True
+        return any(ix[:len(c.terms)] == c.terms for ix in self.index_terms.get(c.table, []))
+
+
+def _uses(select: exp.Select, alias: str, table: str, catalog: _Catalog):
+    """Columns of `alias` in one SELECT: equality, range, expression terms, group/order, all read."""
+    aliases = {}
+    for t in [select.args["from"].this] + [j.this for j in select.args.get("joins") or []]:
+        if isinstance(t, exp.Table):
+            aliases[t.alias_or_name] = t.name
+    cols = set(catalog.columns.get(table, []))
+
+    def mine(c: exp.Column) -> bool:
+        if c.table:
+            return c.table == alias
+        owners = [a for a, tn in aliases.items() if c.name in catalog.columns.get(tn, [])]
+        return owners == [alias] and c.name in cols
+
+    eq, rng, exprs, order, read = [], [], [], [], []
+    conds = []
+    for clause in [select.args.get("where")] + [j.args.get("on") for j in select.args.get("joins") or []]:
+        if clause is not None:
+            node = clause.this if isinstance(clause, exp.Where) else clause
+            conds += node.flatten() if isinstance(node, exp.And) else [node]
+    for cond in conds:
+        if isinstance(cond, exp.Paren):
+            cond = cond.this
+        if isinstance(cond, (exp.EQ, exp.In, exp.GT, exp.GTE, exp.LT, exp.LTE, exp.Between, exp.Like)):
+            side = cond.this
+            other = [v for k, v in cond.args.items() if k != "this" and isinstance(v, exp.Expression)]
+            if isinstance(side, exp.Column) and mine(side):
+                target = eq if isinstance(cond, (exp.EQ, exp.In)) else rng
+                target.append(side.name)
+            elif isinstance(cond, exp.EQ) and isinstance(cond.expression, exp.Column) and mine(cond.expression):
+                eq.append(cond.expression.name)
+            elif (not isinstance(side, (exp.Column, exp.Literal)) and list(side.find_all(exp.Column))
+                  and all(isinstance(c, exp.Column) and mine(c) for c in side.find_all(exp.Column))
+                  and all(isinstance(o, exp.Literal) for o in other)):
+                exprs.append(side.sql(dialect="sqlite").replace(f"{alias}.", ""))
+    for key in ("group", "order"):
+        node = select.args.get(key)
+        if node is not None:
+            for e in node.expressions:
+                e = e.this if isinstance(e, exp.Ordered) else e
+                if isinstance(e, exp.Column) and mine(e):
+                    order.append(e.name)
+    for c in select.find_all(exp.Column):
+        if mine(c) and c.name not in read:
+            read.append(c.name)
+    dedupe = lambda xs: list(dict.fromkeys(xs))
+    return dedupe(eq), dedupe(rng), dedupe(exprs), dedupe(order), read
+
+
+def _candidates(table: str, eq, rng, exprs, order, read, reason: str) -> list[Candidate]:
+    out = []
+
+    def add(key: list[str], why: str):
+        if not key:
+            return
+        key = list(dict.fromkeys(key))
+        out.append(Candidate(table, tuple(key), why))
+        covering = key + [c for c in read if c not in key]
+        if len(key) < len(covering) <= MAX_TERMS:
+            out.append(Candidate(table, tuple(covering), why + ", covering"))
+
+    add(eq + rng[:1], f"{reason}: filter/join columns")
+    add(eq + order, f"{reason}: group/order columns")
+    for e in exprs:
+        out.append(Candidate(table, (e,), f"{reason}: expression predicate"))
+    return out
+
+
+def findings_and_candidates(conn: sqlite3.Connection, workload: list[Statement], catalog: _Catalog):
+    findings, candidates = [], {}
+    for stmt in workload:
+        ast = _validate_sql(stmt.sql).ast
+        selects = [s for s in ast.find_all(exp.Select) if s.args.get("from") is not None]
+        for line in explain(conn, stmt.sql):
+            m, t = _SCAN.match(line), _TEMP_BTREE.search(line)
+            targets = []
+            if m:
+                alias = m.group(1)
+                for s in selects:
+                    for tbl in [s.args["from"].this] + [j.this for j in s.args.get("joins") or []]:
+                        if isinstance(tbl, exp.Table) and tbl.alias_or_name == alias:
+                            targets.append((s, alias, tbl.name, "scan"))
+            elif t:
+                # attribute the sort to the tables whose columns it orders by
+                for s in selects:
+                    for tbl in [s.args["from"].this] + [j.this for j in s.args.get("joins") or []]:
+                        if isinstance(tbl, exp.Table):
+                            targets.append((s, tbl.alias_or_name, tbl.name, "temp_btree"))
+            for s, alias, table, kind in targets:
+                if table not in catalog.columns or table in ROLLUP_TABLES or catalog.rows.get(table, 0) < MIN_ROWS:
+                    continue
+                eq, rng, exprs, order, read = _uses(s, alias, table, catalog)
+                if kind == "temp_btree" and not order:
+                    continue
+                findings.append(Finding(stmt.sql, table, kind, line))
+                for c in _candidates(table, eq, rng, exprs, order, read, kind):
+                    if not catalog.redundant(c):
+                        candidates.setdefault(c, c)
+    return findings, list(candidates)
+
+
+# --- measurement ---------------------------------------------------------------------------------
+
+def _time(conn: sqlite3.Connection, sql: str, repeat: int, timeout_ms: int) -> float:
+    runs = []
+    # one untimed warm-up run, so "before" isn't charged for a cold page cache
+    for _ in range(repeat + 1):
+        deadline = time.monotonic() + timeout_ms / 1000
+        conn.set_progress_handler(lambda: int(time.monotonic() > deadline), 1000)
+        t0 = time.perf_counter()
+        try:
+            conn.execute(sql).fetchall()
+        except sqlite3.OperationalError:
+            pass   # interrupted: counts as the full timeout
+        finally:
+            conn.set_progress_handler(None, 0)
+        runs.append((time.perf_counter() - t0) * 1000)
+    return min(runs[1:])   # best of: the least noisy estimate on a shared machine
+
+
+def measure(conn: sqlite3.Connection, workload: list[Statement], repeat: int = 3) -> dict[str, float]:
+    """Best-of-`repeat` warm latency (ms) of each statement."""
+    timeout = get_settings().statement_timeout_ms or 5000
+    return {s.sql: _time(conn, s.sql, repeat, timeout) for s in workload}
+
+
+def _tables_of(sql: str) -> set[str]:
+    return {t.name for t in _validate_sql(sql).ast.find_all(exp.Table)}
+
+
+def evaluate(scratch: sqlite3.Connection, workload: list[Statement], candidates: list[Candidate],
+             repeat: int = 3) -> list[Recommendation]:
+    base = measure(scratch, workload, repeat)
+    tables = {s.sql: _tables_of(s.sql) for s in workload}
+    results = []
+    for c in candidates:
+        affected = [s for s in workload if c.table in tables[s.sql]]
+        scratch.execute(c.ddl)
+        scratch.execute(f"ANALYZE {c.name};")
+        try:
+            used, before, after, plan = 0, 0.0, 0.0, ""
+            for s in affected:
+                lines = explain(scratch, s.sql)
+                if not any(c.name in line for line in lines):
+                    continue
+                used += 1
+                before += base[s.sql] * s.count
+                after += _time(scratch, s.sql, repeat, get_settings().statement_timeout_ms or 5000) * s.count
+                plan = plan or " | ".join(lines)
+        finally:
+            scratch.execute(f"DROP INDEX IF EXISTS {c.name};")
+        if used:
+            results.append(Recommendation(c, used, before, after, plan))
+    return results
+
+
+def recommend(results: list[Recommendation], min_gain: float = MIN_GAIN) -> list[Recommendation]:
+    # best first; one index per (table, leading term) so near-duplicates don't all get created
+    chosen, leads = [], set()
+    for r in sorted(results, key=lambda r: r.benefit_ms, reverse=True):
+        if r.before_ms <= 0 or r.benefit_ms / r.before_ms < min_gain:
+            continue
+        lead = (r.candidate.table, r.candidate.terms[0])
+        if lead in leads:
+            continue
+        leads.add(lead)
+        chosen.append(r)
+    return chosen
+
+
+def advise(db_path: str, workload: list[Statement] | None = None, repeat: int = 3,
+           min_gain: float = MIN_GAIN):
+    """-> (findings, recommendations); the database itself is only read (via a scratch copy)."""
+    workload = _prepare(workload if workload is not None else default_workload(db_path))
+    with tempfile.TemporaryDirectory() as tmp:
+        src = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        scratch = sqlite3.connect(str(Path(tmp) / "scratch.db"), isolation_level=None)
+        try:
+            src.backup(scratch)
+            scratch.execute("PRAGMA analysis_limit = 1000;")
+            scratch.execute("ANALYZE;")
+            catalog = _Catalog(scratch)
+            findings, candidates = findings_and_candidates(scratch, workload, catalog)
+            results = evaluate(scratch, workload, candidates, repeat)
+        finally:
+            src.close()
+            scratch.close()
+    return findings, recommend(results, min_gain)
+
+
+def apply(db_path: str, recommendations: list[Recommendation], workload: list[Statement] | None = None,
+          repeat: int = 3) -> tuple[float, float]:
+    """Create the recommended indexes in `db_path`; returns workload latency (ms) before and after."""
+    workload = _prepare(workload if workload is not None else default_workload(db_path))
+    ro = lambda: sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+    with ro() as conn:
+        times = measure(conn, workload, repeat)
+        before = sum(times[s.sql] * s.count for s in workload)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE;")
+        for r in recommendations:
+            conn.execute(r.candidate.ddl)
+            conn.execute(f"ANALYZE {r.candidate.name};")
+        conn.execute("COMMIT;")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK;")
+        raise
+    finally:
+        conn.close()
+    with ro() as conn:
+        times = measure(conn, workload, repeat)
+        after = sum(times[s.sql] * s.count for s in workload)
+    return before, after
+
+
+def report(findings: list[Finding], recommendations: list[Recommendation]) -> None:
+    print(f"{len(findings)} findings")
+    for f in findings:
+        print(f"  {f.kind:<10} {f.table:<12} {f.detail}   <- {' '.join(f.sql.split())[:70]}")
+    print(f"\n{len(recommendations)} recommended indexes")
+    for r in recommendations:
+        gain = r.benefit_ms / r.before_ms * 100 if r.before_ms else 0
+        print(f"  {r.candidate.ddl}")
+        print(f"      {r.candidate.reason}; {r.statements} statement(s), "
+              f"{r.before_ms:.2f} -> {r.after_ms:.2f} ms weighted ({gain:.0f}% faster)")
+        print(f"      plan: {r.plan}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", default=get_settings().sqlite_path)
+    ap.add_argument("--workload", help="JSON lines of {\"sql\": ..., \"count\": ...} (default: captured/cached/templates)")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--min-gain", type=float, default=MIN_GAIN)
+    ap.add_argument("--apply", action="store_true", help="create the recommended indexes in --db")
+    args = ap.parse_args()
+
+    workload = load_workload(args.workload) if args.workload else None
+    findings, recs = advise(args.db, workload, args.repeat, args.min_gain)
+    report(findings, recs)
+    if args.apply and recs:
+        before, after = apply(args.db, recs, workload, args.repeat)
+        print(f"\napplied {len(recs)} indexes: workload {before:.2f} ms -> {after:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
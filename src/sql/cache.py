@@ -0,0 +1,133 @@
+# Result cache in front of run_sql_safe.
+#
+# Dashboards fire the same handful of questions every few seconds; each one re-runs a multi-table join.
+# Results are kept in memory, keyed on the canonical SQL (from the guardrail LRU) plus db_version(),
+# which changes as soon as load_csvs commits new data. Entries also expire after a TTL, and the
+# cache evicts least-recently-used entries once their estimated size exceeds a byte budget.
+
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+
+from src.core.config import get_settings
+from src.core.telemetry import RESULT_CACHE, span
+from src.db.engine import db_version
+from src.sql.runner import Budget, _validate_sql, default_budget, run_sql_safe
+
+# cache status strings surfaced to API clients
+HIT, MISS, BYPASS = "hit", "miss", "bypass"
+
+
+@dataclass
+class _Entry:
+    cols: list[str]
+    rows: list[list]
+    nbytes: int
+    expires_at: float
+
+
+def _approx_size(cols: list[str], rows: list[list]) -> int:
+    # rough in-memory footprint: list headers + every cell object (good enough for a budget)
+    size = sys.getsizeof(rows) + sum(sys.getsizeof(c) for c in cols)
+    for r in rows:
+        size += sys.getsizeof(r)
+        for v in r:
+            size += sys.getsizeof(v)
+    return size
+
+
+class ResultCache:
+    """Thread-safe LRU of query results with a byte budget and per-entry TTL."""
+
+    def __init__(self, max_bytes: int, ttl_s: float):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= now:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.cols, entry.rows
+
+    def put(self, key: tuple, cols: list[str], rows: list[list]) -> None:
+        nbytes = _approx_size(cols, rows)
+        if nbytes > self.max_bytes:
+            return  # a single oversized result would flush everything else; don't cache it
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = _Entry(cols, rows, nbytes, time.monotonic() + self.ttl_s)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))   # evict least recently used
+
+    def _drop(self, key: tuple) -> None:
+        self._bytes -= self._entries.pop(key).nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def info(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+_CACHE: ResultCache | None = None
+_CACHE_LOCK = Lock()
+
+
+def get_result_cache() -> ResultCache:
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                s = get_settings()
+                _CACHE = ResultCache(s.result_cache_max_bytes, s.result_cache_ttl_s)
+    return _CACHE
+
+
+def run_sql_cached(sql: str, budget: Budget | None = None, params: dict | None = None):
+    """
+    Same contract as run_sql_safe (including BudgetExceeded), plus a cache status.
+    Returns: (columns, rows, status) where status is "hit", "miss" or "bypass".
+    Cached rows are shared between callers, so treat them as read-only.
+    """
+    settings = get_settings()
+    budget = budget or default_budget()
+    if settings.result_cache_max_bytes <= 0:
+        cols, rows = run_sql_safe(sql, budget, params)
+        RESULT_CACHE.inc(status=BYPASS)
+        return cols, rows, BYPASS
+
+    with span("validate"):
+        checked = _validate_sql(sql)   # raises on unsafe SQL before we ever look at the cache
+    # the row cap and bound parameters change what a statement returns, so they are part of the key
+    # (timeouts are not)
+    key = (checked.canonical, tuple(sorted((params or {}).items())), budget.max_rows, db_version())
+    cache = get_result_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        RESULT_CACHE.inc(status=HIT)
+        return cached[0], cached[1], HIT
+
+    cols, rows = run_sql_safe(sql, budget, params)
+    cache.put(key, cols, rows)
+    RESULT_CACHE.inc(status=MISS)
+    return cols, rows, MISS
@@ -0,0 +1,297 @@
+# Pre-execution cost gate for SQL the LLM wrote. src/api/routing.py calls check() before it accepts an LLM
+# answer; a statement over budget is never run, the request gets the template answer instead. Templates
+# are written by hand and skip the gate.
+#
+# _validate_sql only proves a statement is read-only. A cross join, a correlated subquery over order_items
+# or a sort of a huge intermediate result is read-only too, and would run until the statement timeout.
+# check() estimates the rows the statement will visit, without running it:
+#   1) structure (sqlglot, no database): the row count of every table reference, and per SELECT the join
+#      graph of its FROM/JOIN sources built from the ON / WHERE equalities. Sources left unconnected are a
+#      cartesian product; joins that aren't on a known key (declared FK, or the <x>_id link
+#      src/nlp/schema_context.py infers) and correlated subqueries are noted too. When even the product of
+#      all table references fits the budget, no plan can exceed it and the check ends here.
+#   2) plan: EXPLAIN QUERY PLAN (prepares, doesn't run) of the statement the runner would execute, costed
+#      as nested loops: SCAN t = rows(t); SEARCH = rows per key, divided by 4 per range bound; loops in one
+#      SELECT multiply; correlated subqueries run once per outer row, other subqueries once; temp B-tree
+#      sorts cost n*log2(n). Rows per key: sqlite_stat1 if present; else from the join graph: 1 on the
+#      table that owns the key (products.product_id), rows(child) / rows(parent) on a referencing column
+#      (orders.customer_id); else SQLite's own default guess of 10.
+#      LIMIT is ignored: the estimate is for running the statement to completion, an upper bound.
+# Row counts come from sqlite_stat1 when ANALYZE has been run, else MAX(rowid) (a b-tree probe), cached per
+# db_version(). Verdicts are cached per (statement, db_version()), so a repeated LLM answer costs a dict
+# lookup. Over Settings.max_query_cost (0 disables) -> BudgetExceeded(kind="cost"), with the estimate and
+# the structural findings in the message.
+
+import math
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+
+from sqlglot import expressions as exp
+
+from src.core.config import get_settings
+from src.core.telemetry import QUERY_COST, QUERY_ERRORS
+from src.db.engine import db_version, get_engine
+from src.db.schema import get_schema
+from src.nlp.schema_context import get_schema_index
+from src.sql.runner import BudgetExceeded, _validate_sql
+
+_DEFAULT_ROWS = 1000          # a table we couldn't size
+_EQ_ROWS = 10                 # rows per equality lookup without sqlite_stat1 (SQLite assumes the same)
+_PLAN = re.compile(r"^(SCAN|SEARCH) (\S+)(?: USING (.*))?$")
+_TERM = re.compile(r"(\w+)(=|>=|<=|>|<)\?")
+_VERDICTS_MAX = 256
+
+
+@dataclass(frozen=True)
+class Estimate:
+    rows: float                       # estimated rows visited
+    findings: tuple[str, ...] = ()    # structural notes: cross joins, non-key joins, correlated subqueries
+    by: str = "plan"                  # "structure" (bound, no EXPLAIN) or "plan"
+
+
+@dataclass(frozen=True)
+class _Stats:
+    rows: dict[str, float]                    # table (lower case) -> rows
+    per_key: dict[str, tuple[float, ...]]     # index -> avg rows per key prefix (sqlite_stat1)
+    fanout: dict[tuple[str, str], float]      # (table, column) -> rows per value, from the join graph
+
+
+_STATS: dict[tuple, _Stats] = {}
+_VERDICTS: "OrderedDict[tuple, Estimate]" = OrderedDict()
+_LOCK = Lock()
+
+
+def _load_stats() -> _Stats:
+    schema = get_schema()
+    rows, per_key = {}, {}
+    with get_engine().connect() as conn:
+        has_stat1 = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'").first()
+        if has_stat1:
+            for tbl, idx, stat in conn.exec_driver_sql("SELECT tbl, idx, stat FROM sqlite_stat1"):
+                nums = [float(n) for n in (stat or "").split() if n.isdigit()]
+                if nums:
+                    rows[tbl.lower()] = nums[0]
+                    if idx:
+                        per_key[idx] = tuple(nums[1:])
+        for name in (*schema.tables, *schema.internal_tables):
+            if name.lower() in rows:
+                continue
+            try:
+                n = conn.exec_driver_sql(f'SELECT MAX(rowid) FROM "{name}"').scalar()
+            except Exception:     # WITHOUT ROWID table
+                n = None
+            rows[name.lower()] = float(n) if n is not None else _DEFAULT_ROWS
+    fanout = {}
+    for e in get_schema_index(schema).edges:
+        child, parent = e.table.lower(), e.ref_table.lower()
+        fanout[(parent, e.ref_column.lower())] = 1.0
+        fanout[(child, e.column.lower())] = max(rows.get(child, _DEFAULT_ROWS) / max(rows.get(parent, 1.0), 1.0), 1.0)
+    return _Stats(rows, per_key, fanout)
+
+
+def _stats(version: tuple) -> _Stats:
+    stats = _STATS.get(version)
+    if stats is None:
+        stats = _load_stats()
+        with _LOCK:
+            _STATS.clear()
+            _STATS[version] = stats
+    return stats
+
+
+# --- structure ------------------------------------------------------------------------------------
+
+def _scope_sources(select: exp.Select, ctes: set[str]) -> dict[str, str | None]:
+    """alias -> table name (None for a derived table or CTE) of the FROM/JOIN sources of one SELECT."""
+    out = {}
+    nodes = [select.args.get("from")] + list(select.args.get("joins") or [])
+    for node in nodes:
+        src = node.this if node is not None else None
+        if isinstance(src, exp.Table):
+            out[src.alias_or_name.lower()] = None if src.name.lower() in ctes else src.name.lower()
+        elif isinstance(src, exp.Subquery):
+            out[src.alias_or_name.lower()] = None
+    return out
+
+
+def _own(select: exp.Select, node: exp.Expression) -> bool:
+    # node belongs to this SELECT, not to a subquery nested in it
+    return node.find_ancestor(exp.Select) is select
+
+
+def _structure(ast: exp.Expression, stats: _Stats) -> tuple[float, list[str]]:
+    """(product of the row counts of all table references, findings)."""
+    ctes = {c.alias_or_name.lower() for c in ast.find_all(exp.CTE)}
+    refs = [t.name.lower() for t in ast.find_all(exp.Table) if t.name.lower() not in ctes]
+    bound = math.prod(max(stats.rows.get(t, _DEFAULT_ROWS), 1.0) for t in refs)
+
+    keys = set()
+    for e in get_schema_index(get_schema()).edges:
+        keys.add((e.table.lower(), e.column.lower(), e.ref_table.lower(), e.ref_column.lower()))
+        keys.add((e.ref_table.lower(), e.ref_column.lower(), e.table.lower(), e.column.lower()))
+    columns = {t.lower(): {c.lower() for c in table.column_names} for t, table in get_schema().tables.items()}
+
+    findings = []
+    for select in ast.find_all(exp.Select):
+        sources = _scope_sources(select, ctes)
+        if len(sources) > 1:
+            findings += _join_findings(select, sources, keys, columns)
+        outer = select.parent_select
+        derived = isinstance(select.parent, exp.Subquery) and isinstance(select.parent.parent, (exp.From, exp.Join))
+        if outer is not None and not derived and not isinstance(select.parent, exp.CTE):
+            mine = set(sources)
+            outer_aliases = set()
+            s = outer
+            while s is not None:
+                outer_aliases |= set(_scope_sources(s, ctes))
+                s = s.parent_select
+            refs_out = {c.table.lower() for c in select.find_all(exp.Column) if c.table} - mine
+            if refs_out & outer_aliases:
+                inner = ", ".join(sorted(t or a for a, t in sources.items())) or "a subquery"
+                findings.append(f"correlated subquery over {inner} (runs once per outer row)")
+    return bound, findings
+
+
+def _join_findings(select, sources, keys, columns) -> list[str]:
+    def owner(col: exp.Column) -> str | None:
+        if col.table:
+            return col.table.lower() if col.table.lower() in sources else None
+        hits = [a for a, t in sources.items() if t and col.name.lower() in columns.get(t, ())]
+        return hits[0] if len(hits) == 1 else None
+
+    parent = {a: a for a in sources}
+
+    def find(a):
+        while parent[a] != a:
+            a = parent[a]
+        return a
+
+    findings = []
+    for eq in select.find_all(exp.EQ):
+        if not _own(select, eq) or not (isinstance(eq.left, exp.Column) and isinstance(eq.right, exp.Column)):
+            continue
+        a, b = owner(eq.left), owner(eq.right)
+        if a is None or b is None or a == b:
+            continue
+        parent[find(a)] = find(b)
+        ta, tb = sources[a], sources[b]
+        if ta and tb and (ta, eq.left.name.lower(), tb, eq.right.name.lower()) not in keys:
+            findings.append(f"join on non-key columns {eq.left.sql()} = {eq.right.sql()}")
+    groups: dict[str, list[str]] = {}
+    for a in sources:
+        groups.setdefault(find(a), []).append(sources[a] or a)
+    if len(groups) > 1:
+        findings.append("cross join: " + " x ".join("+".join(sorted(g)) for g in groups.values()))
+    return findings
+
+
+# --- plan -----------------------------------------------------------------------------------------
+
+def _search_rows(table: str, table_rows: float, using: str, stats: _Stats) -> float:
+    terms = _TERM.findall(using.rsplit("(", 1)[-1]) if "(" in using else []
+    eq = [c.lower() for c, op in terms if op == "="]
+    ranges = sum(op != "=" for _, op in terms)
+    if eq and "PRIMARY KEY" in using and not ranges:
+        return 1.0
+    rows = table_rows
+    if eq:
+        m = re.search(r"INDEX (\S+)", using)
+        avg = stats.per_key.get(m.group(1), ()) if m else ()
+        if len(avg) >= len(eq):
+            rows = avg[len(eq) - 1]
+        else:
+            rows = min((stats.fanout[(table, c)] for c in eq if (table, c) in stats.fanout),
+                       default=min(_EQ_ROWS, table_rows))
+    return max(rows / 4 ** ranges, 1.0)
+
+
+def _plan_cost(plan: list[tuple], alias_tables: dict[str, str], stats: _Stats) -> float:
+    children: dict[int, list[tuple]] = {}
+    for node_id, parent, _, detail in plan:
+        children.setdefault(parent, []).append((node_id, detail))
+    derived: dict[str, float] = {}     # materialized subquery / CTE -> rows it produces
+
+    def walk(parent: int, outer: float) -> tuple[float, float]:
+        work, rows = 0.0, 1.0
+        for node_id, detail in children.get(parent, []):
+            m = _PLAN.match(detail)
+            if m and m.group(2) != "CONSTANT":
+                name, using = m.group(2).lower(), m.group(3) or ""
+                table = alias_tables.get(name, name)
+                n = derived.get(name, stats.rows.get(table, _DEFAULT_ROWS))
+                if "AUTOMATIC" in using:
+                    work += outer * n                     # the transient index is built first
+                rows *= n if m.group(1) == "SCAN" else _search_rows(table, n, using, stats)
+                work += outer * rows
+            elif detail.startswith("USE TEMP B-TREE"):
+                work += outer * rows * math.log2(rows + 2)
+            elif detail.startswith("CORRELATED"):
+                work += walk(node_id, outer * rows)[0]
+            elif detail.startswith(("MATERIALIZE", "CO-ROUTINE")):
+                w, r = walk(node_id, 1.0)
+                work += w
+                derived[detail.split(" ", 1)[-1].lower()] = r
+            elif detail.startswith("COMPOUND"):
+                parts = [walk(c, outer) for c, _ in children.get(node_id, [])]
+                work += sum(w for w, _ in parts)
+                rows *= max(sum(r for _, r in parts), 1.0)
+            elif "SUBQUERY" in detail:
+                work += walk(node_id, 1.0)[0]             # uncorrelated: evaluated once
+            else:                                         # MULTI-INDEX OR and the like
+                work += walk(node_id, outer * rows)[0]
+        return work, rows
+
+    return walk(0, 1.0)[0]
+
+
+def estimate(sql: str) -> Estimate:
+    """Estimated rows the statement visits, cached per (statement, db_version())."""
+    entry = _validate_sql(sql)
+    version = db_version()
+    key = (entry.canonical, version)
+    with _LOCK:
+        cached = _VERDICTS.get(key)
+        if cached is not None:
+            _VERDICTS.move_to_end(key)
+            return cached
+
+    stats = _stats(version)
+    bound, findings = _structure(entry.ast, stats)
+    budget = get_settings().max_query_cost
+    if budget and bound * math.log2(bound + 2) <= budget:
+        est = Estimate(bound, tuple(findings), by="structure")
+    else:
+        runnable = (entry.optimized or sql).rstrip().rstrip(";")
+        with get_engine().connect() as conn:
+            plan = [tuple(r) for r in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {runnable}")]
+        aliases = {t.alias_or_name.lower(): t.name.lower() for t in entry.ast.find_all(exp.Table)}
+        est = Estimate(_plan_cost(plan, aliases, stats), tuple(findings), by="plan")
+    QUERY_COST.observe(est.rows, by=est.by)
+
+    with _LOCK:
+        _VERDICTS[key] = est
+        while len(_VERDICTS) > _VERDICTS_MAX:
+            _VERDICTS.popitem(last=False)
+    return est
+
+
+def check(sql: str) -> Estimate:
+    """Raise BudgetExceeded(kind="cost") when the estimated work is over Settings.max_query_cost."""
+    budget = get_settings().max_query_cost
+    if not budget:
+        return Estimate(0.0, by="off")
+    est = estimate(sql)
+    if est.rows > budget:
+        QUERY_ERRORS.inc(kind="cost")
+        why = f" ({'; '.join(est.findings)})" if est.findings else ""
+        raise BudgetExceeded("cost", f"estimated {est.rows:,.0f} rows visited, budget {budget:,.0f}{why}")
+    return est
+
+
+def clear_cost_cache() -> None:
+    with _LOCK:
+        _VERDICTS.clear()
+        _STATS.clear()
@@ -0,0 +1,210 @@
+# Rewrites LLM-generated aggregates so they read the rollup tables (src/db/rollups.py) instead of
+# joining orders × order_items × products on every request.
+#
+# The matcher is deliberately narrow. It only rewrites a statement when every part of it maps onto a
+# rollup, and returns None otherwise (the original SQL then runs unchanged):
+#   - one SELECT, no CTEs / subqueries / window functions / SELECT *
+#   - FROM/JOIN over orders, order_items, products (+ optionally customers), each once, INNER joins
+#     whose ON clauses are exactly the foreign-key equalities
+#   - aggregates are SUM(oi.quantity * p.price) (→ revenue) or SUM(oi.quantity) (→ quantity)
+#   - every other column is o.order_date, or a product (or customer) attribute, anywhere in the query
+# Product dimensions are answered from _rollup_product_daily, customer dimensions from
+# _rollup_customer_daily, date-only / grand totals from _rollup_product_daily.
+
+from sqlglot import expressions as exp
+
+from src.db.schema import get_schema
+from src.sql.runner import _validate_sql
+
+_FACT_TABLES = {"orders", "order_items", "products"}
+_ALLOWED_TABLES = _FACT_TABLES | {"customers"}
+
+# the join conditions that keep the row set identical to the rollups' own INNER joins
+_FK_EDGES = {
+    frozenset({("order_items", "order_id"), ("orders", "order_id")}),
+    frozenset({("order_items", "product_id"), ("products", "product_id")}),
+    frozenset({("orders", "customer_id"), ("customers", "customer_id")}),
+}
+
+_TARGETS = {
+    # dimension table -> (rollup, join onto the dimension table)
+    "products": ("_rollup_product_daily", "product_id"),
+    "customers": ("_rollup_customer_daily", "customer_id"),
+}
+# columns of the rollups a rewrite can read from (src/db/rollups.py ROLLUP_DDL)
+_ROLLUP_COLUMNS = {"order_date", "product_id", "customer_id", "quantity", "revenue", "orders"}
+
+
+class _NoMatch(Exception):
+    pass
+
+
+def _tables(select: exp.Select) -> dict[str, str]:
+    # alias -> table name, for FROM and every JOIN
+    if select.args.get("from") is None:
+        raise _NoMatch
+    refs = [select.args["from"].this] + [j.this for j in select.args.get("joins") or []]
+    aliases = {}
+    for t in refs:
+        if not isinstance(t, exp.Table) or t.name not in _ALLOWED_TABLES or t.args.get("db"):
+            raise _NoMatch
+        if t.alias_or_name in aliases or t.name in aliases.values():
+            raise _NoMatch
+        aliases[t.alias_or_name] = t.name
+    if not _FACT_TABLES <= set(aliases.values()):
+        raise _NoMatch
+    return aliases
+
+
+def _check_joins(select: exp.Select, resolve) -> None:
+    edges = set()
+    for j in select.args.get("joins") or []:
+        if j.args.get("side") or j.args.get("kind") not in (None, "INNER") or j.args.get("using"):
+            raise _NoMatch
+        on = j.args.get("on")
+        if on is None:
+            raise _NoMatch
+        for cond in on.flatten() if isinstance(on, exp.And) else [on]:
+            if not (isinstance(cond, exp.EQ) and isinstance(cond.this, exp.Column)
+                    and isinstance(cond.expression, exp.Column)):
+                raise _NoMatch
+            edge = frozenset({resolve(cond.this), resolve(cond.expression)})
+            if edge not in _FK_EDGES:
+                raise _NoMatch
+            edges.add(edge)
+    tables = set(resolve.aliases.values())
+    # a spanning tree over the joined tables: no cross joins, nothing extra
+    needed = {e for e in _FK_EDGES if {t for t, _ in e} <= tables}
+    if edges != needed:
+        raise _NoMatch
+
+
+class _Resolver:
+    """Maps a Column node to (table, column) using the query's aliases and the live schema."""
+
+    def __init__(self, aliases: dict[str, str]):
+        self.aliases = aliases
+        schema = get_schema()
+        self.columns = {t: set(schema.tables[t].column_names) for t in set(aliases.values()) if t in schema.tables}
+        if len(self.columns) != len(set(aliases.values())):
+            raise _NoMatch
+
+    def __call__(self, col: exp.Column) -> tuple[str, str]:
+        name = col.name
+        if col.table:
+            table = self.aliases.get(col.table)
+            if table is None or name not in self.columns[table]:
+                raise _NoMatch
+            return table, name
+        owners = [t for t, cols in self.columns.items() if name in cols]
+        if len(owners) != 1:
+            raise _NoMatch
+        return owners[0], name
+
+
+def _measure(node: exp.Sum, resolve) -> str:
+    arg = node.this
+    if isinstance(arg, exp.Paren):
+        arg = arg.this
+    if isinstance(arg, exp.Column) and resolve(arg) == ("order_items", "quantity"):
+        return "quantity"
+    if isinstance(arg, exp.Mul) and all(isinstance(a, exp.Column) for a in (arg.this, arg.expression)):
+        if {resolve(arg.this), resolve(arg.expression)} == {("order_items", "quantity"), ("products", "price")}:
+            return "revenue"
+    raise _NoMatch
+
+
+def _rewrite(select: exp.Select) -> exp.Select:
+    if select.args.get("with") or select.find(exp.Window, exp.Star) is not None:
+        raise _NoMatch
+    if any(s is not select for s in select.find_all(exp.Select)):
+        raise _NoMatch
+
+    aliases = _tables(select)
+    select_aliases = {e.alias for e in select.expressions if isinstance(e, exp.Alias)}
+    resolve = _Resolver(aliases)
+    _check_joins(select, resolve)
+
+    out = select.copy()
+    out.set("joins", None)
+    out.set("from", None)
+
+    measures = []
+    for node in list(out.find_all(exp.Sum)):
+        kind = _measure(node, resolve)
+        measures.append(kind)
+        node.set("this", exp.column(kind, table="r"))
+    if not measures or any(isinstance(a, exp.AggFunc) and not isinstance(a, exp.Sum)
+                           for a in out.find_all(exp.AggFunc)):
+        raise _NoMatch
+
+    # ORDER BY / GROUP BY / HAVING naming an output alias that is also a rollup column (e.g. "revenue"):
+    # after the rewrite SQLite would bind it to r.revenue, the per-day value, so spell out the expression
+    outputs = {e.alias: e.this for e in out.expressions if isinstance(e, exp.Alias)}
+    for col in list(out.find_all(exp.Column)):
+        if (not col.table and col.name in outputs and col.name in _ROLLUP_COLUMNS
+                and col.find_ancestor(exp.Group, exp.Order, exp.Having)):
+            if any(col.name in cols for cols in resolve.columns.values()):
+                raise _NoMatch
+            col.replace(outputs[col.name].copy())
+
+    # every remaining column is a dimension; decide which rollup can answer it
+    dims = set()
+    columns = []
+    for col in out.find_all(exp.Column):
+        if col.table == "r" and col.name in ("quantity", "revenue"):
+            continue
+        if not col.table and col.name in select_aliases and col.find_ancestor(exp.Group, exp.Order, exp.Having):
+            # ORDER BY / GROUP BY / HAVING naming an output alias; if it is also a column, the meaning is murky
+            if any(col.name in cols for cols in resolve.columns.values()):
+                raise _NoMatch
+            continue
+        table, name = resolve(col)
+        if (table, name) == ("orders", "order_date"):
+            columns.append((col, "r", "order_date"))
+        elif (table, name) in (("orders", "customer_id"), ("customers", "customer_id")):
+            dims.add("customers")
+            columns.append((col, "r", "customer_id"))
+        elif (table, name) in (("order_items", "product_id"), ("products", "product_id")):
+            dims.add("products")
+            columns.append((col, "r", "product_id"))
+        elif table in ("products", "customers"):
+            dims.add(table)
+            columns.append((col, table[0], name))
+        else:
+            raise _NoMatch
+    if not out.args.get("group") and any(c.find_ancestor(exp.AggFunc) is None
+                                         for e in out.expressions for c in e.find_all(exp.Column)):
+        raise _NoMatch   # bare columns next to an aggregate: SQLite picks an arbitrary row
+    if "customers" in aliases.values():
+        # the base join drops orders whose customer is missing, so the rollup must be joined the same way
+        dims.add("customers")
+    if len(dims) > 1 or ("customers" in dims and "quantity" in measures):
+        raise _NoMatch
+    dim = next(iter(dims), "products")
+    rollup, key = _TARGETS[dim]
+
+    for col, table, name in columns:
+        col.replace(exp.column(name, table=table))
+
+    out.set("from", exp.From(this=exp.to_table(rollup).as_("r")))
+    if dim in aliases.values() and (dim == "customers" or any(t == dim[0] for _, t, _ in columns)):
+        out = out.join(f"{dim} AS {dim[0]}", on=f"r.{key} = {dim[0]}.{key}", join_type="inner", copy=False)
+    if dim == "customers":
+        # days where a customer's orders had no items: absent from the base join
+        out = out.where("r.revenue IS NOT NULL", copy=False)
+    return out
+
+
+def route_to_rollup(sql: str) -> str | None:
+    """Return `sql` rewritten to read a rollup table, or None if it cannot be answered from one."""
+    try:
+        checked = _validate_sql(sql)
+    except ValueError:
+        return None
+    if not isinstance(checked.ast, exp.Select):
+        return None
+    try:
+        return _rewrite(checked.ast).sql(dialect="sqlite")
+    except _NoMatch:
+        return None
@@ -1,12 +1,23 @@
-# sqlalchemy.create_engine → opens a connection to the SQLite database.
 # sqlalchemy.text → wraps a raw SQL string safely for execution.
 # sqlglot → parses SQL into a syntax tree so we can inspect and validate it.
-# get_settings() → reads the sqlite_path from your config file so the runner knows which database to use.
+# get_engine() → the shared, pooled, read-only engine for the sqlite_path in your config file.
 
-from sqlalchemy import create_engine, text
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from functools import lru_cache
+from threading import Lock
+
+from sqlalchemy import text
 import sqlglot
 from sqlglot import expressions as exp
 from src.core.config import get_settings
+from src.core.telemetry import QUERY_ERRORS, ROWS_RETURNED, span
+from src.db.engine import get_engine
 
 # Allow only read-only top-level statements. Everything else will be rejected.
 # We only want to execute safe queries — no DELETE, UPDATE, or DROP.
@@ -16,57 +27,472 @@ from src.core.config import get_settings
 # PRAGMA – safe SQLite metadata queries
 
 
+# The rule-based templates produce the same few statements over and over, so the verdict of
+# every validation is remembered in a small LRU. Repeated SQL skips sqlglot parsing entirely.
+@dataclass(frozen=True)
+class ValidatedSQL:
+    ok: bool
+    error: str | None = None
+    ast: exp.Expression | None = None   # shared between callers: .copy() before mutating
+    canonical: str | None = None        # sqlglot re-rendering of the statement (sqlite dialect)
+    optimized: str | None = None        # index-friendly rewrite to execute instead (None: run as written)
 
-def _validate_sql(sql: str) -> None:
-    """
-    Parse the SQL with sqlglot and ensure the top-level statement is read-only.
-    Raise ValueError if it's not safe.
-    """
-    
+
+_VALIDATION_CACHE: "OrderedDict[str, ValidatedSQL]" = OrderedDict()
+_VALIDATION_LOCK = Lock()
+_VALIDATION_STATS = {"hits": 0, "misses": 0}
+
+# quoted strings/identifiers are kept verbatim; comments and any other run of whitespace collapse to one
+# space. Comments have to go, not just their whitespace: "... --\nWHERE x = 1" and "... -- WHERE x = 1"
+# are different statements, which a whitespace-only key would share an entry between.
+_WS_OR_QUOTED = re.compile(
+    r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`(?:[^`]|``)*`|\[[^\]]*\])|(?:\s|--[^\n]*|/\*.*?(?:\*/|\Z))+""",
+    re.DOTALL,
+)
+
+
+def _normalize_sql(sql: str) -> str:
+    return _WS_OR_QUOTED.sub(lambda m: m.group(1) or " ", sql).strip()
+
+
+def _sql_key(sql: str) -> str:
+    return hashlib.blake2b(_normalize_sql(sql).encode(), digest_size=16).hexdigest()
+
+
+def _parse_and_check(sql: str) -> ValidatedSQL:
     try:
         parsed: exp = sqlglot.parse_one(sql, read="sqlite") # parses SQL into abstract syntax tree (AST)
     except Exception as e:
-        raise ValueError(f"SQL parse error: {e}") # raises error if cant be parsed
-    
+        return ValidatedSQL(ok=False, error=f"SQL parse error: {e}") # cant be parsed
+
     # Allow only SELECT / WITH / PRAGMA at the top level
     if not isinstance(parsed, (exp.Select, exp.With, exp.Pragma)):
-        raise ValueError(
-            f"Only read-only queries are allowed (SELECT/CTE/PRAGMA). Got: {type(parsed).__name__}"
+        return ValidatedSQL(
+            ok=False,
+            error=f"Only read-only queries are allowed (SELECT/CTE/PRAGMA). Got: {type(parsed).__name__}",
         )
+    rewritten = _sargable(parsed)
+    optimized = rewritten.sql(dialect="sqlite") if rewritten is not None else None
+    return ValidatedSQL(ok=True, ast=parsed, canonical=parsed.sql(dialect="sqlite"), optimized=optimized)
+
+
+# --- sargable date predicates --------------------------------------------------------------------
+# strftime('%Y', o.order_date) = '2024' has to evaluate strftime on every row, so an index on
+# order_date is useless. Dates here are ISO-8601 TEXT, which sorts chronologically, so the same
+# filter can be written as a half-open range on the bare column:
+#     o.order_date >= '2024-01-01' AND o.order_date < '2025-01-01'
+# The pass below does that for strftime('%Y' | '%Y-%m' | '%Y-%m-%d', col), date(col),
+# CAST(strftime('%Y', col) AS INTEGER) and col LIKE '2024-03%', compared with constants via
+# = < <= > >= or BETWEEN. Only columns named like dates (order_date, join_date, ...) are touched,
+# because the rewrite relies on them holding ISO text rather than numbers.
+_DATE_COLUMN = re.compile(r"(^|_)date$", re.IGNORECASE)
+_DATE_PREFIX = re.compile(r"\d{4}(-\d{2}){0,2}")
+_GRAINS = {"%Y": "year", "%Y-%m": "month", "%Y-%m-%d": "day"}
+_FLIP = {exp.GT: exp.LT, exp.GTE: exp.LTE, exp.LT: exp.GT, exp.LTE: exp.GTE, exp.EQ: exp.EQ}
+
+
+def _date_operand(node: exp.Expression):
+    # -> (column, grain, cast_to_int) when `node` is a date function over a bare date-named column
+    cast = isinstance(node, exp.Cast) and node.to.this in (exp.DataType.Type.INT, exp.DataType.Type.BIGINT)
+    if cast:
+        node = node.this
+    if isinstance(node, exp.TimeToStr) and isinstance(node.this, exp.TsOrDsToTimestamp):
+        fmt, col = node.args.get("format"), node.this.this
+        grain = _GRAINS.get(fmt.name) if isinstance(fmt, exp.Literal) else None
+    elif isinstance(node, exp.Date) and len(node.expressions) == 0 and not cast:
+        col, grain = node.this, "day"
+    else:
+        return None
+    if grain is None or (cast and grain != "year"):
+        return None
+    if not (isinstance(col, exp.Column) and _DATE_COLUMN.search(col.name)):
+        return None
+    return col, grain, cast
+
+
+def _bounds(value: exp.Expression, grain: str, cast: bool):
+    # -> ('2024-01-01', '2025-01-01'): the [first, next) range of ISO strings for one year/month/day
+    if not isinstance(value, exp.Literal) or value.is_string == cast:
+        return None
+    v = value.name
+    try:
+        if grain == "year" and re.fullmatch(r"\d{4}", v):
+            y = int(v)
+            return f"{y:04d}-01-01", f"{y + 1:04d}-01-01"
+        if grain == "month" and re.fullmatch(r"\d{4}-\d{2}", v):
+            y, m = map(int, v.split("-"))
+            first = date(y, m, 1)
+            nxt = date(y + (m == 12), m % 12 + 1, 1)
+            return first.isoformat(), nxt.isoformat()
+        if grain == "day" and re.fullmatch(r"\d{4}-\d{2}-\d{2}", v):
+            d = date.fromisoformat(v)
+            return d.isoformat(), (d + timedelta(days=1)).isoformat()
+    except ValueError:
+        return None
+    return None
+
+
+def _range(col: exp.Column, lo: str | None, hi: str | None) -> exp.Expression:
+    parts = []
+    if lo is not None:
+        parts.append(exp.GTE(this=col.copy(), expression=exp.Literal.string(lo)))
+    if hi is not None:
+        parts.append(exp.LT(this=col.copy(), expression=exp.Literal.string(hi)))
+    return exp.Paren(this=exp.and_(*parts)) if len(parts) > 1 else parts[0]
+
+
+def _sargable_node(node: exp.Expression) -> exp.Expression | None:
+    if isinstance(node, exp.Like) and isinstance(node.this, exp.Column) and _DATE_COLUMN.search(node.this.name):
+        if isinstance(node.parent, exp.Escape):
+            return None
+        pattern = node.expression
+        if isinstance(pattern, exp.Literal) and pattern.is_string and pattern.name.endswith("%"):
+            prefix = pattern.name[:-1]
+            if _DATE_PREFIX.fullmatch(prefix):
+                # every string starting with `prefix` sorts in [prefix, prefix with its last char bumped)
+                return _range(node.this, prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        return None
+
+    if isinstance(node, exp.Between):
+        operand = _date_operand(node.this)
+        if operand is None:
+            return None
+        col, grain, cast = operand
+        low, high = _bounds(node.args["low"], grain, cast), _bounds(node.args["high"], grain, cast)
+        if low is None or high is None:
+            return None
+        return _range(col, low[0], high[1])
+
+    cls = type(node)
+    if cls not in _FLIP:
+        return None
+    left, right = node.this, node.expression
+    operand = _date_operand(left)
+    if operand is None:
+        operand, right, cls = _date_operand(right), left, _FLIP[cls]
+        if operand is None:
+            return None
+    col, grain, cast = operand
+    bounds = _bounds(right, grain, cast)
+    if bounds is None:
+        return None
+    lo, hi = bounds
+    return {
+        exp.EQ: lambda: _range(col, lo, hi),
+        exp.GTE: lambda: _range(col, lo, None),
+        exp.GT: lambda: _range(col, hi, None),
+        exp.LT: lambda: _range(col, None, lo),
+        exp.LTE: lambda: _range(col, None, hi),
+    }[cls]()
+
+
+def _sargable(ast: exp.Expression) -> exp.Expression | None:
+    """Return a copy of `ast` with date-function predicates turned into column ranges, or None if none apply."""
+    if not isinstance(ast, (exp.Select, exp.With, exp.Union)):
+        return None
+    out = ast.copy()
+    changed = False
+    for node in list(out.find_all(exp.EQ, exp.GT, exp.GTE, exp.LT, exp.LTE, exp.Between, exp.Like)):
+        new = _sargable_node(node)
+        if new is not None:
+            node.replace(new)
+            changed = True
+    return out if changed else None
+
+
+def _validate_sql(sql: str) -> ValidatedSQL:
+    """
+    Parse the SQL with sqlglot and ensure the top-level statement is read-only.
+    Raise ValueError if it's not safe; otherwise return the cached ValidatedSQL entry.
+    """
+    key = _sql_key(sql)
+    with _VALIDATION_LOCK:
+        entry = _VALIDATION_CACHE.get(key)
+        if entry is not None:
+            _VALIDATION_CACHE.move_to_end(key)
+            _VALIDATION_STATS["hits"] += 1
+    if entry is None:
+        entry = _parse_and_check(sql)   # parse outside the lock so threads don't serialize on sqlglot
+        with _VALIDATION_LOCK:
+            _VALIDATION_STATS["misses"] += 1
+            _VALIDATION_CACHE[key] = entry
+            while len(_VALIDATION_CACHE) > get_settings().sql_cache_size:
+                _VALIDATION_CACHE.popitem(last=False)   # evict least recently used
+
+    if not entry.ok:
+        raise ValueError(entry.error)
+    return entry
+
+
+def validation_cache_info() -> dict:
+    """Hit/miss counters and current size of the validated-SQL LRU."""
+    with _VALIDATION_LOCK:
+        return {**_VALIDATION_STATS, "size": len(_VALIDATION_CACHE), "maxsize": get_settings().sql_cache_size}
+
+
+def clear_validation_cache() -> None:
+    with _VALIDATION_LOCK:
+        _VALIDATION_CACHE.clear()
+        _VALIDATION_STATS.update(hits=0, misses=0)
+
+# --- workload capture -----------------------------------------------------------------------------
+# Every statement run_sql_safe executes is tallied here (per canonical SQL: the SQL actually executed,
+# call count, total latency) so src/sql/advisor.py can look at the real workload. Bounded LRU, like
+# the validation cache; with Settings.workload_path set, each new statement is also appended to a
+# JSON-lines file the advisor can read from another process.
+_WORKLOAD: "OrderedDict[str, dict]" = OrderedDict()
+_WORKLOAD_LOCK = Lock()
+
 
-def run_sql_safe(sql: str):
+def _record_workload(canonical: str, exec_sql: str, params: dict | None, elapsed_ms: float) -> None:
+    settings = get_settings()
+    if settings.workload_max_statements <= 0:
+        return
+    with _WORKLOAD_LOCK:
+        entry = _WORKLOAD.get(canonical)
+        if entry is not None:
+            _WORKLOAD.move_to_end(canonical)
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            return
+        # a parameterized statement is tallied once; the first bound values are kept to replay it
+        _WORKLOAD[canonical] = {"sql": exec_sql, "params": params, "count": 1, "total_ms": elapsed_ms}
+        while len(_WORKLOAD) > settings.workload_max_statements:
+            _WORKLOAD.popitem(last=False)
+    if settings.workload_path:
+        try:
+            with open(settings.workload_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"sql": exec_sql, "params": params}) + "\n")
+        except OSError:
+            pass   # capture is best effort; never fail a query over it
+
+
+def workload_snapshot() -> list[dict]:
+    """Captured statements, most used first: [{"sql", "params", "count", "total_ms"}, ...]."""
+    with _WORKLOAD_LOCK:
+        items = [dict(e) for e in _WORKLOAD.values()]
+    return sorted(items, key=lambda e: e["count"], reverse=True)
+
+
+def clear_workload() -> None:
+    with _WORKLOAD_LOCK:
+        _WORKLOAD.clear()
+
+# --- execution budgets --------------------------------------------------------------------------
+# QueryRequest.limit is only a hint in the LLM prompt, so the runner enforces its own limits:
+# - wall-clock timeout and VM-instruction budget, checked from SQLite's progress handler
+#   (returning non-zero from the handler aborts the running statement cleanly)
+# - hard caps on rows and (approximate) bytes fetched
+# - a LIMIT injected into the outer SELECT when it has none or a larger one
+class BudgetExceeded(Exception):
+    """A statement ran past one of its execution budgets (kind: timeout, vm_steps, rows, bytes)."""
+
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        self.kind = kind
+
+
+@dataclass(frozen=True)
+class Budget:
+    timeout_ms: int | None = None
+    max_vm_steps: int | None = None
+    max_rows: int | None = None
+    max_bytes: int | None = None
+
+    def tightened(self, timeout_ms: int | None = None) -> "Budget":
+        # callers may only lower the configured ceiling, never raise it
+        if timeout_ms is None:
+            return self
+        if self.timeout_ms is not None:
+            timeout_ms = min(timeout_ms, self.timeout_ms)
+        return Budget(timeout_ms, self.max_vm_steps, self.max_rows, self.max_bytes)
+
+
+def default_budget() -> Budget:
+    s = get_settings()
+    return Budget(
+        timeout_ms=s.statement_timeout_ms or None,
+        max_vm_steps=s.max_vm_steps or None,
+        max_rows=s.max_result_rows or None,
+        max_bytes=s.max_result_bytes or None,
+    )
+
+
+# SQLite calls the handler every _PROGRESS_OPS virtual-machine instructions
+_PROGRESS_OPS = 1000
+
+
+class _ProgressGuard:
+    def __init__(self, budget: Budget):
+        self.timeout_s = budget.timeout_ms / 1000 if budget.timeout_ms else None
+        self.max_steps = budget.max_vm_steps
+        self.tripped: str | None = None
+        self.restart()
+
+    def restart(self) -> None:
+        # a fresh allowance; iter_sql_safe gives one to every chunk it fetches
+        self.deadline = time.monotonic() + self.timeout_s if self.timeout_s is not None else None
+        self.steps = 0
+
+    def __call__(self) -> int:
+        self.steps += _PROGRESS_OPS
+        if self.max_steps is not None and self.steps > self.max_steps:
+            self.tripped = "vm_steps"
+            return 1
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.tripped = "timeout"
+            return 1
+        return 0
+
+    def error(self, budget: Budget) -> BudgetExceeded:
+        if self.tripped == "timeout":
+            return BudgetExceeded("timeout", f"query exceeded the {budget.timeout_ms} ms time budget")
+        return BudgetExceeded("vm_steps", f"query exceeded the {budget.max_vm_steps:,} VM-step budget")
+
+
+@lru_cache(maxsize=512)
+def _with_row_cap(sql: str, cap: int) -> str:
     """
-    Validate then execute the SQL against our SQLite DB.
+    Return SQL whose outer SELECT is limited to at most `cap` rows.
+    Returns `sql` unchanged when it already has a literal LIMIT <= cap (or isn't a SELECT).
+    """
+    entry = _validate_sql(sql)
+    if not isinstance(entry.ast, exp.Select):
+        return sql
+    limit = entry.ast.args.get("limit")
+    if limit is not None:
+        value = limit.expression
+        if not (isinstance(value, exp.Literal) and value.is_int):
+            return sql           # e.g. a bound parameter: the fetch-side row cap still applies
+        if int(value.name) <= cap:
+            return sql
+    capped = entry.ast.copy()    # never mutate the shared AST from the LRU
+    capped.set("limit", exp.Limit(expression=exp.Literal.number(cap)))
+    return capped.sql(dialect="sqlite")
+
+
+def _cell_bytes(v) -> int:
+    return len(v) if isinstance(v, (str, bytes)) else 8
+
+
+def _clamp_limit_param(checked: ValidatedSQL, params: dict | None, cap: int | None) -> dict | None:
+    # LIMIT :row_limit can't get a literal LIMIT injected, so the bound value is clamped to the cap instead
+    if not params or cap is None or not isinstance(checked.ast, exp.Select):
+        return params
+    limit = checked.ast.args.get("limit")
+    if limit is None or not isinstance(limit.expression, exp.Placeholder):
+        return params
+    name = limit.expression.name
+    value = params.get(name)
+    if value is None or int(value) < 0 or int(value) > cap:
+        params = {**params, name: cap}
+    return params
+
+
+def run_sql_safe(sql: str, budget: Budget | None = None, params: dict | None = None):
+    """
+    Validate then execute the SQL against our SQLite DB, within an execution budget
+    (defaults to the configured one). Raises BudgetExceeded if the budget is blown.
+    `params` are bound to :name placeholders (see src/nlp/templates.py); they never become SQL text.
     Returns: (columns: list[str], rows: list[list])
     """
     
     # This is the main entry point other parts of your app (like the API) will use.
     
-    _validate_sql(sql) # validates it according to the function above
+    with span("validate"):
+        checked = _validate_sql(sql) # validates it according to the function above
+        budget = budget or default_budget()
+        plain_sql = checked.optimized or sql   # sargable rewrite, only when it changed anything
+        exec_sql = _with_row_cap(plain_sql, budget.max_rows) if budget.max_rows else plain_sql
+        params = _clamp_limit_param(checked, params, budget.max_rows)
 
-    # gets the settings from config.py
-    settings = get_settings()
-    
-    # opens a connection to the database
-    engine = create_engine(f"sqlite:///{settings.sqlite_path}")
-
-    with engine.connect() as conn: # opens a connection
-        
-        # executes the sql safely
-        result = conn.execute(text(sql))
-        
-        # grabs all the returned rows
-        rows = result.fetchall()
-        
-        # gets column names from result
-        cols = list(result.keys())
-
-    # Convert Row objects to plain lists for easy JSON serialization
-    
-    # Converts the SQLAlchemy Row objects into plain Python lists (JSON-friendly).
+    # reuses the process-wide read-only engine (no new engine / file open per request)
+    engine = get_engine()
+    guard = _ProgressGuard(budget)
+    started = time.perf_counter()
+
+    with span("execute"), engine.connect() as conn: # borrows a pooled connection
+        raw = conn.connection.driver_connection
+        if guard.deadline is not None or guard.max_steps is not None:
+            raw.set_progress_handler(guard, _PROGRESS_OPS)
+        try:
+            # executes the sql safely
+            result = conn.execute(text(exec_sql), params or {})
+
+            # gets column names from result
+            cols = list(result.keys())
+
+            # grabs the returned rows in chunks, converting Row objects to plain lists (JSON-friendly)
+            # and stopping as soon as a row/byte cap is crossed instead of materializing everything first
+            rows: list[list] = []
+            nbytes = 0
+            while True:
+                chunk = result.fetchmany(1000)
+                if not chunk:
+                    break
+                for r in chunk:
+                    rows.append(list(r))
+                    if budget.max_bytes is not None:
+                        nbytes += sum(_cell_bytes(v) for v in r)
+                if budget.max_rows is not None and len(rows) > budget.max_rows:
+                    raise BudgetExceeded("rows", f"query returned more than {budget.max_rows:,} rows")
+                if budget.max_bytes is not None and nbytes > budget.max_bytes:
+                    raise BudgetExceeded("bytes", f"query returned more than {budget.max_bytes:,} bytes")
+        except BudgetExceeded as e:
+            QUERY_ERRORS.inc(kind=e.kind)
+            raise
+        except Exception:
+            if guard.tripped:
+                QUERY_ERRORS.inc(kind=guard.tripped)
+                raise guard.error(budget) from None   # the "interrupted" error came from our handler
+            QUERY_ERRORS.inc(kind="sqlite")
+            raise
+        finally:
+            raw.set_progress_handler(None, 0)
+
+    ROWS_RETURNED.observe(len(rows))
+    _record_workload(checked.canonical, plain_sql, params, (time.perf_counter() - started) * 1000)
     # Returns a tuple (columns, rows) that higher layers (like your API) can easily serialize into a response.
-    
-    return cols, [list(r) for r in rows]
+    return cols, rows
+
+
+def iter_sql_safe(sql: str, chunk_size: int = 1000, params: dict | None = None, budget: Budget | None = None):
+    """
+    Streaming twin of run_sql_safe for exports: validate once, then read the result in chunks.
+    Yields the column list first, then lists of row tuples (at most chunk_size rows each),
+    so memory stays flat no matter how many rows the query returns.
+    The time and VM-step parts of `budget` (default: the configured one) apply to every step on its own
+    (the execute, then each fetchmany), so no single chunk can take longer than the statement timeout
+    however long the whole export runs; raises BudgetExceeded like run_sql_safe. The row and byte caps
+    are not applied: exports are meant to be big, and only one chunk is ever held in memory.
+    """
+    with span("validate"):
+        checked = _validate_sql(sql)
+        budget = budget or default_budget()
+
+    guard = _ProgressGuard(budget)
+    with get_engine().connect() as conn:
+        raw = conn.connection.driver_connection
+        if guard.deadline is not None or guard.max_steps is not None:
+            raw.set_progress_handler(guard, _PROGRESS_OPS)
+        try:
+            # stream_results keeps SQLAlchemy from buffering the whole result; sqlite steps the cursor lazily
+            result = conn.execution_options(stream_results=True).execute(text(checked.optimized or sql), params or {})
+            yield list(result.keys())
+            while True:
+                guard.restart()
+                chunk = result.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                yield [tuple(r) for r in chunk]
+        except Exception:
+            if guard.tripped:
+                QUERY_ERRORS.inc(kind=guard.tripped)
+                raise guard.error(budget) from None
+            QUERY_ERRORS.inc(kind="sqlite")
+            raise
+        finally:
+            raw.set_progress_handler(None, 0)
 
 
 # Overall flow of the script:
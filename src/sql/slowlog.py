@@ -0,0 +1,54 @@
+# Sampled slow-query log. The API calls should_log() with the request's elapsed time and, when it says
+# yes, hands record() to the SQLite executor, so the EXPLAIN QUERY PLAN and the write never delay the
+# response. One JSON object per entry:
+#   {"ts", "question", "sql", "params", "total_ms", "stages": {"generate": ms, ...}, "plan": [...]}
+
+import json
+import logging
+import random
+import time
+from threading import Lock
+
+from sqlalchemy import text
+
+from src.core.config import get_settings
+from src.core.telemetry import SLOW_QUERIES
+from src.db.engine import get_engine
+from src.sql.runner import _validate_sql
+
+log = logging.getLogger("slow_query")
+_WRITE_LOCK = Lock()
+
+
+def should_log(total_ms: float) -> bool:
+    s = get_settings()
+    if s.slow_query_ms <= 0 or total_ms < s.slow_query_ms:
+        return False
+    SLOW_QUERIES.inc()
+    return random.random() < s.slow_query_sample
+
+
+def explain(sql: str, params: dict | None = None) -> list[str]:
+    sql = _validate_sql(sql).optimized or sql   # the plan of what the runner actually executed
+    with get_engine().connect() as conn:
+        return [r[3] for r in conn.execute(text(f"EXPLAIN QUERY PLAN {sql.rstrip().rstrip(';')}"), params or {})]
+
+
+def record(question: str | None, sql: str | None, params: dict | None, stages: dict, total_ms: float) -> None:
+    entry = {"ts": round(time.time(), 3), "question": question, "sql": sql, "params": params,
+             "total_ms": round(total_ms, 2), "stages": {k: round(v, 2) for k, v in stages.items()}}
+    if sql:
+        try:
+            entry["plan"] = explain(sql, params)
+        except Exception as e:   # the statement itself may be what failed
+            entry["plan_error"] = str(e)
+    line = json.dumps(entry, default=str)
+    path = get_settings().slow_query_log_path
+    if not path:
+        log.warning(line)
+        return
+    try:
+        with _WRITE_LOCK, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError:
+        log.warning(line)